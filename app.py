@@ -8,6 +8,28 @@ import time
 import hashlib
 import datetime
 import json
+import re
+import contextlib
+import html
+import uuid
+
+from utils.bulk import (MAX_BULK_URLS, analyze_all, fit_in_budget, group_by_platform, parse_url_list,
+                        read_uploaded_text, write_zip)
+from utils.download_cache import DownloadCache, cache_key
+from utils.downloader import fetch_segmented, fetch_to_file, is_direct_media_url, open_stream, resume_state_path
+from utils.file_server import FileServer, read_file
+from utils.format_converter import get_transcoder, needs_transcode
+from utils.history_tracker import HistoryRecord, HistoryStore
+from utils.image_processor import get_image_processor, get_thumbnail_cache, needs_image_conversion
+from utils.integrity import atomic_write, hash_bytes, hash_file, size_matches, verifier
+from utils.job_queue import JobQueue, SharedJobQueue, TrackedJob
+from utils.manifest_downloader import fetch_manifest, is_manifest_url
+from utils.metadata_prober import get_prober
+from utils.metrics import get_metrics
+from utils.platform_detector import detect_platform, sample_title
+from utils.rate_limiter import DownloadScheduler
+from utils.shared_state import DEDUP_WAIT, LeaseKeeper, open_backend, replica_id
+from utils.storage_manager import INDEX_NAME, StorageManager
 
 # ======================
 # APP CONFIGURATION
@@ -21,121 +43,609 @@ st.set_page_config(
     }
 )
 
+# ======================
+# SHARED RESOURCES
+# ======================
+# Create necessary directories before any download can need them
+os.makedirs("downloads", exist_ok=True)
+
+# Hot-path timers and counters; no-ops unless MEDIA_DOWNLOADER_METRICS=1
+metrics = get_metrics()
+rerun_started = time.perf_counter()
+
+@st.cache_resource
+def get_history_store():
+    """SQLite store for history, playlists and reviews (survives restarts)"""
+    # Replicas share this file over a volume, where WAL's shared-memory index does not work
+    journal_mode = "DELETE" if os.environ.get("MEDIA_DOWNLOADER_SHARED") else "WAL"
+    return HistoryStore(path=os.environ.get("MEDIA_DOWNLOADER_DB", "data/media_downloader.db"),
+                        journal_mode=journal_mode)
+
+@st.cache_resource
+def get_shared_backend():
+    """State shared with the other replicas of this deployment; None when running alone"""
+    # e.g. sqlite:////mnt/shared/coordination.db, on the volume that also holds downloads/
+    return open_backend(os.environ.get("MEDIA_DOWNLOADER_SHARED", ""))
+
+@st.cache_resource
+def get_lease_keeper():
+    """Cross-replica locks this process holds (None for a single replica)"""
+    backend = get_shared_backend()
+    return LeaseKeeper(backend) if backend is not None else None
+
+@st.cache_resource
+def get_job_queue():
+    """One download worker pool shared by every session of this process"""
+    local = JobQueue(max_workers=8, per_host_limit=2)
+    backend = get_shared_backend()
+    if backend is None:
+        return local
+    # Jobs go to the shared backend; any replica with a free worker claims them
+    return SharedJobQueue(backend, [download_from_working_sources], local=local, owner=get_lease_keeper().owner,
+                          context=download_resources())
+
+@st.cache_resource
+def get_storage_manager():
+    """Quota, TTL and orphan cleanup for downloads/, swept on a background thread"""
+    shared = get_shared_backend() is not None
+    manager = StorageManager(
+        root="downloads",
+        max_bytes=int(float(os.environ.get("MEDIA_DOWNLOADER_QUOTA_GB", "5")) * 1024 ** 3),
+        default_ttl=float(os.environ.get("MEDIA_DOWNLOADER_FILE_TTL_DAYS", "7")) * 24 * 3600,
+        referenced=get_history_store().referenced_files,
+        # Replicas on one volume each manage the files they wrote
+        index_name=f"{INDEX_NAME}.{replica_id()}" if shared else INDEX_NAME,
+        adopt_existing=not shared,
+    )
+    manager.start()
+    return manager
+
+@st.cache_resource
+def get_file_server():
+    """Shared lazy loader for finished files, bounded by an LRU byte budget"""
+    # Every served file counts as a use, so it stays clear of TTL and LRU eviction
+    return FileServer(byte_budget=256 * 1024 * 1024, on_read=get_storage_manager().touch)
+
+@st.cache_resource
+def get_download_scheduler():
+    """Per-platform request limits and per-session bandwidth shares for all sessions"""
+    bandwidth_mbps = float(os.environ.get("MEDIA_DOWNLOADER_BANDWIDTH_MBPS", "0"))
+    return DownloadScheduler(bandwidth=bandwidth_mbps * 1024 * 1024 / 8 if bandwidth_mbps else None)
+
+@st.cache_resource
+def get_download_cache():
+    """Content-addressed store of finished downloads shared by all sessions"""
+    backend = get_shared_backend()
+    if backend is None:
+        return DownloadCache(root="downloads/.cache", max_bytes=2 * 1024 * 1024 * 1024)
+    # One store per replica; keys a peer stored are adopted from the shared file index
+    return DownloadCache(root=os.path.join("downloads/.cache", replica_id()), max_bytes=2 * 1024 * 1024 * 1024,
+                         shared=backend, owner=get_lease_keeper().owner)
+
+FORMAT_MIME_TYPES = {
+    "MP4": "video/mp4",
+    "MP3": "audio/mpeg",
+    "JPG": "image/jpeg",
+    "PNG": "image/png",
+}
+
+# Lifetimes for files no history record points at
+PARTIAL_TTL = 24 * 3600
+BULK_ZIP_TTL = 3600
+# st.download_button holds what it serves in memory, so archives are capped
+BULK_ZIP_LIMIT_MB = 256
+
 # ======================
 # SESSION STATE
 # ======================
-if 'download_history' not in st.session_state:
-    st.session_state.download_history = []
+if 'session_id' not in st.session_state:
+    # The ID lives in the page URL so a reload or restart finds the same history
+    session_id = st.query_params.get("sid", "")
+    if not re.fullmatch(r"[0-9a-f]{32}", session_id):
+        session_id = uuid.uuid4().hex
+        st.query_params["sid"] = session_id
+    st.session_state.session_id = session_id
+    get_history_store().create_playlist(session_id, "Favorites")
 if 'private_videos' not in st.session_state:
     st.session_state.private_videos = {}
-if 'playlists' not in st.session_state:
-    st.session_state.playlists = {"Favorites": []}
 if 'current_file' not in st.session_state:
     st.session_state.current_file = None
-if 'reviews' not in st.session_state:
-    st.session_state.reviews = []
+if 'active_jobs' not in st.session_state:
+    st.session_state.active_jobs = []
+if 'bulk_jobs' not in st.session_state:
+    st.session_state.bulk_jobs = []
+if 'bulk_ignored' not in st.session_state:
+    st.session_state.bulk_ignored = 0
 
 # ======================
 # CORE FUNCTIONS - SIMULATED DOWNLOAD
 # ======================
-def detect_platform(url):
-    """Detect platform and provide realistic information"""
-    parsed_url = urlparse(url)
-    domain = parsed_url.netloc.lower()
-    
-    platforms = {
-        "vimeo": {"name": "Vimeo", "works": True, "type": "video"},
-        "dailymotion": {"name": "Dailymotion", "works": True, "type": "video"},
-        "facebook": {"name": "Facebook", "works": True, "type": "video"},
-        "instagram": {"name": "Instagram", "works": True, "type": "video"},
-        "tiktok": {"name": "TikTok", "works": True, "type": "video"},
-        "twitter": {"name": "Twitter", "works": True, "type": "video"},
-        "x.com": {"name": "Twitter", "works": True, "type": "video"},
-        "imgur": {"name": "Imgur", "works": True, "type": "image"},
-        "flickr": {"name": "Flickr", "works": True, "type": "image"},
-        "unsplash": {"name": "Unsplash", "works": True, "type": "image"},
-        "pixabay": {"name": "Pixabay", "works": True, "type": "image"},
-        "pexels": {"name": "Pexels", "works": True, "type": "image"},
-    }
-    
-    for key, info in platforms.items():
-        if key in domain:
-            return info
-    
-    # YouTube detection (with limitations)
-    if "youtube" in domain or "youtu.be" in domain:
-        return {"name": "YouTube", "works": False, "type": "video", "note": "Limited due to restrictions"}
-    
-    return {"name": "Unknown", "works": False, "type": "unknown"}
+PROBE_TIMEOUT = 10  # seconds an analysis may take before we give up
 
 def get_video_info(url):
     """Get basic video information without downloading"""
     try:
-        # Simulate getting video info
-        platform_info = detect_platform(url)
-        
-        # Generate realistic mock data
-        mock_titles = {
-            "vimeo": "Creative Video Presentation",
-            "facebook": "Social Media Video Clip", 
-            "instagram": "Instagram Reel Content",
-            "tiktok": "TikTok Short Video",
-            "twitter": "Twitter Video Post",
-            "dailymotion": "Dailymotion Video Stream"
-        }
-        
-        title = mock_titles.get(platform_info["name"].lower(), f"{platform_info['name']} Video")
-        
-        return {
-            'title': title,
-            'duration': 120,  # 2 minutes
-            'thumbnail': None,
-            'platform': platform_info["name"],
-            'works': platform_info["works"]
-        }
+        with metrics.timer("video_info"):
+            platform_info = detect_platform(url)
+            
+            # oEmbed/OpenGraph/HEAD, cached across reruns and sessions; identical
+            # concurrent probes share one request
+            meta = get_prober().probe(url, timeout=PROBE_TIMEOUT)
+            
+            return {
+                'title': meta['title'] or sample_title(platform_info),
+                'duration': meta['duration'],
+                'thumbnail': meta['thumbnail'],
+                'content_type': meta['content_type'],
+                'content_length': meta['content_length'],
+                'platform': platform_info["name"],
+                'works': platform_info["works"]
+            }
     except Exception as e:
+        metrics.inc("errors_total", stage="video_info")
         return None
 
-def simulate_download(url, format_type, platform_info):
+def new_download_target(platform_info, format_type):
+    """Unique title and output filename for a new file in downloads/"""
+    # Generate realistic filename
+    base_name = platform_info["name"].lower().replace(" ", "_")
+    # Several jobs can finish within the same second, keep names unique
+    title = f"{base_name}_content_{int(time.time())}_{uuid.uuid4().hex[:6]}"
+    
+    if format_type == "MP3":
+        filename = f"downloads/{title}.mp3"
+        content_type = "audio/mpeg"
+        file_size = 3.2  # MB
+    elif format_type in ("JPG", "PNG"):
+        filename = f"downloads/{title}.{format_type.lower()}"
+        content_type = "image/png" if format_type == "PNG" else "image/jpeg"
+        file_size = 2.4  # MB
+    else:
+        filename = f"downloads/{title}.mp4"
+        content_type = "video/mp4"
+        file_size = 15.7  # MB
+    
+    return title, filename, content_type, file_size
+
+def simulate_download(url, format_type, platform_info, progress=None, segmented=False, quality="High",
+                      throttle=None, storage=None):
     """Simulate download process with realistic behavior"""
     try:
-        # Generate realistic filename
-        base_name = platform_info["name"].lower().replace(" ", "_")
-        title = f"{base_name}_content_{int(time.time())}"
+        title, filename, content_type, file_size = new_download_target(platform_info, format_type)
+        platform = platform_info["name"]
+        # Scratch files: partials are per request (resumable), conversion inputs per job
+        work_dir = os.path.join("downloads", ".partial")
+        request_key = cache_key(url, format_type, quality)[:24]
+        job_key = f"{request_key}_{uuid.uuid4().hex[:8]}"
         
-        if format_type == "MP3":
-            filename = f"downloads/{title}.mp3"
-            content_type = "audio/mpeg"
-            file_size = 3.2  # MB
+        if is_manifest_url(url):
+            if format_type not in ("MP4", "MP3"):
+                raise Exception("HLS/DASH streams can only be saved as MP4 or MP3")
+            # The variant is already picked to fit the quality preset; only MP3 needs a conversion.
+            # Track files are named after the target, so each job gets its own .video/.audio
+            convert = format_type == "MP3"
+            target = os.path.join(work_dir, f"{job_key}.mp4") if convert else filename
+            with metrics.timer("fetch", platform=platform):
+                result = fetch_manifest(url, target, quality=quality, progress=progress, throttle=throttle,
+                                        work_dir=work_dir)
+            metrics.inc("bytes_downloaded_total", result['bytes'], platform=platform)
+            
+            if convert:
+                try:
+                    with metrics.timer("convert", platform=platform, format=format_type):
+                        get_transcoder().convert(target, filename, format_type, quality, source_ext=".mp4")
+                finally:
+                    os.remove(target)
+            else:
+                content_type = result['content_type']
+            # ffmpeg wrote the final file, so it is hashed once here
+            digests = hash_file(filename).result()
+            file_size = round(os.path.getsize(filename) / (1024 * 1024), 2)
+        elif is_direct_media_url(url):
+            source_ext = os.path.splitext(urlparse(url).path)[1].lower()
+            is_image = format_type in ("JPG", "PNG")
+            if is_image:
+                convert = needs_image_conversion(source_ext, format_type, quality)
+            else:
+                convert = needs_transcode(source_ext, format_type, quality)
+            result = None
+            if convert and not is_image and not segmented:
+                # The response goes straight into ffmpeg's stdin; no copy of the source is written.
+                # None means an MP4 indexed at the end, which ffmpeg can only read by seeking
+                with metrics.timer("convert", platform=platform, format=format_type):
+                    result = get_transcoder().convert_stream(
+                        lambda: open_stream(url, progress=progress, throttle=throttle),
+                        filename, format_type, quality, source_ext
+                    )
+            
+            if result is None:
+                # Pillow, segmented fetches and MP4s indexed at the end need the source as a file
+                target = os.path.join(work_dir, f"{job_key}{source_ext}") if convert else filename
+                
+                # Keyed by the request so a retry resumes it; same-request fetches are serialized upstream
+                partial = os.path.join(work_dir, f"{request_key}.part")
+                try:
+                    with metrics.timer("fetch", platform=platform):
+                        if segmented:
+                            # Parallel Range requests straight into a preallocated file
+                            result = fetch_segmented(url, target, progress=progress, throttle=throttle)
+                        else:
+                            # Streamed in chunks, resumable from a per-request partial file
+                            result = fetch_to_file(url, target, progress=progress, partial=partial,
+                                                   throttle=throttle)
+                except Exception:
+                    if storage is not None:
+                        # Kept so a retry can resume; expires if nobody comes back for it
+                        for path in (partial, resume_state_path(partial)):
+                            storage.track(path, ttl=PARTIAL_TTL, history=False)
+                    raise
+                if storage is not None:
+                    for path in (partial, resume_state_path(partial)):
+                        storage.forget(path)
+                
+                if convert:
+                    try:
+                        with metrics.timer("convert", platform=platform, format=format_type):
+                            if is_image:
+                                get_image_processor().convert(target, filename, format_type, quality)
+                            else:
+                                get_transcoder().convert(target, filename, format_type, quality,
+                                                         source_ext=source_ext)
+                    finally:
+                        os.remove(target)
+            metrics.inc("bytes_downloaded_total", result['bytes'], platform=platform)
+            
+            if convert:
+                digests = hash_file(filename).result()
+            else:
+                content_type = result['content_type'] or content_type
+                # Hashed while it streamed in; the file is not read again
+                digests = {key: result[key] for key in ("digest", "fast_digest", "size_bytes")}
+            file_size = round(os.path.getsize(filename) / (1024 * 1024), 2)
         else:
-            filename = f"downloads/{title}.mp4"
-            content_type = "video/mp4"
-            file_size = 15.7  # MB
-        
-        # Create mock file content
-        mock_content = b"Mock file content - " + title.encode() + b" " * 1024
-        
-        # Save mock file
-        with open(filename, "wb") as f:
-            f.write(mock_content)
+            # Create mock file content
+            mock_content = b"Mock file content - " + title.encode() + b" " * 1024
+            
+            # Save mock file
+            with metrics.timer("file_write", platform=platform), atomic_write(filename) as f:
+                f.write(mock_content)
+            digests = hash_bytes(mock_content)
+            metrics.inc("bytes_downloaded_total", len(mock_content), platform=platform)
+            if progress is not None:
+                progress(len(mock_content), len(mock_content))
         
         return filename, title, {
             'file_size': file_size,
             'content_type': content_type,
-            'platform': platform_info["name"]
+            'platform': platform_info["name"],
+            **digests
         }
         
     except Exception as e:
         raise Exception(f"Download simulation failed: {str(e)}")
 
-def download_from_working_sources(url, format_type):
+def download_from_working_sources(url, format_type, progress=None, segmented=False,
+                                  quality="High", cache=None, for_session=None, scheduler=None,
+                                  storage=None, leases=None):
     """Attempt download from platforms that might work"""
     platform_info = detect_platform(url)
+    platform = platform_info["name"]
     
     if not platform_info["works"]:
+        metrics.inc("errors_total", stage="download", platform=platform)
         raise Exception(f"{platform_info['name']} downloads are currently limited. Try Vimeo, Facebook, or other supported platforms.")
     
-    return simulate_download(url, format_type, platform_info)
+    key = cache_key(url, format_type, quality) if cache is not None else None
+    with contextlib.ExitStack() as held:
+        if key is not None:
+            entry = cache.lookup(key)
+            metrics.inc("cache_misses_total" if entry is None else "cache_hits_total", platform=platform)
+            if entry is None:
+                # One fetch per request at a time: other sessions (and, with shared state, other
+                # replicas) asking for it wait here and then reuse its file
+                if leases is None:
+                    held.enter_context(cache.fetching(key))
+                elif not held.enter_context(leases.hold(f"download:{key}", wait=DEDUP_WAIT)):
+                    raise Exception("Another replica is still downloading this URL, try again shortly")
+                entry = cache.adopt(key)
+                if entry is not None:
+                    metrics.inc("dedup_total", platform=platform)
+            if entry is not None:
+                # Cache hit: hard link the stored object, nothing is fetched
+                _, filename, _, _ = new_download_target(platform_info, format_type)
+                cache.materialize(entry, filename)
+                if storage is not None:
+                    storage.track(filename)
+                if progress is not None:
+                    progress(entry['size'], entry['size'])
+                file_info = dict(entry['meta'], cached=True)
+                if format_type in ("JPG", "PNG"):
+                    # Made again if the storage manager removed it since
+                    attach_thumbnail(filename, entry['object'], file_info, storage)
+                return filename, file_info.pop('title', os.path.basename(filename)), file_info
+        
+        throttle = scheduler.throttle(platform, for_session) if scheduler is not None else None
+        try:
+            # Requests wait for the platform's token bucket; bytes count against this session's share
+            with metrics.timer("download", platform=platform), throttle or contextlib.nullcontext():
+                filename, title, file_info = simulate_download(
+                    url, format_type, platform_info, progress=progress, segmented=segmented,
+                    quality=quality, throttle=throttle, storage=storage
+                )
+        except Exception:
+            metrics.inc("errors_total", stage="download", platform=platform)
+            raise
+        finally:
+            if throttle is not None and throttle.throttled:
+                metrics.inc("throttled_total", throttle.throttled, platform=platform)
+        if key is not None:
+            cache.put(key, filename, meta=dict(file_info, title=title), digest=file_info['digest'])
+        if storage is not None:
+            storage.track(filename)
+        if format_type in ("JPG", "PNG"):
+            attach_thumbnail(filename, file_info['digest'], file_info, storage)
+            if key is not None:
+                cache.update_meta(key, thumbnail=file_info['thumbnail'])
+        return filename, title, file_info
+
+def attach_thumbnail(filename, digest, file_info, storage=None):
+    """Small preview for the result card and history rows, cached by content hash"""
+    file_info['thumbnail'] = get_thumbnail_cache().get_or_create(filename, digest)
+    if file_info['thumbnail'] is not None and storage is not None:
+        # Expires and counts against the quota with the rest of downloads/
+        storage.track(file_info['thumbnail'])
+
+def download_resources():
+    """This process's cache, scheduler, storage and leases, as every download uses them"""
+    return {
+        'cache': get_download_cache(),
+        'scheduler': get_download_scheduler(),
+        'storage': get_storage_manager(),
+        'leases': get_lease_keeper(),
+    }
+
+def submit_download(url, format_type, platform_info, segmented=False, quality="High", track="active_jobs"):
+    """Queue a download on the shared worker pool and track it for this session"""
+    # Shared jobs carry plain values only; the replica that runs one adds its own resources
+    resources = {} if get_shared_backend() is not None else download_resources()
+    job = get_job_queue().submit(
+        st.session_state.session_id,
+        urlparse(url).netloc.lower(),
+        download_from_working_sources,
+        url,
+        format_type,
+        label=f"{platform_info['name']} • {format_type}",
+        segmented=segmented,
+        quality=quality,
+        for_session=st.session_state.session_id,
+        **resources
+    )
+    st.session_state[track].append(
+        TrackedJob(job.id, url, platform_info["name"], format=format_type, type=platform_info["type"])
+    )
+    return job
+
+def download_again(item):
+    """Fetch a history entry again after its file went missing or failed the size check"""
+    submit_download(item.url, item.format, detect_platform(item.url))
+
+def saved_file_loader(record):
+    """Lazy loader that checks the bytes against the record's digest when they are first read"""
+    return get_file_server().loader(
+        record.file,
+        record.digest,
+        verifier(record.size_bytes, record.digest, record.fast_digest)
+    )
+
+def record_finished_job(entry, result):
+    """Turn a finished download job into a history entry (once)"""
+    filename, title, file_info = result
+    record = HistoryRecord(
+        title=title,
+        platform=entry.platform,
+        url=entry.url,
+        time=datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        file=filename,
+        format=entry.format,
+        type=entry.type,
+        file_size=file_info['file_size'],
+        thumbnail=file_info.get('thumbnail'),
+        digest=file_info.get('digest'),
+        fast_digest=file_info.get('fast_digest'),
+        size_bytes=file_info.get('size_bytes')
+    )
+    with metrics.timer("history_write"):
+        get_history_store().add_history(st.session_state.session_id, record)
+    # The session keeps the same record the store wrote, not a copy of the file info
+    entry.record = record
+    entry.content_type = file_info['content_type']
+    entry.cached = bool(file_info.get('cached'))
+
+def render_download_jobs():
+    """Poll the shared queue and draw progress for this session's downloads"""
+    queue = get_job_queue()
+    still_running = False
+    
+    for entry in st.session_state.active_jobs:
+        job = queue.get(entry.job_id)
+        if job is None:
+            continue
+        state = job.snapshot()
+        
+        if job.active:
+            still_running = True
+            done_mb = state['done'] / (1024 * 1024)
+            text = f"⏳ {state['label']} — {state['status']}"
+            if state['total']:
+                text += f" ({done_mb:.1f} MB)"
+            st.progress(job.progress, text=text)
+        elif job.finished_ok:
+            if not entry.recorded:
+                record_finished_job(entry, job.result)
+            record = entry.record
+            if entry.cached:
+                st.success(f"⚡ Served {entry.type} from cache!")
+            else:
+                st.success(f"✅ Successfully downloaded {entry.type}!")
+            if record.thumbnail and os.path.exists(record.thumbnail):
+                st.image(record.thumbnail, width=320)
+            if os.path.exists(record.file):
+                # File contents are only read when the user clicks
+                st.download_button(
+                    label=f"💾 Save {entry.format} File ({record.file_size} MB)",
+                    data=saved_file_loader(record),
+                    file_name=os.path.basename(record.file),
+                    mime=entry.content_type,
+                    use_container_width=True,
+                    on_click="ignore",
+                    key=f"job_save_{entry.job_id}"
+                )
+        else:
+            st.error(f"❌ {state['error']}")
+            st.info("""
+            **Tips for successful downloads:**
+            - Use **Vimeo, Facebook, or Instagram** URLs
+            - Ensure the media is publicly accessible
+            - Try different quality settings
+            - For images, try **Imgur or Unsplash**
+            """)
+    
+    # Their files are already on disk, so the records must not wait in the buffer for a crash
+    get_history_store().flush()
+    return still_running
+
+def clear_finished_jobs(track="active_jobs"):
+    """Forget finished jobs, recording any result that was not shown yet"""
+    queue = get_job_queue()
+    keep = []
+    for entry in st.session_state[track]:
+        job = queue.get(entry.job_id) if entry.job_id is not None else None
+        if job is not None and job.active:
+            keep.append(entry)
+        elif job is not None:
+            if job.finished_ok and not entry.recorded:
+                record_finished_job(entry, job.result)
+            queue.forget(job.id)
+    get_history_store().flush()
+    st.session_state[track] = keep
+
+def jobs_running(track):
+    """True while any tracked job of this session is queued or running"""
+    queue = get_job_queue()
+    for entry in st.session_state[track]:
+        job = queue.get(entry.job_id) if entry.job_id is not None else None
+        if job is not None and job.active:
+            return True
+    return False
+
+def start_bulk_batch(urls, video_format, image_format, quality):
+    """Analyze the supported URLs concurrently and queue the downloadable ones"""
+    # Jobs of the previous batch that are still running stay tracked, so their results reach history
+    clear_finished_jobs("bulk_jobs")
+    st.session_state.bulk_batch = uuid.uuid4().hex[:8]
+    groups = group_by_platform(urls, detect_platform)
+    st.session_state.bulk_groups = {name: len(group) for name, group in groups.items()}
+    
+    # Only supported platforms are probed: a pasted list must not make the
+    # server send requests to arbitrary (e.g. intranet) hosts
+    supported = [url for url in urls if detect_platform(url)["works"]]
+    infos = dict(analyze_all(supported, get_video_info))
+    
+    for url in urls:
+        platform_info = detect_platform(url)
+        if not platform_info["works"]:
+            skipped = "Unsupported site" if platform_info["name"] == "Unknown" else "Platform limited"
+        elif infos[url] is None:
+            skipped = "Analysis failed"
+        else:
+            format_type = video_format if platform_info["type"] == "video" else image_format
+            submit_download(url, format_type, platform_info, quality=quality, track="bulk_jobs")
+            continue
+        st.session_state.bulk_jobs.append(TrackedJob(None, url, platform_info["name"], skipped=skipped))
+
+def render_bulk_jobs():
+    """Combined progress bar and per-URL result table for the bulk batch"""
+    queue = get_job_queue()
+    rows = []
+    progress_sum = 0.0
+    finished = 0
+    still_running = False
+    
+    for entry in st.session_state.bulk_jobs:
+        job = queue.get(entry.job_id) if entry.job_id is not None else None
+        row = {'URL': entry.url, 'Platform': entry.platform, 'Status': "", 'Size (MB)': None}
+        if job is None:
+            row['Status'] = f"⏭️ {entry.skipped or 'Expired'}"
+            progress_sum += 1
+        elif job.active:
+            still_running = True
+            row['Status'] = "⏳ Queued" if job.status == "queued" else "⬇️ Downloading"
+            progress_sum += job.progress
+        elif job.finished_ok:
+            if not entry.recorded:
+                record_finished_job(entry, job.result)
+            row['Status'] = "✅ Done"
+            row['Size (MB)'] = entry.record.file_size
+            progress_sum += 1
+            finished += 1
+        else:
+            row['Status'] = f"❌ {job.error}"
+            progress_sum += 1
+        rows.append(row)
+    # One transaction for every result of this poll
+    get_history_store().flush()
+    
+    total = len(rows)
+    st.progress(progress_sum / total if total else 1.0, text=f"{finished}/{total} downloaded")
+    st.dataframe(rows, use_container_width=True, hide_index=True)
+    
+    if not still_running and finished:
+        paths = [entry.record.file for entry in st.session_state.bulk_jobs if entry.recorded]
+        paths, left_out = fit_in_budget(paths, BULK_ZIP_LIMIT_MB * 1024 * 1024)
+        zip_path = f"downloads/.bulk/batch_{st.session_state.bulk_batch}.zip"
+        storage = get_storage_manager()
+        
+        def build_zip():
+            # Built on disk file by file, and only when the user clicks. Read past the
+            # file server's cache: a one-off archive must not evict the cached downloads
+            if not os.path.exists(zip_path):
+                write_zip(paths, zip_path)
+                storage.track(zip_path, ttl=BULK_ZIP_TTL, history=False)
+            return read_file(zip_path)
+        
+        if paths:
+            st.download_button(
+                label=f"🗜️ Download all as ZIP ({len(paths)} files)",
+                data=build_zip,
+                file_name=f"media_batch_{st.session_state.bulk_batch}.zip",
+                mime="application/zip",
+                on_click="ignore",
+                use_container_width=True,
+                help=f"Archives hold up to {BULK_ZIP_LIMIT_MB} MB",
+                key=f"bulk_zip_{st.session_state.bulk_batch}"
+            )
+        if left_out:
+            st.caption(f"Left out of the ZIP ({BULK_ZIP_LIMIT_MB} MB limit): {len(left_out)} of {finished} files. "
+                       "Download them one by one from the Download History tab")
+    
+    return still_running
+
+HISTORY_PAGE_SIZE = 20
+PLAYLIST_SEARCH_LIMIT = 20
+
+def history_filter_args(platform, format_type, dates):
+    """Turn the history filter widgets into HistoryStore.list_history kwargs"""
+    filters = {}
+    if platform != "All":
+        filters['platform'] = platform
+    if format_type != "All":
+        filters['format'] = format_type
+    if dates:
+        start = dates[0]
+        end = dates[1] if len(dates) > 1 else dates[0]
+        filters['since'] = datetime.datetime.combine(start, datetime.time.min).timestamp()
+        filters['until'] = datetime.datetime.combine(end + datetime.timedelta(days=1), datetime.time.min).timestamp()
+    return filters
 
 # ======================
 # DEMO CONTENT SECTION
@@ -221,23 +731,35 @@ if url:
         else:
             st.info("Try Vimeo, Facebook, Instagram, TikTok, or Twitter for reliable downloads.")
     else:
-        with st.spinner(f"🔍 Analyzing {platform_info['name']} content..."):
-            info = get_video_info(url)
+        # Reruns that keep the same URL reuse the last analysis instead of probing again;
+        # a failed one is not kept, so the next rerun tries again
+        if st.session_state.get('analyzed_url') != url:
+            with st.spinner(f"🔍 Analyzing {platform_info['name']} content..."):
+                st.session_state.analyzed_info = get_video_info(url)
+            st.session_state.analyzed_url = url if st.session_state.analyzed_info is not None else None
+        info = st.session_state.analyzed_info
             
         if info is None:
             st.error("❌ Failed to analyze media content.")
         else:
-            # Display media info card
+            # Display media info card (titles come from remote pages, so escape them)
+            details = ""
+            if info['duration']:
+                details += f"<strong>Duration:</strong> {info['duration'] // 60}:{info['duration'] % 60:02d} • "
+            if info['content_length']:
+                details += f"<strong>Size:</strong> {info['content_length'] / (1024 * 1024):.1f} MB • "
             st.markdown(f"""
             <div style="background-color:#f8f9fa; padding:15px; border-radius:10px; border-left:4px solid #28a745;">
-                <h4 style="margin:0;">{info['title']}</h4>
+                <h4 style="margin:0;">{html.escape(info['title'])}</h4>
                 <p style="margin:5px 0; color:#666;">
                     <strong>Platform:</strong> {info['platform']} • 
                     <strong>Type:</strong> {platform_info['type'].title()} • 
-                    <strong>Status:</strong> ✅ Ready to download
+                    {details}<strong>Status:</strong> ✅ Ready to download
                 </p>
             </div>
             """, unsafe_allow_html=True)
+            if info['thumbnail']:
+                st.image(info['thumbnail'], width=320)
             
             # Format selection
             col1, col2 = st.columns([2, 1])
@@ -264,56 +786,77 @@ if url:
                     index=0
                 )
             
+            segmented = st.checkbox(
+                "⚡ Segmented download",
+                value=False,
+                help="Fetch large files over several parallel connections"
+            )
+            
             # Download button
             if st.button("⬇️ Download Media", type="primary", use_container_width=True):
-                with st.spinner("⏳ Processing download..."):
-                    progress_bar = st.progress(0)
-                    
-                    try:
-                        # Simulate download process
-                        for i in range(100):
-                            progress_bar.progress(i + 1)
-                            time.sleep(0.02)
-                        
-                        filename, title, file_info = download_from_working_sources(url, download_format)
-                        
-                        # Save to history
-                        download_item = {
-                            'title': title,
-                            'platform': platform_info["name"],
-                            'url': url,
-                            'time': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                            'file': filename,
-                            'format': download_format,
-                            'type': platform_info["type"],
-                            'file_size': file_info['file_size']
-                        }
-                        
-                        st.session_state.download_history.append(download_item)
-                        
-                        # Success message
-                        st.success(f"✅ Successfully downloaded {platform_info['type']}!")
-                        
-                        # Download button
-                        if os.path.exists(filename):
-                            with open(filename, "rb") as file:
-                                st.download_button(
-                                    label=f"💾 Save {download_format} File ({file_info['file_size']} MB)",
-                                    data=file,
-                                    file_name=os.path.basename(filename),
-                                    mime=file_info['content_type'],
-                                    use_container_width=True
-                                )
-                        
-                    except Exception as e:
-                        st.error(f"❌ {str(e)}")
-                        st.info("""
-                        **Tips for successful downloads:**
-                        - Use **Vimeo, Facebook, or Instagram** URLs
-                        - Ensure the media is publicly accessible
-                        - Try different quality settings
-                        - For images, try **Imgur or Unsplash**
-                        """)
+                clear_finished_jobs()
+                submit_download(url, download_format, platform_info, segmented=segmented, quality=quality)
+
+# Downloads run on the shared worker pool; only this fragment polls them
+if st.session_state.active_jobs:
+    polling = jobs_running("active_jobs")
+    
+    @st.fragment(run_every=0.5 if polling else None)
+    def download_jobs_panel():
+        if not render_download_jobs() and polling:
+            # Everything finished: one full rerun refreshes history and stops polling
+            st.rerun()
+    
+    download_jobs_panel()
+
+# ======================
+# BULK DOWNLOAD
+# ======================
+with st.expander("📦 Bulk Download", expanded=bool(st.session_state.bulk_jobs)):
+    bulk_text = st.text_area(
+        "Paste URLs",
+        placeholder="One URL per line (commas and spaces work too)",
+        height=120,
+        key="bulk_text"
+    )
+    bulk_file = st.file_uploader("...or upload a URL list", type=["txt", "csv"], key="bulk_file")
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        bulk_video_format = st.selectbox("Video Format", ["MP4", "MP3"], key="bulk_video_format")
+    with col2:
+        bulk_image_format = st.selectbox("Image Format", ["JPG", "PNG"], key="bulk_image_format")
+    with col3:
+        bulk_quality = st.selectbox("Quality", ["High", "Medium", "Low"], key="bulk_quality")
+    
+    bulk_polling = jobs_running("bulk_jobs")
+    if st.button("🔍 Analyze & Download All", use_container_width=True, disabled=bulk_polling,
+                 help="Wait for the current batch to finish" if bulk_polling else None):
+        # Pasted and uploaded URLs share one limit
+        if bulk_file is not None:
+            bulk_text = f"{bulk_text}\n{read_uploaded_text(bulk_file.name, bulk_file.getvalue())}"
+        bulk_urls, st.session_state.bulk_ignored = parse_url_list(bulk_text)
+        if bulk_urls:
+            with st.spinner(f"🔍 Analyzing {len(bulk_urls)} URLs..."):
+                start_bulk_batch(bulk_urls, bulk_video_format, bulk_image_format, bulk_quality)
+        else:
+            st.warning("No http(s) URLs found")
+    
+    if st.session_state.bulk_ignored:
+        st.warning(f"Only the first {MAX_BULK_URLS} URLs are processed; "
+                   f"{st.session_state.bulk_ignored} more were ignored")
+    
+    if st.session_state.bulk_jobs:
+        st.caption(" • ".join(f"**{name}**: {count}" for name, count in st.session_state.bulk_groups.items()))
+        # Checked again: the button above may just have queued a batch
+        bulk_polling = jobs_running("bulk_jobs")
+        
+        @st.fragment(run_every=0.5 if bulk_polling else None)
+        def bulk_jobs_panel():
+            if not render_bulk_jobs() and bulk_polling:
+                st.rerun()
+        
+        bulk_jobs_panel()
 
 # ======================
 # MEDIA GALLERY - DEMO CONTENT
@@ -352,128 +895,233 @@ with col3:
 # ======================
 # ADDITIONAL FEATURES
 # ======================
-tab1, tab2, tab3 = st.tabs(["📚 Download History", "🎵 Playlists", "⭐ User Reviews"])
+REVIEWS_TTL = 30
 
-with tab1:
-    st.header("Your Downloads")
-    
-    if st.session_state.download_history:
-        for idx, item in enumerate(reversed(st.session_state.download_history)):
-            with st.container():
-                col1, col2, col3 = st.columns([3, 1, 1])
-                
-                col1.markdown(f"""
-                **{item['title']}**
-                - *{item['platform']}* • {item['format']} • {item['file_size']} MB
-                - {item['time']}
-                """)
-                
-                if col2.button("📥 Save", key=f"save_{idx}"):
-                    if os.path.exists(item['file']):
-                        with open(item['file'], "rb") as f:
-                            st.download_button(
-                                label="Download Again",
-                                data=f,
-                                file_name=os.path.basename(item['file']),
-                                mime="video/mp4" if item['format'] != "MP3" else "audio/mpeg",
-                                key=f"download_again_{idx}"
-                            )
-                
-                if col3.button("🗑️", key=f"delete_{idx}"):
-                    try:
-                        if os.path.exists(item['file']):
-                            os.remove(item['file'])
-                        st.session_state.download_history.pop(len(st.session_state.download_history)-1-idx)
-                        st.rerun()
-                    except:
-                        st.error("Error deleting file")
-                
-                st.divider()
-    else:
-        st.info("""
-        🚀 **No downloads yet!** 
+@st.cache_data(ttl=REVIEWS_TTL, show_spinner=False)
+def recent_reviews():
+    """Reviews are shared by every session, so one query serves all their reruns"""
+    return get_history_store().list_reviews(limit=50)
+
+@st.cache_data(ttl=REVIEWS_TTL, show_spinner=False)
+def review_count():
+    return get_history_store().count_reviews()
+
+def rerun_with_notice(message):
+    """Full rerun (so the sidebar statistics refresh) that still shows ``message`` once"""
+    st.session_state.notice = message
+    st.rerun()
+
+def show_notice():
+    notice = st.session_state.pop('notice', None)
+    if notice:
+        st.success(notice)
+
+def older_history_page(cursor):
+    st.session_state.history_cursors.append(cursor)
+
+def newer_history_page():
+    st.session_state.history_cursors.pop()
+
+def remove_playlist_item(item_id):
+    get_history_store().remove_from_playlist(st.session_state.session_id, item_id)
+
+# Each tab is a fragment: paging, filtering or editing inside one reruns only that tab,
+# not the header, gallery, download form and sidebar around it
+@st.fragment
+def history_tab():
+    with metrics.timer("render_history"):
+        st.header("Your Downloads")
+        
+        store = get_history_store()
+        session_id = st.session_state.session_id
+        
+        # Filters run in SQL; only one page of rows is ever fetched and drawn
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            history_platform = st.selectbox("Platform", ["All"] + store.history_platforms(session_id), key="history_platform")
+        with col2:
+            history_format = st.selectbox("Format", ["All", "MP4", "MP3", "JPG", "PNG"], key="history_format")
+        with col3:
+            history_dates = st.date_input("Date Range", value=(), key="history_dates")
+        
+        history_filters = history_filter_args(history_platform, history_format, history_dates)
+        if st.session_state.get('history_filter_sig') != history_filters:
+            st.session_state.history_filter_sig = history_filters
+            st.session_state.history_cursors = []
+        cursors = st.session_state.history_cursors
+        
+        page = store.list_history(
+            session_id,
+            limit=HISTORY_PAGE_SIZE + 1,
+            before=cursors[-1] if cursors else None,
+            **history_filters
+        )
+        has_older = len(page) > HISTORY_PAGE_SIZE
+        page = page[:HISTORY_PAGE_SIZE]
         
-        Try downloading from:
-        - **Vimeo** - Professional videos
-        - **Facebook** - Social media content  
-        - **Instagram** - Reels and posts
-        - **Imgur** - Images and memes
-        - **Unsplash** - High-quality photos
-        """)
+        if page:
+            for item in page:
+                with st.container():
+                    col1, col2, col3 = st.columns([3, 1, 1])
+                    
+                    col1.markdown(f"""
+                    **{item.title}**
+                    - *{item.platform}* • {item.format} • {item.file_size} MB
+                    - {item.time}
+                    """)
+                    if item.thumbnail and os.path.exists(item.thumbnail):
+                        col1.image(item.thumbnail, width=160)
+                    
+                    if size_matches(item.file, item.size_bytes):
+                        # Lazy loader: rendering a row never reads the file
+                        col2.download_button(
+                            label="📥 Save",
+                            data=saved_file_loader(item),
+                            file_name=os.path.basename(item.file),
+                            mime=FORMAT_MIME_TYPES.get(item.format, "application/octet-stream"),
+                            on_click="ignore",
+                            key=f"save_{item.id}"
+                        )
+                    elif col2.button("🔁 Download Again", key=f"again_{item.id}",
+                                     help="The saved file is missing or damaged"):
+                        download_again(item)
+                        st.rerun()
+                    
+                    if col3.button("🗑️", key=f"delete_{item.id}"):
+                        try:
+                            if os.path.exists(item.file):
+                                os.remove(item.file)
+                            get_storage_manager().forget(item.file)
+                            store.delete_history(session_id, item.id)
+                            st.rerun()
+                        except OSError:
+                            st.error("Error deleting file")
+                    
+                    st.divider()
+            
+            col1, col2, col3 = st.columns([1, 2, 1])
+            col1.button("◀ Newer", disabled=not cursors, key="history_newer", on_click=newer_history_page)
+            col2.caption(f"Page {len(cursors) + 1} • {HISTORY_PAGE_SIZE} per page")
+            col3.button("Older ▶", disabled=not has_older, key="history_older",
+                        on_click=older_history_page, args=((page[-1].ts, page[-1].id),))
+        elif history_filters:
+            st.info("No downloads match these filters.")
+        else:
+            st.info("""
+            🚀 **No downloads yet!** 
+            
+            Try downloading from:
+            - **Vimeo** - Professional videos
+            - **Facebook** - Social media content  
+            - **Instagram** - Reels and posts
+            - **Imgur** - Images and memes
+            - **Unsplash** - High-quality photos
+            """)
 
-with tab2:
-    st.header("Media Playlists")
-    
-    # Create playlist
-    col1, col2 = st.columns([2, 1])
-    with col1:
-        new_playlist = st.text_input("Create New Playlist", placeholder="My Favorite Videos")
-    with col2:
-        if st.button("Create") and new_playlist:
-            if new_playlist not in st.session_state.playlists:
-                st.session_state.playlists[new_playlist] = []
-                st.success(f"Created '{new_playlist}'")
-    
-    # Manage playlists
-    if st.session_state.playlists:
-        selected = st.selectbox("Your Playlists", list(st.session_state.playlists.keys()))
+@st.fragment
+def playlists_tab():
+    with metrics.timer("render_playlists"):
+        st.header("Media Playlists")
         
-        if selected:
-            # Add to playlist
-            if st.session_state.download_history:
-                video_options = [f"{vid['title']} ({vid['platform']})" for vid in st.session_state.download_history]
-                selected_video = st.selectbox("Add Media", video_options)
-                
-                if st.button(f"Add to {selected}"):
-                    idx = video_options.index(selected_video)
-                    st.session_state.playlists[selected].append(st.session_state.download_history[idx])
-                    st.success("Media added to playlist!")
+        store = get_history_store()
+        session_id = st.session_state.session_id
+        
+        # Create playlist
+        col1, col2 = st.columns([2, 1])
+        with col1:
+            new_playlist = st.text_input("Create New Playlist", placeholder="My Favorite Videos")
+        with col2:
+            if st.button("Create") and new_playlist:
+                if store.create_playlist(session_id, new_playlist):
+                    rerun_with_notice(f"Created '{new_playlist}'")
+        
+        # Manage playlists
+        playlist_names = store.playlist_names(session_id)
+        if playlist_names:
+            selected = st.selectbox("Your Playlists", playlist_names)
             
-            # Show playlist contents
-            if st.session_state.playlists[selected]:
-                st.subheader(f"Media in {selected}")
-                for idx, item in enumerate(st.session_state.playlists[selected]):
-                    col1, col2 = st.columns([3, 1])
-                    col1.write(f"**{idx+1}. {item['title']}**")
-                    col1.caption(f"{item['platform']} • {item['format']} • {item['time']}")
+            if selected:
+                # Add to playlist: search instead of listing the whole history
+                search = st.text_input("Search Your Downloads", placeholder="Title or platform", key="playlist_search")
+                matches = store.search_history(session_id, search, limit=PLAYLIST_SEARCH_LIMIT)
+                if matches:
+                    labels = {vid.id: f"{vid.title} ({vid.platform} • {vid.time})" for vid in matches}
+                    selected_video = st.selectbox("Add Media", list(labels), format_func=labels.get)
                     
-                    if col2.button("Remove", key=f"remove_{idx}"):
-                        st.session_state.playlists[selected].pop(idx)
-                        st.rerun()
-            else:
-                st.info(f"📭 {selected} is empty. Add some media!")
+                    if st.button(f"Add to {selected}"):
+                        store.add_to_playlist(session_id, selected, selected_video)
+                        st.success("Media added to playlist!")
+                elif search:
+                    st.caption("No downloads match your search.")
+                
+                # Show playlist contents one page at a time
+                item_count = store.count_playlist_items(session_id, selected)
+                if item_count:
+                    st.subheader(f"Media in {selected}")
+                    pages = -(-item_count // HISTORY_PAGE_SIZE)
+                    playlist_page = 1
+                    if pages > 1:
+                        playlist_page = st.number_input("Page", min_value=1, max_value=pages, value=1, key=f"playlist_page_{selected}")
+                    offset = (playlist_page - 1) * HISTORY_PAGE_SIZE
+                    
+                    items = store.playlist_items(session_id, selected, limit=HISTORY_PAGE_SIZE, offset=offset)
+                    for idx, item in enumerate(items, start=offset):
+                        col1, col2 = st.columns([3, 1])
+                        col1.write(f"**{idx+1}. {item.title}**")
+                        col1.caption(f"{item.platform} • {item.format} • {item.time}")
+                        col2.button("Remove", key=f"remove_{item.item_id}",
+                                    on_click=remove_playlist_item, args=(item.item_id,))
+                else:
+                    st.info(f"📭 {selected} is empty. Add some media!")
 
-with tab3:
-    st.header("Share Your Experience")
-    
-    with st.form("review_form"):
-        name = st.text_input("Your Name", placeholder="Optional")
-        rating = st.select_slider("Rating", options=[1, 2, 3, 4, 5], value=5)
-        review = st.text_area("Your Review", placeholder="How was your experience? What platforms worked well for you?", height=100)
+@st.fragment
+def reviews_tab():
+    with metrics.timer("render_reviews"):
+        st.header("Share Your Experience")
         
-        if st.form_submit_button("Submit Review", use_container_width=True):
-            if review.strip():
-                st.session_state.reviews.append({
-                    'name': name or "Anonymous",
-                    'rating': rating,
-                    'review': review,
-                    'date': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                })
-                st.success("🎉 Thanks for your feedback!")
-            else:
-                st.warning("Please write your review before submitting")
-    
-    # Display reviews
-    if st.session_state.reviews:
-        st.subheader("Community Reviews")
-        for rev in reversed(st.session_state.reviews):
-            with st.container():
-                st.markdown(f"**{rev['name']}** {'⭐' * rev['rating']}")
-                st.write(rev['review'])
-                st.caption(rev['date'])
-                st.divider()
-    else:
-        st.info("💬 No reviews yet. Be the first to share your experience!")
+        with st.form("review_form"):
+            name = st.text_input("Your Name", placeholder="Optional")
+            rating = st.select_slider("Rating", options=[1, 2, 3, 4, 5], value=5)
+            review = st.text_area("Your Review", placeholder="How was your experience? What platforms worked well for you?", height=100)
+            
+            if st.form_submit_button("Submit Review", use_container_width=True):
+                if review.strip():
+                    get_history_store().add_review({
+                        'name': name or "Anonymous",
+                        'rating': rating,
+                        'review': review,
+                        'date': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                    })
+                    recent_reviews.clear()
+                    review_count.clear()
+                    rerun_with_notice("🎉 Thanks for your feedback!")
+                else:
+                    st.warning("Please write your review before submitting")
+        
+        # Display reviews
+        reviews = recent_reviews()
+        if reviews:
+            st.subheader("Community Reviews")
+            for rev in reviews:
+                with st.container():
+                    st.markdown(f"**{rev['name']}** {'⭐' * rev['rating']}")
+                    st.write(rev['review'])
+                    st.caption(rev['date'])
+                    st.divider()
+        else:
+            st.info("💬 No reviews yet. Be the first to share your experience!")
+
+show_notice()
+tab1, tab2, tab3 = st.tabs(["📚 Download History", "🎵 Playlists", "⭐ User Reviews"])
+
+with tab1:
+    history_tab()
+
+with tab2:
+    playlists_tab()
+
+with tab3:
+    reviews_tab()
 
 # ======================
 # SIDEBAR
@@ -501,12 +1149,53 @@ with st.sidebar:
     """)
     
     st.header("📊 Statistics")
-    st.metric("Total Downloads", len(st.session_state.download_history))
-    st.metric("Playlists", len(st.session_state.playlists))
-    st.metric("User Reviews", len(st.session_state.reviews))
-
-# Create necessary directories
-os.makedirs("downloads", exist_ok=True)
+    store = get_history_store()
+    st.metric("Total Downloads", store.count_history(st.session_state.session_id))
+    st.metric("Playlists", len(store.playlist_names(st.session_state.session_id)))
+    st.metric("User Reviews", review_count())
+    
+    cache_stats = get_download_cache().stats()
+    col1, col2 = st.columns(2)
+    col1.metric("Cache Hits", cache_stats['hits'])
+    col2.metric("Cache Misses", cache_stats['misses'])
+    
+    if get_shared_backend() is not None:
+        queue_stats = get_job_queue().stats()
+        st.caption(f"Replica **{replica_id()}** • {queue_stats['running_here']} of {queue_stats['running']} "
+                   f"running downloads here • {queue_stats['pending']} queued")
+    
+    storage_stats = get_storage_manager().stats()
+    st.metric("Storage", f"{storage_stats['bytes'] / 1024 ** 3:.2f} / {storage_stats['max_bytes'] / 1024 ** 3:.0f} GB",
+              help=f"{storage_stats['files']} files • evicted: " +
+                   ", ".join(f"{count} {reason}" for reason, count in storage_stats['evicted'].items()))
+    
+    if metrics.enabled:
+        with st.expander("⏱️ Performance"):
+            perf = metrics.snapshot()
+            if perf['histograms']:
+                st.dataframe(
+                    [
+                        {
+                            'Stage': h['name'].removesuffix("_seconds"),
+                            'Labels': ", ".join(f"{k}={v}" for k, v in h['labels'].items()),
+                            'Count': h['count'],
+                            'p50 ms': round(h['p50_ms'], 2),
+                            'p95 ms': round(h['p95_ms'], 2),
+                            'p99 ms': round(h['p99_ms'], 2),
+                        }
+                        for h in perf['histograms']
+                    ],
+                    use_container_width=True,
+                    hide_index=True
+                )
+            for c in perf['counters']:
+                labels = ", ".join(f"{k}={v}" for k, v in c['labels'].items())
+                st.caption(f"{c['name']}{' (' + labels + ')' if labels else ''}: {c['value']:,}")
+            col1, col2 = st.columns(2)
+            col1.download_button("Prometheus", data=lambda: metrics.to_prometheus().encode(), file_name="metrics.txt",
+                                 mime="text/plain", on_click="ignore", key="metrics_prom")
+            col2.download_button("JSON", data=lambda: metrics.to_json().encode(), file_name="metrics.json",
+                                 mime="application/json", on_click="ignore", key="metrics_json")
 
 # Footer
 st.markdown("---")
@@ -517,3 +1206,5 @@ st.markdown(
     "</div>",
     unsafe_allow_html=True
 )
+
+metrics.observe("rerun_seconds", time.perf_counter() - rerun_started)
@@ -0,0 +1,284 @@
+"""Headless load test of app.py: N sessions through the main user flows.
+
+Every session is a Streamlit AppTest instance of app.py. All of them run in
+one process, so they share the job queue, caches and history database the
+way sessions on one server do. Platform hosts (vimeo.com, facebook.com,
+...) are routed to a local fixture server that serves the media files and
+an oEmbed answer. The sessions step through these phases, round-robin:
+
+- open the app
+- click the Vimeo demo button and download the demo
+- download ``--downloads`` media files from the fixture server
+- add a download to the Favorites playlist
+- delete a history entry
+
+Every rerun is timed. The suite reports rerun latency per phase, peak RSS
+and the files written under downloads/. Results are written as JSON.
+``--baseline`` compares them with an earlier run and exits non-zero on a
+regression beyond ``--tolerance``.
+
+    python -m benchmarks.bench_app_load --output load.json
+    python -m benchmarks.bench_app_load --baseline load.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import sys
+import tempfile
+import time
+
+from benchmarks.fixture_server import make_file, route_hosts, serve
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+PLATFORM_HOSTS = ["vimeo.com", "www.vimeo.com", "player.vimeo.com", "facebook.com", "www.facebook.com"]
+MB = 1024 * 1024
+# Metrics where a larger value is a regression; everything else must not shrink
+LOWER_IS_BETTER = ("_ms", "peak_rss_mb", "rss_growth_mb", "files_written", "bytes_written", "wall_seconds", "errors",
+                   "unfinished_downloads")
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / MB
+
+
+class Session:
+    """One simulated browser tab"""
+
+    def __init__(self, index, timings):
+        from streamlit.testing.v1 import AppTest
+
+        self.index = index
+        self.timings = timings
+        self.at = AppTest.from_file(APP, default_timeout=120)
+
+    def run(self, phase):
+        start = time.perf_counter()
+        self.at.run()
+        self.timings.setdefault(phase, []).append((time.perf_counter() - start) * 1000)
+        return self.at
+
+    def button(self, label):
+        return next(b for b in self.at.button if label in b.label)
+
+    def start_download(self, url, phase):
+        self.at.text_input(key="url_input").set_value(url)
+        self.run(phase)
+        self.button("Download Media").click()
+        self.run(phase)
+
+    def pending(self):
+        jobs = self.at.session_state["active_jobs"] if "active_jobs" in self.at.session_state else []
+        return any(not job.recorded for job in jobs) and not self.at.error
+
+    def history_buttons(self, prefix):
+        return [b for b in self.at.button if b.key and b.key.startswith(prefix)]
+
+
+def wait_all(sessions, phase, timeout):
+    """Rerun every session (as its polling fragment would) until its downloads are recorded"""
+    deadline = time.monotonic() + timeout
+    waiting = [s for s in sessions if s.pending()]
+    while waiting and time.monotonic() < deadline:
+        time.sleep(0.1)
+        for session in waiting:
+            session.run(phase)
+        waiting = [s for s in waiting if s.pending()]
+    return len(waiting)
+
+
+def scan(root):
+    files = size = 0
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            files += 1
+            size += os.path.getsize(os.path.join(dirpath, name))
+    return files, size
+
+
+def run_suite(args, workdir):
+    from utils.downloader import get_session
+
+    media = os.path.join(workdir, "fixture")
+    os.makedirs(os.path.join(media, "api"))
+    os.makedirs(os.path.join(media, "media"))
+    with open(os.path.join(media, "api", "oembed.json"), "w") as f:
+        json.dump({'title': "Fixture clip", 'duration': 125, 'thumbnail_url': None}, f)
+    for n in range(args.files):
+        make_file(os.path.join(media, "media", f"clip{n}.mp4"), args.file_mb * MB)
+
+    app_dir = os.path.join(workdir, "app")
+    os.makedirs(app_dir)
+    os.chdir(app_dir)
+    os.environ["MEDIA_DOWNLOADER_DB"] = os.path.join(app_dir, "data", "media_downloader.db")
+
+    timings = {}
+    errors = 0
+    stuck = 0
+    with serve(media) as base:
+        route_hosts(get_session(), base, PLATFORM_HOSTS)
+        started = time.perf_counter()
+
+        sessions = [Session(n, timings) for n in range(args.sessions)]
+        for session in sessions:
+            session.run("open")
+        rss_open = peak_rss_mb()
+
+        for session in sessions:
+            session.button("Vimeo Demo").click()
+            session.run("demo")
+            if not session.at.text_input(key="url_input").value:
+                session.at.text_input(key="url_input").set_value("https://vimeo.com/example")
+                session.run("demo")
+            session.button("Download Media").click()
+            session.run("demo")
+        stuck += wait_all(sessions, "demo_poll", args.timeout)
+
+        for n in range(args.downloads):
+            for session in sessions:
+                # Sessions overlap on a few files, so the download cache sees hits too
+                clip = (session.index + n) % args.files
+                session.start_download(f"https://vimeo.com/media/clip{clip}.mp4", "download")
+            stuck += wait_all(sessions, "download_poll", args.timeout)
+
+        for session in sessions:
+            # "Add Media" preselects the newest download
+            session.button("Add to Favorites").click()
+            session.run("playlist")
+
+        for session in sessions:
+            # The oldest row on the page; the newest one was just added to Favorites
+            delete = session.history_buttons("delete_")
+            if delete:
+                delete[-1].click()
+                session.run("delete")
+
+        wall = time.perf_counter() - started
+        for session in sessions:
+            errors += len(session.at.exception) + len(session.at.error)
+        history = sum(len(s.history_buttons("delete_")) for s in sessions)
+        playlist = sum(len(s.history_buttons("remove_")) for s in sessions)
+
+    files, size = scan(os.path.join(app_dir, "downloads"))
+    all_runs = [ms for values in timings.values() for ms in values]
+    return {
+        'rerun_p50_ms': statistics.median(all_runs),
+        'rerun_p95_ms': percentile(all_runs, 0.95),
+        'rerun_max_ms': max(all_runs),
+        'reruns': len(all_runs),
+        'phases': {
+            phase: {'count': len(values), 'p50_ms': statistics.median(values), 'p95_ms': percentile(values, 0.95)}
+            for phase, values in timings.items()
+        },
+        'peak_rss_mb': peak_rss_mb(),
+        'rss_growth_mb': peak_rss_mb() - rss_open,
+        'files_written': files,
+        'bytes_written': size,
+        'history_rows_shown': history,
+        'playlist_items_shown': playlist,
+        'unfinished_downloads': stuck,
+        'errors': errors,
+        'wall_seconds': wall,
+    }
+
+
+def flatten(results, prefix=""):
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        else:
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def compare(current, baseline, tolerance):
+    """Print current vs baseline; returns the names of regressed metrics"""
+    now, then = flatten(current), flatten(baseline)
+    regressions = []
+    print(f"\n{'metric':>28} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name in sorted(now.keys() & then.keys()):
+        old, new = then[name], now[name]
+        if name.endswith("count") or name == "reruns":
+            continue
+        change = (new - old) / old if old else (0.0 if new == old else float("inf"))
+        if name.endswith(LOWER_IS_BETTER):
+            # Timings get the tolerance; counts of errors and stuck downloads do not
+            allowed = 0 if name in ("errors", "unfinished_downloads") else tolerance
+            regressed = new > old * (1 + allowed) and new - old > 1e-9
+        else:
+            regressed = new < old
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{name:>28} {old:>12.2f} {new:>12.2f} {change:>+7.0%}{flag}")
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--downloads", type=int, default=3, help="fixture downloads per session")
+    parser.add_argument("--files", type=int, default=4, help="distinct media files on the fixture server")
+    parser.add_argument("--file-mb", type=int, default=4)
+    parser.add_argument("--timeout", type=float, default=120, help="seconds to wait for each round of downloads")
+    parser.add_argument("--output", help="write the results JSON here")
+    parser.add_argument("--baseline", help="results JSON of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown for timings, 0.25 = 25%%")
+    args = parser.parse_args()
+
+    root = os.path.dirname(APP)
+    sys.path.insert(0, root)
+    with tempfile.TemporaryDirectory() as workdir:
+        try:
+            results = run_suite(args, workdir)
+        finally:
+            os.chdir(root)
+
+    import streamlit
+    report = {
+        'config': {key: getattr(args, key) for key in ("sessions", "downloads", "files", "file_mb")},
+        'environment': {'python': platform.python_version(), 'streamlit': streamlit.__version__,
+                        'machine': platform.machine(), 'cpus': os.cpu_count()},
+        'results': results,
+    }
+
+    print(f"{args.sessions} sessions, {args.downloads} downloads each of {args.file_mb} MB files\n")
+    print(f"{'phase':>14} {'reruns':>7} {'p50 ms':>8} {'p95 ms':>8}")
+    for phase, stats in results['phases'].items():
+        print(f"{phase:>14} {stats['count']:>7} {stats['p50_ms']:>8.1f} {stats['p95_ms']:>8.1f}")
+    print(f"\nall reruns: p50 {results['rerun_p50_ms']:.1f} ms, p95 {results['rerun_p95_ms']:.1f} ms, "
+          f"max {results['rerun_max_ms']:.1f} ms")
+    print(f"peak RSS {results['peak_rss_mb']:.0f} MB (+{results['rss_growth_mb']:.0f} MB after opening), "
+          f"{results['files_written']} files / {results['bytes_written'] / MB:.1f} MB written, "
+          f"{results['errors']} errors, {results['unfinished_downloads']} unfinished, "
+          f"{results['wall_seconds']:.1f} s")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nresults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('config') != report['config']:
+            print(f"\nwarning: baseline config {baseline.get('config')} differs from {report['config']}")
+        regressions = compare(results, baseline['results'], args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+            sys.exit(1)
+        print("\nno regressions")
+
+
+if __name__ == "__main__":
+    main()
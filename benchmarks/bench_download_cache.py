@@ -0,0 +1,69 @@
+"""Cache hit vs miss latency and deduplication in the download cache.
+
+Misses stream a file from the local fixture server and adopt it into the
+store; hits hard-link the stored object. The same bytes are then offered
+under extra URLs with tracking parameters to show that they share one key
+after normalization, and under distinct URLs to show one stored object.
+
+    python -m benchmarks.bench_download_cache
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from benchmarks.fixture_server import make_file, serve
+from utils.download_cache import DownloadCache, cache_key
+from utils.downloader import fetch_to_file
+
+MB = 1024 * 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=10)
+    parser.add_argument("--file-mb", type=int, default=16)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        src = os.path.join(root, "src")
+        out = os.path.join(root, "downloads")
+        os.makedirs(src)
+        for i in range(args.files):
+            make_file(os.path.join(src, f"{i}.mp4"), args.file_mb * MB)
+        cache = DownloadCache(root=os.path.join(out, ".cache"))
+
+        with serve(src) as base:
+            urls = [f"{base}/{i}.mp4" for i in range(args.files)]
+            timings = {'miss': [], 'hit': []}
+            for round_ in range(2):
+                for n, url in enumerate(urls):
+                    key = cache_key(url + "?utm_source=bench" if round_ else url, "MP4", "High")
+                    dest = os.path.join(out, f"{round_}_{n}.mp4")
+                    start = time.perf_counter()
+                    entry = cache.lookup(key)
+                    if entry is None:
+                        fetch_to_file(url, dest)
+                        cache.put(key, dest)
+                        timings['miss'].append(time.perf_counter() - start)
+                    else:
+                        cache.materialize(entry, dest)
+                        timings['hit'].append(time.perf_counter() - start)
+
+        # Distinct URLs, identical bytes: a second key for every object
+        for n in range(args.files):
+            dest = os.path.join(out, f"mirror_{n}.mp4")
+            shutil.copyfile(os.path.join(src, f"{n}.mp4"), dest)
+            cache.put(cache_key(f"https://mirror.example/{n}.mp4", "MP4", "High"), dest)
+
+        for kind, values in timings.items():
+            if values:
+                print(f"{kind:>5}: {len(values):>3} ops, {sum(values) / len(values) * 1000:>8.2f} ms/op")
+        stats = cache.stats()
+        print(f"keys={stats['keys']} objects={stats['objects']} stored={stats['bytes'] / MB:.0f} MB "
+              f"hits={stats['hits']} misses={stats['misses']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Memory cost of rendering history rows with lazy download buttons.
+
+Compares the old pattern (read every file for every rendered button) with
+``FileServer.loader`` (no reads until a click), then times repeated clicks
+on a handful of files to show the LRU serving them from memory.
+
+    python -m benchmarks.bench_file_server
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.fixture_server import make_file
+from utils.file_server import FileServer
+
+MB = 1024 * 1024
+
+
+def render_eager(paths):
+    buttons = []
+    for path in paths:
+        with open(path, "rb") as f:
+            buttons.append(len(f.read()))
+    return buttons
+
+
+def render_lazy(server, paths):
+    return [server.loader(path) for path in paths]
+
+
+def measure(func, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    func(*args)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed * 1000, peak / MB
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200)
+    parser.add_argument("--file-mb", type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        paths = [make_file(os.path.join(root, f"{i}.mp4"), args.file_mb * MB) for i in range(args.rows)]
+        server = FileServer(byte_budget=64 * MB)
+
+        print(f"{'render':>8} {'rows':>6} {'ms':>9} {'peak MB':>9}")
+        for name, func, fargs in (("eager", render_eager, (paths,)),
+                                  ("lazy", render_lazy, (server, paths))):
+            ms, peak = measure(func, *fargs)
+            print(f"{name:>8} {args.rows:>6} {ms:>9.2f} {peak:>9.2f}")
+
+        hot = [server.loader(path) for path in paths[:8]]
+        start = time.perf_counter()
+        for _ in range(50):
+            for load in hot:
+                load()
+        elapsed = time.perf_counter() - start
+        stats = server.stats()
+        print(f"400 clicks on 8 files: {elapsed * 1000:.1f} ms, "
+              f"hits={stats['hits']} misses={stats['misses']} cached={stats['bytes'] / MB:.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""History store load test: insert throughput and render queries at scale.
+
+Grows one session's history to 100k rows (with other sessions' rows mixed
+in) and, at each size, times what a History tab render asks the store for:
+the row count, the newest page, a page from the middle of the history
+(reached with the keyset cursor) and a platform-filtered page. Flat numbers
+across sizes mean render cost no longer tracks history length.
+
+    python -m benchmarks.bench_history_store
+"""
+import argparse
+import datetime
+import os
+import random
+import tempfile
+import time
+
+from utils.history_tracker import TIME_FORMAT, HistoryStore
+
+PLATFORMS = ["Vimeo", "Facebook", "Instagram", "TikTok", "Twitter", "Imgur"]
+FORMATS = ["MP4", "MP3", "JPG", "PNG"]
+
+
+def make_item(rng, n, start):
+    when = start + datetime.timedelta(seconds=n)
+    return {
+        'title': f"item_{n}",
+        'platform': rng.choice(PLATFORMS),
+        'url': f"https://vimeo.com/{n}",
+        'time': when.strftime(TIME_FORMAT),
+        'file': f"downloads/item_{n}.mp4",
+        'format': rng.choice(FORMATS),
+        'type': "video",
+        'file_size': 15.7,
+    }
+
+
+def timed(func, repeat=20):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--page", type=int, default=50)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    start = datetime.datetime(2024, 1, 1)
+    with tempfile.TemporaryDirectory() as root:
+        store = HistoryStore(path=os.path.join(root, "bench.db"))
+        inserted = 0
+        print(f"{'rows':>8} {'insert/s':>10} {'count ms':>9} {'page ms':>8} {'deep ms':>8} {'filtered ms':>12}")
+        for size in (int(n) for n in args.sizes.split(",")):
+            t0 = time.perf_counter()
+            added = 0
+            while inserted < size:
+                store.add_history("me", make_item(rng, inserted, start))
+                store.add_history(f"other{inserted % 10}", make_item(rng, inserted, start))
+                inserted += 1
+                added += 2
+            store.flush()
+            rate = added / (time.perf_counter() - t0) if added else 0
+
+            count_ms = timed(lambda: store.count_history("me"))
+            page_ms = timed(lambda: store.list_history("me", limit=args.page))
+            middle = store.list_history("me", limit=1, offset=size // 2)[0]
+            deep_ms = timed(lambda: store.list_history("me", limit=args.page, before=(middle.ts, middle.id)))
+            filtered_ms = timed(lambda: store.list_history("me", limit=args.page, platform="Vimeo"))
+            print(f"{size:>8} {rate:>10.0f} {count_ms:>9.2f} {page_ms:>8.2f} {deep_ms:>8.2f} {filtered_ms:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
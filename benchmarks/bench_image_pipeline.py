@@ -0,0 +1,77 @@
+"""Images per second and peak memory of the image conversion pipeline.
+
+Large JPEGs are generated locally, then each scenario runs in a fresh
+child process (so its peak RSS is isolated) through ``ImageProcessor``.
+The "no draft" row decodes at full size before shrinking, which is what
+``Image.draft`` avoids.
+
+    python -m benchmarks.bench_image_pipeline
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+
+from PIL import Image
+
+from utils import image_processor
+from utils.image_processor import ImageProcessor, ThumbnailCache
+
+
+def make_jpeg(path, width, height, seed):
+    noise = Image.effect_noise((width // 8, height // 8), 64 + seed).resize((width, height))
+    Image.merge("RGB", (noise, noise.rotate(90, expand=False), noise.transpose(Image.Transpose.FLIP_LEFT_RIGHT))).save(
+        path, "JPEG", quality=90
+    )
+    return path
+
+
+def _scenario(name, sources, out_dir, results):
+    start = time.perf_counter()
+    if name == "thumbnail":
+        thumbs = ThumbnailCache(root=out_dir)
+        for n, src in enumerate(sources):
+            thumbs.get_or_create(src, f"{n:064x}")
+    else:
+        format_type, quality = name.split()[:2]
+        if name.endswith("no draft"):
+            image_processor.open_reduced = lambda path, max_side=None: Image.open(path)
+        processor = ImageProcessor()
+        ext = format_type.lower()
+        futures = [processor.submit(src, os.path.join(out_dir, f"{n}.{ext}"), format_type, quality)
+                   for n, src in enumerate(sources)]
+        for future in futures:
+            future.result()
+        processor.shutdown()
+    elapsed = time.perf_counter() - start
+    results.put((len(sources) / elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--images", type=int, default=6)
+    parser.add_argument("--width", type=int, default=6000)
+    parser.add_argument("--height", type=int, default=4000)
+    args = parser.parse_args()
+
+    scenarios = ["JPG Low", "JPG Low no draft", "JPG Medium", "PNG Low", "JPG High", "thumbnail"]
+    with tempfile.TemporaryDirectory() as root:
+        sources = [make_jpeg(os.path.join(root, f"src{n}.jpg"), args.width, args.height, n)
+                   for n in range(args.images)]
+        print(f"{args.images} images of {args.width}x{args.height}")
+        print(f"{'scenario':>18} {'images/s':>9} {'peak RSS MB':>12}")
+        for name in scenarios:
+            out_dir = os.path.join(root, name.replace(" ", "_"))
+            os.makedirs(out_dir)
+            results = multiprocessing.Queue()
+            proc = multiprocessing.Process(target=_scenario, args=(name, sources, out_dir, results))
+            proc.start()
+            rate, rss = results.get()
+            proc.join()
+            print(f"{name:>18} {rate:>9.2f} {rss:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Cost of integrity hashing, in seconds per GB.
+
+Three measurements:
+
+- raw hash speed of SHA-256 and (when ``xxhash`` is installed) XXH3-64 over
+  in-memory blocks;
+- streamed and segmented downloads from an unthrottled local fixture
+  server with inline hashing off and on, i.e. what hashing adds to a
+  download;
+- the alternative the inline hasher replaces: reading the finished file
+  back to hash it (the file is still in the page cache here, so this is
+  the best case for the re-read).
+
+Every hashed download is checked against the source file's SHA-256.
+
+    python -m benchmarks.bench_integrity
+"""
+import argparse
+import hashlib
+import os
+import statistics
+import tempfile
+import time
+
+from benchmarks.fixture_server import make_file, serve
+from utils.downloader import fetch_segmented, fetch_to_file
+from utils.integrity import HASH_BLOCK, StreamHasher, hash_file, xxhash
+
+MB = 1024 * 1024
+GB = 1024 * MB
+
+
+def hash_speed(new_hasher, size):
+    block = os.urandom(HASH_BLOCK)
+    hasher = new_hasher()
+    start = time.perf_counter()
+    for _ in range(size // HASH_BLOCK):
+        hasher.update(block)
+    hasher.hexdigest()
+    return (time.perf_counter() - start) * GB / size
+
+
+def timed(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=256, help="file size in MB")
+    parser.add_argument("--segments", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    size = args.size * MB
+    per_gb = GB / size
+
+    print(f"{'hash':>10} {'s/GB':>7}")
+    print(f"{'sha256':>10} {hash_speed(hashlib.sha256, size):>7.2f}")
+    if xxhash is not None:
+        print(f"{'xxh3_64':>10} {hash_speed(xxhash.xxh3_64, size):>7.2f}")
+    else:
+        print(f"{'xxh3_64':>10} {'n/a':>7}  (pip install xxhash)")
+
+    with tempfile.TemporaryDirectory() as root:
+        source = make_file(os.path.join(root, "big.mp4"), size)
+        want = hash_file(source, StreamHasher(fast=False)).result()['digest']
+        dest = os.path.join(root, "out", "big.mp4")
+        modes = {
+            'streamed': lambda url, hashing: fetch_to_file(url, dest, hash_content=hashing),
+            'segmented': lambda url, hashing: fetch_segmented(url, dest, segments=args.segments,
+                                                              hash_content=hashing),
+        }
+
+        with serve(root) as base:
+            url = f"{base}/big.mp4"
+            print(f"\n{args.size} MB file, median of {args.repeat}")
+            print(f"{'download':>10} {'plain s/GB':>11} {'hashed s/GB':>12} {'overhead':>9} {'verified':>9}")
+            for name, fetch in modes.items():
+                plain, _ = timed(lambda: fetch(url, False), args.repeat)
+                hashed, result = timed(lambda: fetch(url, True), args.repeat)
+                print(f"{name:>10} {plain * per_gb:>11.2f} {hashed * per_gb:>12.2f} "
+                      f"{(hashed - plain) * per_gb:>+9.2f} {str(result['digest'] == want):>9}")
+
+            reread, _ = timed(lambda: hash_file(dest), args.repeat)
+            print(f"\nre-reading the finished file to hash it: {reread * per_gb:.2f} s/GB (page cache warm)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Jobs per second through the shared download queue as sessions grow.
+
+Each simulated session submits a burst of jobs and waits for them, the way
+a user clicking "Download Media" several times would. Jobs sleep to stand
+in for network time, so the numbers show scheduling overhead and how the
+worker pool and per-host cap share capacity between sessions.
+
+    python -m benchmarks.bench_job_queue
+"""
+import argparse
+import threading
+import time
+
+from benchmarks.bench_app_load import percentile
+from utils.job_queue import JobQueue
+
+HOSTS = ["vimeo.com", "facebook.com", "instagram.com", "tiktok.com"]
+
+
+def fake_download(seconds, progress=None):
+    """Pretend to transfer 1 MB over ``seconds``, reporting progress in four steps"""
+    total = 1024 * 1024
+    for step in range(1, 5):
+        time.sleep(seconds / 4)
+        progress(total * step // 4, total)
+    return total
+
+
+def run(sessions, jobs_per_session, job_seconds, max_workers, per_host_limit):
+    queue = JobQueue(max_workers=max_workers, per_host_limit=per_host_limit)
+    submit_times = []
+    lock = threading.Lock()
+
+    def session(n):
+        jobs = []
+        for i in range(jobs_per_session):
+            start = time.perf_counter()
+            jobs.append(queue.submit(f"s{n}", HOSTS[(n + i) % len(HOSTS)], fake_download, job_seconds))
+            with lock:
+                submit_times.append(time.perf_counter() - start)
+        queue.wait(jobs)
+
+    threads = [threading.Thread(target=session, args=(n,)) for n in range(sessions)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    queue.shutdown()
+
+    return {
+        'sessions': sessions,
+        'jobs': sessions * jobs_per_session,
+        'seconds': elapsed,
+        'jobs_per_sec': sessions * jobs_per_session / elapsed,
+        'submit_p99_ms': percentile(submit_times, 0.99) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", default="1,2,4,8,16,32")
+    parser.add_argument("--jobs", type=int, default=4, help="jobs per session")
+    parser.add_argument("--job-seconds", type=float, default=0.05)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--per-host", type=int, default=2)
+    args = parser.parse_args()
+
+    print(f"{'sessions':>8} {'jobs':>6} {'seconds':>8} {'jobs/s':>8} {'submit p99 ms':>14}")
+    for sessions in (int(n) for n in args.sessions.split(",")):
+        r = run(sessions, args.jobs, args.job_seconds, args.workers, args.per_host)
+        print(f"{r['sessions']:>8} {r['jobs']:>6} {r['seconds']:>8.2f} "
+              f"{r['jobs_per_sec']:>8.1f} {r['submit_p99_ms']:>14.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""HLS/DASH segment throughput: sequential vs a bounded concurrent window.
+
+A fixture server serves a generated HLS ladder and DASH MPD of random
+segments. Each connection is capped at ``--conn-mbps`` and every response
+waits ``--latency`` ms, like a CDN edge. The stream is fetched with window
+1 (sequential fetching) and with larger windows. Segments are always
+written in order. Quality presets are checked to pick the expected
+variant height. When ffmpeg is available, a real clip is also encoded into
+fMP4 HLS segments and downloaded end to end, including the remux to MP4.
+
+    python -m benchmarks.bench_manifest
+"""
+import argparse
+import os
+import subprocess
+import tempfile
+import time
+
+from benchmarks.fixture_server import make_dash, make_hls, serve, throttled
+from utils.format_converter import ffmpeg_binary
+from utils.manifest_downloader import fetch_manifest
+
+MB = 1024 * 1024
+
+
+def timed_fetch(url, dest, quality, window, remux=False):
+    start = time.perf_counter()
+    result = fetch_manifest(url, dest, quality=quality, window=window, remux=remux)
+    elapsed = time.perf_counter() - start
+    os.remove(dest)
+    return elapsed, result
+
+
+def make_real_hls(root, seconds):
+    """Encode a 720p test clip into one-second fMP4 segments behind a master playlist"""
+    out = os.path.join(root, "real", "720p")
+    os.makedirs(out)
+    subprocess.run([
+        ffmpeg_binary(), "-hide_banner", "-loglevel", "error", "-y",
+        "-f", "lavfi", "-i", "testsrc=size=1280x720:rate=25", "-f", "lavfi", "-i", "sine=frequency=440",
+        "-t", str(seconds), "-c:v", "libx264", "-preset", "ultrafast", "-g", "25", "-c:a", "aac", "-shortest",
+        "-f", "hls", "-hls_time", "1", "-hls_playlist_type", "vod", "-hls_segment_type", "fmp4",
+        "-hls_fmp4_init_filename", "init.mp4",
+        "-hls_segment_filename", os.path.join(out, "seg%03d.m4s"), os.path.join(out, "index.m3u8"),
+    ], check=True)
+    with open(os.path.join(root, "real", "master.m3u8"), "w") as f:
+        f.write("#EXTM3U\n#EXT-X-STREAM-INF:BANDWIDTH=2000000,RESOLUTION=1280x720\n720p/index.m3u8\n")
+    return "real/master.m3u8"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--segments", type=int, default=40)
+    parser.add_argument("--segment-kb", type=int, default=512)
+    parser.add_argument("--conn-mbps", type=float, default=8, help="per-connection cap in MB/s")
+    parser.add_argument("--latency", type=float, default=40, help="per-request latency in ms")
+    parser.add_argument("--windows", default="1,2,4,8")
+    parser.add_argument("--seconds", type=int, default=10, help="length of the real clip")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        master = make_hls(os.path.join(root, "hls"), segments=args.segments, segment_size=args.segment_kb * 1024)
+        mpd = make_dash(os.path.join(root, "dash"), segments=args.segments, segment_size=args.segment_kb * 1024)
+        handler = throttled(args.conn_mbps * MB, latency=args.latency / 1000)
+        dest = os.path.join(root, "out.mp4")
+
+        with serve(root, handler=handler) as base:
+            print(f"{args.segments} segments x {args.segment_kb} KB, {args.conn_mbps:g} MB/s per connection, "
+                  f"{args.latency:g} ms latency\n")
+            print(f"{'manifest':>9} {'window':>7} {'seconds':>8} {'MB/s':>7} {'speedup':>8}")
+            for name, path in (("HLS", f"hls/{master}"), ("DASH", f"dash/{mpd}")):
+                baseline = None
+                for window in (int(n) for n in args.windows.split(",")):
+                    elapsed, result = timed_fetch(f"{base}/{path}", dest, "High", window)
+                    baseline = baseline or elapsed
+                    print(f"{name:>9} {window:>7} {elapsed:>8.2f} {result['bytes'] / MB / elapsed:>7.1f} "
+                          f"{baseline / elapsed:>7.1f}x")
+
+            print(f"\n{'quality':>9} {'HLS height':>11} {'DASH height':>12}")
+            for quality in ("High", "Medium", "Low"):
+                heights = [timed_fetch(f"{base}/{path}", dest, quality, 8)[1]['height']
+                           for path in (f"hls/{master}", f"dash/{mpd}")]
+                print(f"{quality:>9} {heights[0]:>11} {heights[1]:>12}")
+
+        if ffmpeg_binary() is None:
+            print("\nffmpeg not found (install it or set FFMPEG_BINARY): skipping the remux run")
+            return
+        real = make_real_hls(root, args.seconds)
+        with serve(root) as base:
+            elapsed, result = timed_fetch(f"{base}/{real}", dest, "High", 6, remux=True)
+        print(f"\nreal {args.seconds}s clip: {result['segments']} segments, "
+              f"{result['bytes'] / MB:.1f} MB fetched and remuxed to MP4 in {elapsed:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
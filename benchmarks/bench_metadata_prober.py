@@ -0,0 +1,119 @@
+"""Metadata probe latency and deduplication under concurrent sessions.
+
+A local server plays a platform: every path is an HTML page with OpenGraph
+tags, answered after ``--delay`` ms. ``--sessions`` threads each analyze
+``--probes`` URLs drawn from a skewed popularity distribution (a few
+viral links, a long tail), the way reruns and shared links hit the app.
+The bare client fetches every probe; the MetadataProber serves repeats from
+its cache and coalesces identical in-flight probes. The dedup ratio is the
+share of probes that never reached the server.
+
+    python -m benchmarks.bench_metadata_prober
+"""
+import argparse
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from utils.metadata_prober import MetadataProber
+
+
+def page_server(delay):
+    counter = {'requests': 0}
+    lock = threading.Lock()
+
+    class PageHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            with lock:
+                counter['requests'] += 1
+            time.sleep(delay)
+            body = (
+                "<html><head><title>fallback</title>"
+                f'<meta property="og:title" content="Video {self.path}">'
+                '<meta property="og:image" content="https://example.com/thumb.jpg">'
+                '<meta property="og:video:duration" content="245">'
+                "</head><body>" + "x" * 4096 + "</body></html>"
+            ).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), PageHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, counter
+
+
+def workload(base, sessions, probes, distinct, seed=11):
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(distinct)]
+    urls = [f"{base}/watch/{n}" for n in range(distinct)]
+    return [rng.choices(urls, weights, k=probes) for _ in range(sessions)]
+
+
+def run(name, probe, plan, counter):
+    counter['requests'] = 0
+    latencies = []
+    lock = threading.Lock()
+
+    def session(urls):
+        for url in urls:
+            start = time.perf_counter()
+            meta = probe(url)
+            elapsed = time.perf_counter() - start
+            assert meta['duration'] == 245
+            with lock:
+                latencies.append(elapsed)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(plan)) as pool:
+        list(pool.map(session, plan))
+    wall = time.perf_counter() - start
+    total = len(latencies)
+    latencies.sort()
+    p95 = latencies[int(0.95 * (total - 1))]
+    dedup = 1 - counter['requests'] / total
+    print(f"{name:>14} {wall:>7.2f} {statistics.median(latencies) * 1000:>8.2f} {p95 * 1000:>8.2f} "
+          f"{counter['requests']:>9} {dedup:>7.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=16)
+    parser.add_argument("--probes", type=int, default=50, help="probes per session")
+    parser.add_argument("--distinct", type=int, default=200, help="distinct URLs")
+    parser.add_argument("--delay", type=float, default=50, help="server latency in ms")
+    args = parser.parse_args()
+
+    server, counter = page_server(args.delay / 1000)
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    plan = workload(base, args.sessions, args.probes, args.distinct)
+
+    print(f"{args.sessions} sessions x {args.probes} probes over {args.distinct} URLs, "
+          f"{args.delay:g} ms server latency\n")
+    print(f"{'client':>14} {'wall s':>7} {'p50 ms':>8} {'p95 ms':>8} {'upstream':>9} {'dedup':>7}")
+
+    bare = MetadataProber(ttl=0, negative_ttl=0, max_concurrency=args.sessions)
+    run("bare fetch", lambda url: bare._opengraph(url), plan, counter)
+    prober = MetadataProber(max_concurrency=args.sessions)
+    run("prober", prober.probe, plan, counter)
+    stats = prober.stats()
+    print(f"\nprober: {stats['hits']} cache hits, {stats['coalesced']} coalesced, {stats['fetches']} fetches")
+
+    bare.shutdown()
+    prober.shutdown()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
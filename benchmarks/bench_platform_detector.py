@@ -0,0 +1,98 @@
+"""Per-call latency and accuracy of detect_platform over a mixed URL corpus.
+
+The corpus mixes real platform URLs (with subdomains, ports, paths and
+query strings), lookalike hosts the old substring scan misclassified, and
+unrelated sites. Each URL carries its expected platform, so the benchmark
+reports wrong answers next to latency for the legacy implementation, the
+trie without memoization and the trie behind the per-host LRU.
+
+    python -m benchmarks.bench_platform_detector
+"""
+import argparse
+import random
+import time
+from urllib.parse import urlparse
+
+from utils import platform_detector
+
+PLATFORM_HOSTS = {
+    "Vimeo": ["vimeo.com", "player.vimeo.com", "www.vimeo.com"],
+    "Dailymotion": ["www.dailymotion.com", "dai.ly"],
+    "Facebook": ["facebook.com", "m.facebook.com", "fb.watch"],
+    "Instagram": ["www.instagram.com", "instagram.com"],
+    "TikTok": ["www.tiktok.com", "vm.tiktok.com"],
+    "Twitter": ["twitter.com", "mobile.twitter.com", "x.com"],
+    "Imgur": ["imgur.com", "i.imgur.com"],
+    "Flickr": ["www.flickr.com", "flic.kr"],
+    "Unsplash": ["unsplash.com", "images.unsplash.com"],
+    "Pixabay": ["pixabay.com"],
+    "Pexels": ["www.pexels.com", "images.pexels.com"],
+    "YouTube": ["www.youtube.com", "youtu.be", "m.youtube.com"],
+}
+UNKNOWN_HOSTS = [
+    "netbox.com", "box.com", "fox.com", "x.com.example.org", "vimeo.example.net",
+    "notfacebook.io", "example.com", "news.ycombinator.com", "localhost:8501",
+]
+
+
+def legacy_detect_platform(url):
+    """The substring scan detect_platform used before the registry"""
+    domain = urlparse(url).netloc.lower()
+    platforms = {
+        "vimeo": {"name": "Vimeo"}, "dailymotion": {"name": "Dailymotion"},
+        "facebook": {"name": "Facebook"}, "instagram": {"name": "Instagram"},
+        "tiktok": {"name": "TikTok"}, "twitter": {"name": "Twitter"},
+        "x.com": {"name": "Twitter"}, "imgur": {"name": "Imgur"},
+        "flickr": {"name": "Flickr"}, "unsplash": {"name": "Unsplash"},
+        "pixabay": {"name": "Pixabay"}, "pexels": {"name": "Pexels"},
+    }
+    for key, info in platforms.items():
+        if key in domain:
+            return info
+    if "youtube" in domain or "youtu.be" in domain:
+        return {"name": "YouTube"}
+    return {"name": "Unknown"}
+
+
+def build_corpus(size, distinct, seed=7):
+    rng = random.Random(seed)
+    pool = []
+    choices = [(name, host) for name, hosts in PLATFORM_HOSTS.items() for host in hosts]
+    choices += [("Unknown", host) for host in UNKNOWN_HOSTS]
+    for n in range(distinct):
+        name, host = rng.choice(choices)
+        path = "/".join(str(rng.randint(1, 10 ** 6)) for _ in range(rng.randint(1, 3)))
+        query = f"?v={n}" if rng.random() < 0.3 else ""
+        pool.append((f"https://{host}/{path}{query}", name))
+    return [rng.choice(pool) for _ in range(size)]
+
+
+def uncached_detect_platform(url):
+    host = urlparse(url.strip()).hostname
+    return platform_detector.match_host(host) if host else platform_detector.UNKNOWN
+
+
+def run(name, func, corpus):
+    start = time.perf_counter()
+    wrong = sum(1 for url, expected in corpus if func(url)["name"] != expected)
+    elapsed = time.perf_counter() - start
+    print(f"{name:>12} {elapsed / len(corpus) * 1e9:>10.0f} {wrong:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--urls", type=int, default=100_000)
+    parser.add_argument("--distinct", type=int, default=2_000,
+                        help="distinct URLs in the corpus (reruns repeat the same URL)")
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.urls, args.distinct)
+    print(f"{'impl':>12} {'ns/call':>10} {'wrong':>8}")
+    run("legacy", legacy_detect_platform, corpus)
+    run("trie", uncached_detect_platform, corpus)
+    platform_detector._lookup_host.cache_clear()
+    run("trie+lru", platform_detector.detect_platform, corpus)
+
+
+if __name__ == "__main__":
+    main()
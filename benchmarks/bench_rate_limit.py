@@ -0,0 +1,123 @@
+"""Request limiting against a throttling server, and bandwidth fairness.
+
+Part 1 fetches many small files from a fixture server that answers 429
+with Retry-After once more than ``--server-rps`` requests per second
+arrive, first with bare retries and then through a DownloadScheduler
+token bucket set 10% under that rate.
+
+Part 2 caps total bandwidth at ``--bandwidth`` MB/s and runs one session
+with ``--streams`` parallel transfers against a session with a single
+transfer. Shares are compared per stream (what plain connection-level
+sharing gives) and per session, reporting each session's MB/s and Jain's
+fairness index (1.0 = perfectly even).
+
+    python -m benchmarks.bench_rate_limit
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.fixture_server import make_file, rate_limited, serve
+from utils.downloader import fetch_to_file
+from utils.rate_limiter import DownloadScheduler
+
+MB = 1024 * 1024
+
+
+def throttling_run(base, root, files, workers, scheduler):
+    def fetch(n):
+        dest = os.path.join(root, f"small_{n}.out")
+        throttle = scheduler.throttle("Fixture", "bench") if scheduler is not None else None
+        try:
+            fetch_to_file(f"{base}/small.jpg", dest, throttle=throttle)
+            return True
+        except Exception:
+            return False
+        finally:
+            if os.path.exists(dest):
+                os.remove(dest)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        ok = sum(pool.map(fetch, range(files)))
+    return time.perf_counter() - start, ok
+
+
+def jain(values):
+    return sum(values) ** 2 / (len(values) * sum(v * v for v in values)) if any(values) else 0.0
+
+
+def fairness_run(base, root, bandwidth, streams, seconds, per_session, weights):
+    scheduler = DownloadScheduler(limits={}, default_limit=(1000.0, 1000), bandwidth=bandwidth)
+    counted = {'A': [0] * streams, 'B': [0]}
+    deadline = time.monotonic() + seconds
+
+    def worker(session, n):
+        key = session if per_session else f"{session}{n}"
+        with scheduler.throttle("Fixture", key, weight=weights[session]) as throttle:
+            base_bytes = 0
+            while time.monotonic() < deadline:
+                dest = os.path.join(root, f"big_{session}{n}.out")
+
+                def progress(done, total):
+                    counted[session][n] = base_bytes + done
+
+                result = fetch_to_file(f"{base}/big.mp4", dest, progress=progress, throttle=throttle)
+                base_bytes += result['bytes']
+                os.remove(dest)
+
+    threads = [threading.Thread(target=worker, args=("A", n), daemon=True) for n in range(streams)]
+    threads.append(threading.Thread(target=worker, args=("B", 0), daemon=True))
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    rates = {session: sum(values) / MB / seconds for session, values in counted.items()}
+    for t in threads:
+        t.join()
+    return rates
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=40)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--server-rps", type=float, default=10)
+    parser.add_argument("--bandwidth", type=float, default=32, help="total cap in MB/s")
+    parser.add_argument("--streams", type=int, default=6, help="parallel transfers of session A")
+    parser.add_argument("--seconds", type=float, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        make_file(os.path.join(root, "small.jpg"), 64 * 1024)
+        make_file(os.path.join(root, "big.mp4"), 2 * MB)
+
+        print(f"Part 1: {args.files} downloads, {args.workers} workers, server allows {args.server_rps:g} req/s")
+        print(f"{'client':>14} {'seconds':>8} {'ok':>4} {'429s':>6} {'files/s':>8}")
+        for name, limit in (("bare retries", None), ("token bucket", (args.server_rps * 0.9, 2))):
+            handler = rate_limited(args.server_rps, burst=2, retry_after=1)
+            scheduler = DownloadScheduler(limits={"Fixture": limit}) if limit else None
+            with serve(root, handler=handler) as base:
+                elapsed, ok = throttling_run(base, root, args.files, args.workers, scheduler)
+            print(f"{name:>14} {elapsed:>8.2f} {ok:>4} {handler.stats['rejected']:>6} {ok / elapsed:>8.1f}")
+
+        print(f"\nPart 2: {args.bandwidth:g} MB/s shared, session A runs {args.streams} transfers, session B runs 1")
+        print(f"{'sharing':>20} {'A MB/s':>8} {'B MB/s':>8} {'total':>7} {'Jain':>6}")
+        cases = (
+            ("per stream", False, {'A': 1.0, 'B': 1.0}),
+            ("per session", True, {'A': 1.0, 'B': 1.0}),
+            ("per session, B x2", True, {'A': 1.0, 'B': 2.0}),
+        )
+        with serve(root) as base:
+            for name, per_session, weights in cases:
+                rates = fairness_run(base, root, args.bandwidth * MB, args.streams, args.seconds,
+                                     per_session, weights)
+                normalized = [rates[s] / weights[s] for s in ("A", "B")]
+                print(f"{name:>20} {rates['A']:>8.1f} {rates['B']:>8.1f} "
+                      f"{rates['A'] + rates['B']:>7.1f} {jain(normalized):>6.3f}")
+
+
+if __name__ == "__main__":
+    main()
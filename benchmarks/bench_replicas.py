@@ -0,0 +1,178 @@
+"""Several replicas sharing one job table, dedup leases and file index.
+
+Each replica is a separate process with its own ``SharedJobQueue``,
+``DownloadCache`` and ``LeaseKeeper``, all on one SQLite backend in a
+scratch directory (standing in for the shared volume). ``--jobs`` downloads
+of ``--files`` distinct fixture files are queued up front, so most URLs
+are requested several times; the fixture server counts the GETs it
+serves. Two runs are compared:
+
+- coordinated: a per-request lease plus the shared file index, as the app
+  runs with ``MEDIA_DOWNLOADER_SHARED`` set;
+- uncoordinated: jobs are still shared, but every replica only knows its
+  own cache, like independent replicas behind a load balancer.
+
+``--crash`` kills one replica partway through its first download in the
+coordinated run; its job and lease expire and another replica finishes it.
+
+    python -m benchmarks.bench_replicas
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import uuid
+
+from benchmarks.fixture_server import make_file, serve, throttled
+from utils.download_cache import DownloadCache
+from utils.downloader import fetch_to_file
+from utils.job_queue import JobQueue, SharedJobQueue
+from utils.shared_state import DEDUP_WAIT, LeaseKeeper, SQLiteBackend
+
+MB = 1024 * 1024
+LEASE_TTL = 3
+
+
+def replica_download(url, key, progress=None, cache=None, leases=None, replica=None, crash_after=None):
+    """The app's download path in miniature: cache, dedup lease, shared index, fetch"""
+    if crash_after is not None:
+        report = progress
+
+        def progress(done, total):
+            if done >= crash_after:
+                os._exit(1)
+            report(done, total)
+
+    entry = cache.lookup(key)
+    if entry is None and leases is not None:
+        with leases.hold(f"download:{key}", wait=DEDUP_WAIT):
+            entry = cache.adopt(key)
+            if entry is None:
+                return fetch_and_store(url, key, progress, cache, replica)
+    elif entry is None:
+        return fetch_and_store(url, key, progress, cache, replica)
+    return {'replica': replica, 'fetched': False}
+
+
+def fetch_and_store(url, key, progress, cache, replica):
+    dest = os.path.join("downloads", f"{replica}_{uuid.uuid4().hex[:8]}.mp4")
+    result = fetch_to_file(url, dest, progress=progress, partial=dest + ".part")
+    cache.put(key, dest, meta={'title': os.path.basename(url)}, digest=result['digest'])
+    return {'replica': replica, 'fetched': True}
+
+
+def run_replica(index, workdir, coordinated, crash_after, stop):
+    os.chdir(workdir)
+    backend = SQLiteBackend("shared.db")
+    name = f"replica{index}"
+    keeper = LeaseKeeper(backend, ttl=LEASE_TTL)
+    cache = DownloadCache(root=os.path.join("downloads", ".cache", name),
+                          shared=backend if coordinated else None, owner=keeper.owner)
+    context = {'cache': cache, 'leases': keeper if coordinated else None, 'replica': name}
+    if crash_after is not None:
+        context['crash_after'] = crash_after
+    queue = SharedJobQueue(backend, [replica_download], local=JobQueue(max_workers=2, per_host_limit=2),
+                           owner=keeper.owner, context=context, lease_ttl=LEASE_TTL, heartbeat=LEASE_TTL / 3)
+    # Poll rather than stop.wait(): Event.set() blocks until every waiter
+    # acknowledges, and a replica killed by --crash never would
+    while not stop.is_set():
+        time.sleep(0.1)
+    queue.shutdown(wait=False)
+
+
+def run(args, root, base, counter, coordinated, crash):
+    workdir = os.path.join(root, "coordinated" if coordinated else "uncoordinated")
+    os.makedirs(os.path.join(workdir, "downloads"))
+    backend = SQLiteBackend(os.path.join(workdir, "shared.db"))
+    for n in range(args.jobs):
+        url = f"{base}/clip{n % args.files}.mp4"
+        key = hashlib.sha256(url.encode()).hexdigest()
+        backend.enqueue_job(f"session{n}", "fixture", "bench", "replica_download",
+                            json.dumps({'args': [url, key], 'kwargs': {}}))
+
+    counter.clear()
+    ctx = multiprocessing.get_context("spawn")
+    stop = ctx.Event()
+    start = time.perf_counter()
+    procs = [
+        ctx.Process(target=run_replica, daemon=True,
+                    args=(i, workdir, coordinated, args.file_mb * MB // 2 if crash and i == 0 else None, stop))
+        for i in range(args.replicas)
+    ]
+    for proc in procs:
+        proc.start()
+    deadline = time.monotonic() + args.timeout
+    while time.monotonic() < deadline:
+        counts = backend.job_counts()
+        if not counts.get("queued") and not counts.get("running"):
+            break
+        time.sleep(0.1)
+    wall = time.perf_counter() - start
+    stop.set()
+    for proc in procs:
+        proc.join(timeout=10)
+
+    per_replica = {}
+    reclaimed = failed = 0
+    for n in range(1, args.jobs + 1):
+        job = backend.get_job(n)
+        if job['status'] != "done":
+            failed += 1
+            continue
+        result = json.loads(job['result'])
+        per_replica[result['replica']] = per_replica.get(result['replica'], 0) + 1
+        reclaimed += job['attempts'] > 1
+    fetches = sum(counter.values())
+    return {
+        'wall': wall,
+        'fetches': fetches,
+        'duplicates': fetches - len(counter),
+        'per_replica': per_replica,
+        'reclaimed': reclaimed,
+        'failed': failed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--replicas", type=int, default=3)
+    parser.add_argument("--jobs", type=int, default=24)
+    parser.add_argument("--files", type=int, default=6, help="distinct URLs among the jobs")
+    parser.add_argument("--file-mb", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=8, help="per-connection cap in MB/s")
+    parser.add_argument("--crash", action="store_true", help="kill one replica mid-download")
+    parser.add_argument("--timeout", type=float, default=120)
+    args = parser.parse_args()
+
+    lock = threading.Lock()
+    counter = {}
+    base_handler = throttled(int(args.rate * MB))
+
+    class CountingHandler(base_handler):
+        def do_GET(self):
+            with lock:
+                counter[self.path] = counter.get(self.path, 0) + 1
+            super().do_GET()
+
+    with tempfile.TemporaryDirectory() as root:
+        media = os.path.join(root, "media")
+        os.makedirs(media)
+        for n in range(args.files):
+            make_file(os.path.join(media, f"clip{n}.mp4"), args.file_mb * MB)
+        with serve(media, handler=CountingHandler) as base:
+            print(f"{args.replicas} replicas, {args.jobs} jobs over {args.files} URLs of {args.file_mb} MB\n")
+            print(f"{'mode':>14} {'seconds':>8} {'GETs':>5} {'duplicate':>10} {'reclaimed':>10} {'failed':>7}  jobs per replica")
+            for coordinated in (False, True):
+                stats = run(args, root, base, counter, coordinated, args.crash and coordinated)
+                spread = ", ".join(f"{name}: {count}" for name, count in sorted(stats['per_replica'].items()))
+                print(f"{'coordinated' if coordinated else 'uncoordinated':>14} {stats['wall']:>8.2f} "
+                      f"{stats['fetches']:>5} {stats['duplicates']:>10} {stats['reclaimed']:>10} "
+                      f"{stats['failed']:>7}  {spread}")
+
+
+if __name__ == "__main__":
+    main()
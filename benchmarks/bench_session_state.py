@@ -0,0 +1,160 @@
+"""Bytes per session and milliseconds per rerun as history grows.
+
+Runs app.py headless with Streamlit's AppTest in a scratch directory. For
+each history size a fresh session is seeded with that many history rows,
+runs ``--downloads`` demo downloads, then reruns ``--reruns`` times. It
+reports:
+
+- the full-rerun time;
+- the time of the History and Playlists tab bodies (what a fragment rerun
+  of that tab costs, from the app's own metrics);
+- the size of the session's ``st.session_state``.
+
+A second table compares the container size of the records the app keeps
+(HistoryRecord, TrackedJob) with the dicts they replaced. A finished
+TrackedJob points at the HistoryRecord the store wrote rather than holding
+its own copy of the file info.
+
+    python -m benchmarks.bench_session_state
+"""
+import argparse
+import datetime
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+
+
+def deep_size(obj, seen=None):
+    """Bytes held by ``obj`` and everything it references (objects counted once)"""
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_size(k, seen) + deep_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_size(item, seen) for item in obj)
+    elif hasattr(obj, "__slots__"):
+        size += sum(deep_size(getattr(obj, name, None), seen) for name in obj.__slots__)
+    elif hasattr(obj, "__dict__"):
+        size += deep_size(vars(obj), seen)
+    return size
+
+
+def history_row(n, start):
+    return {
+        'title': f"Vimeo Content {n}",
+        'platform': "Vimeo",
+        'url': f"https://vimeo.com/{n}",
+        'time': (start + datetime.timedelta(minutes=n)).strftime("%Y-%m-%d %H:%M:%S"),
+        'file': f"downloads/vimeo_content_{n}.mp4",
+        'format': "MP4",
+        'type': "video",
+        'file_size': 12.5,
+        'thumbnail': None,
+    }
+
+
+def seed_sessions(path, sizes):
+    """One session per size; written before the app opens the database (its store hands out IDs)"""
+    from utils.history_tracker import HistoryStore
+
+    store = HistoryStore(path=path)
+    start = datetime.datetime(2024, 1, 1)
+    sessions = []
+    for size in sizes:
+        session_id = uuid.uuid4().hex
+        for n in range(size):
+            store.add_history(session_id, history_row(n, start))
+        sessions.append(session_id)
+    store.flush()
+    return sessions
+
+
+def run_session(session_id, downloads, reruns):
+    from streamlit.testing.v1 import AppTest
+    from utils.metrics import get_metrics
+
+    at = AppTest.from_file(APP, default_timeout=60)
+    at.query_params["sid"] = session_id
+    at.run()
+    for n in range(downloads):
+        at.text_input(key="url_input").set_value(f"https://vimeo.com/example{n}").run()
+        next(b for b in at.button if "Download Media" in b.label).click().run()
+    time.sleep(0.5)
+
+    metrics = get_metrics()
+    metrics.reset()
+    times = []
+    for _ in range(reruns):
+        begin = time.perf_counter()
+        at.run()
+        times.append(time.perf_counter() - begin)
+    assert not at.exception, [e.value for e in at.exception]
+
+    stages = {h['name']: h for h in metrics.snapshot()['histograms']}
+    tab_ms = [stages[f"render_{tab}_seconds"]['p50_ms'] if f"render_{tab}_seconds" in stages else float("nan")
+              for tab in ("history", "playlists")]
+    state_bytes = deep_size(dict(at.session_state.items()))
+    return statistics.median(times) * 1000, tab_ms, state_bytes
+
+
+def record_sizes():
+    from utils.history_tracker import HistoryRecord
+    from utils.job_queue import TrackedJob
+
+    row = dict(history_row(1, datetime.datetime(2024, 1, 1)), id=1, session_id=uuid.uuid4().hex, ts=1.7e9)
+    record = HistoryRecord(**row)
+    job = TrackedJob(1, row['url'], "Vimeo", format="MP4", type="video")
+    job.record, job.content_type = record, "video/mp4"
+    legacy_job = {
+        'job_id': 1, 'url': row['url'], 'format': "MP4", 'platform': "Vimeo", 'type': "video",
+        'recorded': True, 'history_id': 1, 'file': row['file'],
+        'file_info': {'file_size': 12.5, 'content_type': "video/mp4", 'platform': "Vimeo", 'thumbnail': None},
+    }
+    # Keys and field values are the same (often interned) objects in both shapes; count the containers
+    shared = {id(obj) for d in (row, legacy_job, legacy_job['file_info'])
+              for item in d.items() for obj in item if not isinstance(obj, dict)}
+    return [
+        ("history row", deep_size(row, set(shared)), deep_size(record, set(shared))),
+        ("finished job", deep_size(legacy_job, set(shared)), deep_size(job, set(shared | {id(record)}))),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="0,100,1000,10000")
+    parser.add_argument("--downloads", type=int, default=3, help="demo downloads per session")
+    parser.add_argument("--reruns", type=int, default=10)
+    args = parser.parse_args()
+
+    root = os.path.dirname(APP)
+    sys.path.insert(0, root)
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        os.environ["MEDIA_DOWNLOADER_METRICS"] = "1"
+        os.environ["MEDIA_DOWNLOADER_DB"] = os.path.join(tmp, "history.db")
+        sizes = [int(n) for n in args.sizes.split(",")]
+        sessions = seed_sessions(os.environ["MEDIA_DOWNLOADER_DB"], sizes)
+
+        print(f"{args.downloads} downloads per session, median of {args.reruns} reruns\n")
+        print(f"{'history rows':>13} {'rerun ms':>9} {'history tab ms':>15} {'playlists tab ms':>17} "
+              f"{'session bytes':>14}")
+        for size, session_id in zip(sizes, sessions):
+            rerun_ms, (history_ms, playlists_ms), state_bytes = run_session(session_id, args.downloads, args.reruns)
+            print(f"{size:>13} {rerun_ms:>9.1f} {history_ms:>15.2f} {playlists_ms:>17.2f} {state_bytes:>14,}")
+
+        print(f"\n{'record':>13} {'dict bytes':>11} {'slots bytes':>12}")
+        for name, as_dict, as_slots in record_sizes():
+            print(f"{name:>13} {as_dict:>11} {as_slots:>12}")
+        os.chdir(root)
+
+
+if __name__ == "__main__":
+    main()
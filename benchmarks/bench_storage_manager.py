@@ -0,0 +1,112 @@
+"""Cost of keeping downloads/ under quota: indexed sweeps vs directory scans.
+
+Creates ``--files`` small files (half referenced by a history record),
+registers them with a StorageManager and measures ``track``, a sweep that
+has nothing to do, a sweep that evicts down to quota, an orphan sweep and
+a restart from the journal, next to one stat-everything scan of the same
+directory (what a scan-based cleaner pays on every pass).
+
+    python -m benchmarks.bench_storage_manager
+"""
+import argparse
+import datetime
+import os
+import tempfile
+import time
+
+from utils.history_tracker import HistoryStore
+from utils.storage_manager import StorageManager
+
+
+def full_scan(root):
+    entries = []
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            stat = os.stat(path)
+            entries.append((stat.st_atime, stat.st_size, path))
+    entries.sort()
+    return entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=20_000)
+    parser.add_argument("--size", type=int, default=4096, help="bytes per file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = os.path.join(tmp, "downloads")
+        os.makedirs(root)
+        store = HistoryStore(path=os.path.join(tmp, "history.db"))
+        payload = os.urandom(args.size)
+        paths = []
+        now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        for n in range(args.files):
+            path = os.path.join(root, f"vimeo_content_{n}.mp4")
+            with open(path, "wb") as f:
+                f.write(payload)
+            paths.append(path)
+            if n % 2 == 0:
+                store.add_history("bench", {
+                    'title': f"content {n}", 'platform': "Vimeo", 'url': f"https://vimeo.com/{n}",
+                    'time': now, 'file': path, 'format': "MP4", 'type': "video", 'file_size': 0.0,
+                })
+        store.flush()
+
+        manager = StorageManager(root=root, max_bytes=args.files * args.size, grace_period=0)
+        start = time.perf_counter()
+        for path in paths:
+            manager.track(path)
+        track_us = (time.perf_counter() - start) / len(paths) * 1e6
+
+        start = time.perf_counter()
+        full_scan(root)
+        scan_ms = (time.perf_counter() - start) * 1000
+
+        # First sweep appends the journal of every track() above
+        start = time.perf_counter()
+        manager.sweep()
+        journal_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        idle = manager.sweep()
+        idle_ms = (time.perf_counter() - start) * 1000
+
+        manager.max_bytes = int(args.files * args.size * 0.9)
+        start = time.perf_counter()
+        evicted = manager.sweep()
+        evict_ms = (time.perf_counter() - start) * 1000
+
+        manager.referenced = store.referenced_files
+        start = time.perf_counter()
+        orphans = manager.sweep()
+        orphan_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        repeat = manager.sweep()
+        repeat_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        reloaded = StorageManager(root=root, max_bytes=manager.max_bytes, grace_period=0)
+        reload_ms = (time.perf_counter() - start) * 1000
+
+        stats = manager.stats()
+        left = sum(1 for path in paths if os.path.exists(path))
+        assert reloaded.stats()['files'] == stats['files'] and reloaded.stats()['bytes'] == stats['bytes']
+        print(f"{args.files} files of {args.size} B, half referenced by history\n")
+        print(f"{'operation':>26} {'ms':>9} {'removed':>8}")
+        print(f"{'track (per file, us)':>26} {track_us:>9.1f} {'':>8}")
+        print(f"{'full directory scan':>26} {scan_ms:>9.1f} {'':>8}")
+        print(f"{'sweep, journal flush':>26} {journal_ms:>9.1f} {'':>8}")
+        print(f"{'sweep, nothing to do':>26} {idle_ms:>9.1f} {len(idle):>8}")
+        print(f"{'sweep, evict to 90% quota':>26} {evict_ms:>9.1f} {len(evicted):>8}")
+        print(f"{'sweep, orphan GC':>26} {orphan_ms:>9.1f} {len(orphans):>8}")
+        print(f"{'sweep, orphans checked':>26} {repeat_ms:>9.1f} {len(repeat):>8}")
+        print(f"{'restart from journal':>26} {reload_ms:>9.1f} {'':>8}")
+        print(f"\nleft on disk: {left} files, index: {stats['files']} files / {stats['bytes']} B "
+              f"(quota {manager.max_bytes} B), evicted: {stats['evicted']}")
+
+
+if __name__ == "__main__":
+    main()
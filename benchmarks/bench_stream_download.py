@@ -0,0 +1,103 @@
+"""Throughput and peak RSS of the streaming download engine.
+
+Files of growing size are fetched from the local fixture server, each in a
+fresh child process so its peak RSS is measured in isolation. A flat RSS
+column is the goal. Two resume runs follow, each from a transfer cut off
+halfway: one checks that the partial file is completed with a Range
+request and matches the source, the other replaces the source in between
+and checks that the download starts over instead of splicing old and new
+bytes.
+
+    python -m benchmarks.bench_stream_download
+"""
+import argparse
+import filecmp
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+
+from benchmarks.fixture_server import make_file, serve
+from utils.downloader import fetch_to_file
+
+MB = 1024 * 1024
+
+
+def _child(url, dest, results):
+    start = time.perf_counter()
+    info = fetch_to_file(url, dest)
+    elapsed = time.perf_counter() - start
+    # ru_maxrss is KiB on Linux
+    results.put((info['bytes'], elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+
+
+def measure(url, dest):
+    results = multiprocessing.Queue()
+    proc = multiprocessing.Process(target=_child, args=(url, dest, results))
+    proc.start()
+    out = results.get()
+    proc.join()
+    return out
+
+
+class Interrupted(Exception):
+    pass
+
+
+def interrupted_fetch(url, dest, stop_at):
+    """Start a transfer and cut it off after ``stop_at`` bytes, leaving the partial file"""
+    def progress(done, total):
+        if done >= stop_at:
+            raise Interrupted()
+
+    try:
+        fetch_to_file(url, dest, progress=progress, chunk_size=64 * 1024)
+    except Interrupted:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="8,64,256", help="file sizes in MB")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        src = os.path.join(root, "src")
+        out = os.path.join(root, "out")
+        os.makedirs(src)
+        os.makedirs(out)
+
+        sizes = [int(s) for s in args.sizes.split(",")]
+        for size in sizes:
+            make_file(os.path.join(src, f"{size}.mp4"), size * MB)
+
+        with serve(src) as base:
+            print(f"{'size MB':>8} {'seconds':>8} {'MB/s':>8} {'peak RSS MB':>12}")
+            for size in sizes:
+                dest = os.path.join(out, f"{size}.mp4")
+                nbytes, elapsed, rss = measure(f"{base}/{size}.mp4", dest)
+                assert nbytes == size * MB, (nbytes, size)
+                print(f"{size:>8} {elapsed:>8.2f} {size / elapsed:>8.1f} {rss:>12.1f}")
+                os.remove(dest)
+
+            size = sizes[0]
+            source = os.path.join(src, f"{size}.mp4")
+            dest = os.path.join(out, "resume.mp4")
+            url = f"{base}/{size}.mp4"
+            interrupted_fetch(url, dest, size * MB // 2)
+            info = fetch_to_file(url, dest)
+            ok = info['resumed'] and filecmp.cmp(source, dest, shallow=False)
+            print(f"resume from 50%: {'ok' if ok else 'FAILED'}")
+
+            os.remove(dest)
+            interrupted_fetch(url, dest, size * MB // 2)
+            time.sleep(0.01)
+            make_file(source, size * MB)
+            info = fetch_to_file(url, dest)
+            ok = not info['resumed'] and filecmp.cmp(source, dest, shallow=False)
+            print(f"source changed before resuming: {'restarted ok' if ok else 'FAILED'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Conversions per minute and CPU use of the ffmpeg transcoding pool.
+
+Test clips are generated locally with ffmpeg's lavfi sources, then each
+job mix (MP3 extraction, Medium/Low re-encodes, High stream copy) runs
+through ``Transcoder`` at several pool sizes. CPU use is the ffmpeg
+children's user+sys time over wall time (1.0 = one core busy).
+
+    python -m benchmarks.bench_transcode
+"""
+import argparse
+import os
+import resource
+import subprocess
+import tempfile
+import time
+
+from utils.format_converter import Transcoder, ffmpeg_binary
+
+JOBS = [("MP3", "Medium"), ("MP4", "Medium"), ("MP4", "Low"), ("MP4", "High")]
+
+
+def make_clip(path, seconds, size="1280x720"):
+    subprocess.run([
+        ffmpeg_binary(), "-hide_banner", "-loglevel", "error", "-y",
+        "-f", "lavfi", "-i", f"testsrc=size={size}:rate=25",
+        "-f", "lavfi", "-i", "sine=frequency=440",
+        "-t", str(seconds), "-c:v", "libx264", "-preset", "ultrafast", "-c:a", "aac",
+        "-shortest", path,
+    ], check=True)
+    return path
+
+
+def children_cpu():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clips", type=int, default=4)
+    parser.add_argument("--seconds", type=int, default=5)
+    parser.add_argument("--pools", default="1,2,4")
+    args = parser.parse_args()
+
+    if ffmpeg_binary() is None:
+        raise SystemExit("ffmpeg not found (install it or set FFMPEG_BINARY)")
+
+    with tempfile.TemporaryDirectory() as root:
+        clips = [make_clip(os.path.join(root, f"clip{i}.mp4"), args.seconds) for i in range(args.clips)]
+
+        print(f"{'pool':>5} {'format':>7} {'quality':>8} {'jobs':>5} {'conv/min':>9} {'cpu':>6}")
+        for pool in (int(n) for n in args.pools.split(",")):
+            transcoder = Transcoder(max_processes=pool, threads_per_process=1)
+            for format_type, quality in JOBS:
+                ext = format_type.lower()
+                cpu_before = children_cpu()
+                start = time.perf_counter()
+                futures = [
+                    transcoder.submit(clip, os.path.join(root, f"out{i}.{ext}"), format_type, quality)
+                    for i, clip in enumerate(clips)
+                ]
+                for future in futures:
+                    future.result()
+                wall = time.perf_counter() - start
+                cpu = (children_cpu() - cpu_before) / wall
+                print(f"{pool:>5} {format_type:>7} {quality:>8} {len(clips):>5} "
+                      f"{len(clips) / wall * 60:>9.0f} {cpu:>6.2f}")
+            transcoder.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""Local HTTP stand-in for the media platforms.
+
+Serves files from a directory with keep-alive, single-range ``Range`` and
+``If-Range`` support (which ``http.server.SimpleHTTPRequestHandler``
+lacks), so the download engine can be exercised without touching the
+network.
+"""
+import contextlib
+import os
+import re
+import sys
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from functools import partial
+from urllib.parse import urlsplit
+
+from requests.adapters import HTTPAdapter
+
+RANGE_RE = re.compile(r"bytes=(\d*)-(\d*)$")
+
+
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.latency:
+            time.sleep(self.latency)
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return
+        stat = os.stat(path)
+        size = stat.st_size
+        etag = f'"{stat.st_mtime_ns:x}-{size:x}"'
+        start, end = 0, size - 1
+        status = 200
+
+        match = RANGE_RE.match(self.headers.get("Range", ""))
+        # A stale If-Range validator means the client's bytes are from another version: send it all
+        if_range = self.headers.get("If-Range")
+        if if_range is not None and if_range != etag:
+            match = None
+        if match and (match.group(1) or match.group(2)):
+            if match.group(1):
+                start = int(match.group(1))
+                end = int(match.group(2)) if match.group(2) else size - 1
+            else:
+                start = max(size - int(match.group(2)), 0)
+            end = min(end, size - 1)
+            if start >= size or start > end:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            status = 206
+
+        self.send_response(status)
+        self.send_header("Content-Type", self.guess_type(path))
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", self.date_time_string(stat.st_mtime))
+        self.send_header("Content-Length", str(end - start + 1))
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.end_headers()
+
+        with open(path, "rb") as f:
+            f.seek(start)
+            self._copy(f, end - start + 1)
+
+    # Per-connection bandwidth cap in bytes/sec, None for unlimited
+    rate_limit = None
+    # Seconds before each response starts (a distant CDN edge), None for none
+    latency = None
+
+    def _copy(self, f, remaining):
+        block = 64 * 1024
+        start = time.perf_counter()
+        sent = 0
+        while remaining > 0:
+            chunk = f.read(min(block, remaining))
+            if not chunk:
+                break
+            self.wfile.write(chunk)
+            remaining -= len(chunk)
+            sent += len(chunk)
+            if self.rate_limit:
+                ahead = sent / self.rate_limit - (time.perf_counter() - start)
+                if ahead > 0:
+                    time.sleep(ahead)
+
+
+def throttled(rate_limit, handler=RangeRequestHandler, latency=None):
+    """Handler class whose every connection is capped at ``rate_limit`` bytes/sec"""
+    return type("ThrottledRangeRequestHandler", (handler,), {'rate_limit': rate_limit, 'latency': latency})
+
+
+def rate_limited(requests_per_sec, burst=1, status=429, retry_after=1, handler=RangeRequestHandler):
+    """Handler class that answers ``status`` + Retry-After once its request budget is spent.
+
+    The budget is a token bucket shared by every connection to the server,
+    like a platform's per-client limit. ``stats`` counts served and
+    rejected requests.
+    """
+    lock = threading.Lock()
+    bucket = {'tokens': float(burst), 'stamp': time.monotonic()}
+    stats = {'served': 0, 'rejected': 0}
+
+    class RateLimitedRequestHandler(handler):
+        def do_GET(self):
+            with lock:
+                now = time.monotonic()
+                bucket['tokens'] = min(burst, bucket['tokens'] + (now - bucket['stamp']) * requests_per_sec)
+                bucket['stamp'] = now
+                allowed = bucket['tokens'] >= 1
+                if allowed:
+                    bucket['tokens'] -= 1
+                stats['served' if allowed else 'rejected'] += 1
+            if allowed:
+                super().do_GET()
+                return
+            self.send_response(status)
+            if retry_after is not None:
+                self.send_header("Retry-After", str(retry_after))
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+    RateLimitedRequestHandler.stats = stats
+    return RateLimitedRequestHandler
+
+
+class FixtureServer(ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        # Clients that hang up mid-body (interrupted or killed downloads) are expected here
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+@contextlib.contextmanager
+def serve(directory, handler=RangeRequestHandler):
+    """Run a threaded server for ``directory`` and yield its base URL"""
+    server = FixtureServer(("127.0.0.1", 0), partial(handler, directory=directory))
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+class FixtureAdapter(HTTPAdapter):
+    """requests transport that sends every request it is mounted for to the fixture server"""
+
+    def __init__(self, base, **kwargs):
+        super().__init__(**kwargs)
+        self.base = base
+
+    def send(self, request, **kwargs):
+        parts = urlsplit(request.url)
+        request.url = self.base + parts.path + (f"?{parts.query}" if parts.query else "")
+        return super().send(request, **kwargs)
+
+
+def route_hosts(session, base, hosts):
+    """Point ``https://<host>/`` for each of ``hosts`` at the fixture server on ``session``"""
+    adapter = FixtureAdapter(base)
+    for host in hosts:
+        session.mount(f"https://{host}/", adapter)
+        session.mount(f"http://{host}/", adapter)
+    return adapter
+
+
+def make_file(path, size, block=1024 * 1024):
+    """Write ``size`` bytes of non-repeating-ish data without holding it in memory"""
+    pattern = os.urandom(block)
+    with open(path, "wb") as f:
+        remaining = size
+        while remaining > 0:
+            n = min(block, remaining)
+            f.write(pattern[:n])
+            remaining -= n
+    return path
+
+
+def make_hls(directory, heights=(1080, 720, 480), segments=20, segment_size=256 * 1024, duration=4):
+    """Write a master playlist with one media playlist of random segments per height.
+
+    Returns the master playlist's file name. The segments are not decodable
+    media; they exercise parsing and transfer, not remuxing.
+    """
+    lines = ["#EXTM3U"]
+    for height in heights:
+        name = f"{height}p"
+        os.makedirs(os.path.join(directory, name), exist_ok=True)
+        media = ["#EXTM3U", "#EXT-X-VERSION:3", f"#EXT-X-TARGETDURATION:{duration}",
+                 "#EXT-X-PLAYLIST-TYPE:VOD"]
+        for n in range(segments):
+            make_file(os.path.join(directory, name, f"seg{n:05d}.ts"), segment_size)
+            media += [f"#EXTINF:{duration}.0,", f"seg{n:05d}.ts"]
+        media.append("#EXT-X-ENDLIST")
+        with open(os.path.join(directory, name, "index.m3u8"), "w") as f:
+            f.write("\n".join(media) + "\n")
+        bandwidth = segment_size * 8 // duration
+        lines += [f"#EXT-X-STREAM-INF:BANDWIDTH={bandwidth},RESOLUTION={height * 16 // 9}x{height}",
+                  f"{name}/index.m3u8"]
+    with open(os.path.join(directory, "master.m3u8"), "w") as f:
+        f.write("\n".join(lines) + "\n")
+    return "master.m3u8"
+
+
+def make_dash(directory, heights=(1080, 720, 480), segments=20, segment_size=256 * 1024, duration=4):
+    """Write a SegmentTemplate MPD with random segments per height; returns its file name"""
+    representations = []
+    for height in heights:
+        rep_id = f"v{height}"
+        os.makedirs(os.path.join(directory, rep_id), exist_ok=True)
+        make_file(os.path.join(directory, rep_id, "init.mp4"), 1024)
+        for n in range(1, segments + 1):
+            make_file(os.path.join(directory, rep_id, f"{n}.m4s"), segment_size)
+        representations.append(
+            f'<Representation id="{rep_id}" bandwidth="{segment_size * 8 // duration}" '
+            f'width="{height * 16 // 9}" height="{height}"/>'
+        )
+    mpd = (
+        '<?xml version="1.0"?>\n'
+        '<MPD xmlns="urn:mpeg:dash:schema:mpd:2011" type="static" '
+        f'mediaPresentationDuration="PT{segments * duration}S">'
+        '<Period><AdaptationSet contentType="video" mimeType="video/mp4">'
+        f'<SegmentTemplate timescale="1" duration="{duration}" startNumber="1" '
+        'initialization="$RepresentationID$/init.mp4" media="$RepresentationID$/$Number$.m4s"/>'
+        + "".join(representations) +
+        "</AdaptationSet></Period></MPD>\n"
+    )
+    with open(os.path.join(directory, "manifest.mpd"), "w") as f:
+        f.write(mpd)
+    return "manifest.mpd"
@@ -0,0 +1,5 @@
+"""Helper modules used by the Media Downloader Pro Streamlit app.
+
+Everything in this package is importable without Streamlit so the pieces
+can be exercised from the scripts in ``benchmarks/``.
+"""
@@ -0,0 +1,92 @@
+"""Bulk URL ingestion: parsing, grouping, concurrent analysis and ZIP export."""
+import csv
+import io
+import os
+import re
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+URL_RE = re.compile(r"https?://[^\s,;\"'<>]+", re.IGNORECASE)
+MAX_BULK_URLS = 500
+
+
+def parse_url_list(text, limit=MAX_BULK_URLS):
+    """Unique http(s) URLs from pasted text, in the order they appear.
+
+    Returns ``(urls, dropped)``: at most ``limit`` URLs, and how many
+    more were found past the limit.
+    """
+    seen = OrderedDict()
+    for match in URL_RE.finditer(text or ""):
+        seen.setdefault(match.group(0).rstrip(").]"), None)
+    urls = list(seen)
+    return urls[:limit], max(0, len(urls) - limit)
+
+
+def read_uploaded_text(name, data):
+    """Text to look for URLs in from an uploaded .txt or .csv file (``data`` is bytes)"""
+    text = data.decode("utf-8", errors="replace")
+    if name.lower().endswith(".csv"):
+        cells = (cell for row in csv.reader(io.StringIO(text)) for cell in row)
+        text = "\n".join(cells)
+    return text
+
+
+def group_by_platform(urls, detect):
+    """``{platform name: [urls]}`` keeping first-seen platform order"""
+    groups = OrderedDict()
+    for url in urls:
+        groups.setdefault(detect(url)["name"], []).append(url)
+    return groups
+
+
+def analyze_all(urls, get_info, max_workers=8):
+    """Run ``get_info`` for every URL concurrently; returns ``[(url, info)]`` in input order"""
+    if not urls:
+        return []
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(urls)), thread_name_prefix="analyze") as pool:
+        return list(zip(urls, pool.map(get_info, urls)))
+
+
+def fit_in_budget(paths, byte_budget):
+    """Split existing ``paths`` into ``(fits, left_out)``, taking files in order while their sizes fit"""
+    fits, left_out = [], []
+    total = 0
+    for path in paths:
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            continue
+        if total + size <= byte_budget:
+            fits.append(path)
+            total += size
+        else:
+            left_out.append(path)
+    return fits, left_out
+
+
+def write_zip(paths, dest):
+    """Write ``paths`` into a ZIP at ``dest`` one file at a time.
+
+    Members are stored rather than deflated (media is already compressed)
+    and ``ZipFile.write`` copies each file in chunks, so memory use does not
+    depend on the size of the batch.
+    """
+    os.makedirs(os.path.dirname(dest) or ".", exist_ok=True)
+    tmp = dest + ".part"
+    used = set()
+    with zipfile.ZipFile(tmp, "w", compression=zipfile.ZIP_STORED, allowZip64=True) as zf:
+        for path in paths:
+            if not os.path.exists(path):
+                continue
+            arcname = os.path.basename(path)
+            stem, ext = os.path.splitext(arcname)
+            n = 1
+            while arcname in used:
+                arcname = f"{stem}_{n}{ext}"
+                n += 1
+            used.add(arcname)
+            zf.write(path, arcname)
+    os.replace(tmp, dest)
+    return dest
@@ -0,0 +1,283 @@
+"""Content-addressed cache for finished downloads.
+
+Requests are keyed by normalized URL + format + quality. Each key points
+at a SHA-256 content object in a sharded store (``objects/ab/cd/<hash>``),
+so identical bytes fetched through different URLs are stored once. Files
+handed to the UI are hard links to the object, which makes a cache hit a
+metadata operation with no refetch and no copy. Keys are evicted in LRU
+order once the store exceeds its byte budget; an object is removed when
+the last key referencing it goes. Sessions of one process that request the
+same key at the same time are serialized with ``fetching(key)``, so only
+the first one downloads and the others reuse its object.
+
+With several replicas each one keeps its own store and publishes what it
+adds to a shared file index (``utils.shared_state``). A key another
+replica stored is adopted by hard-linking that replica's object, so a
+download one replica made is never fetched again by the others.
+"""
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qsl, urlencode, urlparse, urlunparse
+
+DEFAULT_MAX_BYTES = 2 * 1024 * 1024 * 1024
+HASH_BLOCK = 1024 * 1024
+
+# Query parameters that never change what gets downloaded
+TRACKING_PARAMS = {"fbclid", "gclid", "igshid", "si", "feature", "ref", "ref_src", "share_id"}
+
+
+def normalize_url(url):
+    """Canonical form of a media URL so trivially different links share a key"""
+    parsed = urlparse(url.strip())
+    host = (parsed.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    if parsed.port and parsed.port not in (80, 443):
+        host = f"{host}:{parsed.port}"
+    query = sorted(
+        (k, v) for k, v in parse_qsl(parsed.query, keep_blank_values=True)
+        if k not in TRACKING_PARAMS and not k.startswith("utm_")
+    )
+    path = parsed.path.rstrip("/") or "/"
+    return urlunparse(("https" if parsed.scheme in ("http", "https") else parsed.scheme,
+                       host, path, "", urlencode(query), ""))
+
+
+def cache_key(url, format_type, quality):
+    raw = f"{normalize_url(url)}|{format_type}|{quality}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def file_digest(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def link_or_copy(src, dst):
+    """Hard link ``src`` to ``dst``, copying when the filesystem refuses"""
+    os.makedirs(os.path.dirname(dst) or ".", exist_ok=True)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+class DownloadCache:
+    """Sharded content store plus an LRU index of request keys"""
+
+    def __init__(self, root="downloads/.cache", max_bytes=DEFAULT_MAX_BYTES, shared=None, owner=None):
+        self.root = root
+        self.max_bytes = max_bytes
+        # Shared backend with publish_file/lookup_file/discard_file, None for a single replica
+        self.shared = shared
+        self.owner = owner
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._keys = OrderedDict()   # key -> {'object', 'size', 'meta', 'atime'}
+        self._refs = {}              # object hash -> number of keys using it
+        self._sizes = {}             # object hash -> bytes
+        self._bytes = 0
+        self._fetching = {}          # key -> [lock, number of sessions holding or waiting for it]
+        os.makedirs(os.path.join(root, "objects"), exist_ok=True)
+        self._load()
+
+    # ----------------------
+    # public API
+    # ----------------------
+    def object_path(self, digest):
+        return os.path.join(self.root, "objects", digest[:2], digest[2:4], digest)
+
+    def lookup(self, key):
+        """Return the entry for ``key`` (and count a hit) or None (a miss)"""
+        with self._lock:
+            entry = self._keys.get(key)
+            if entry is not None and not self._object_intact(entry):
+                self._drop_key_locked(key)
+                entry = None
+            if entry is None and self.shared is not None:
+                entry = self._adopt_shared_locked(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._keys.move_to_end(key)
+            entry['atime'] = time.time()
+            self.hits += 1
+            return dict(entry)
+
+    def adopt(self, key):
+        """Entry for ``key`` if another session or replica stored it meanwhile; not counted as a hit or miss"""
+        with self._lock:
+            entry = self._keys.get(key)
+            if entry is not None and not self._object_intact(entry):
+                self._drop_key_locked(key)
+                entry = None
+            if entry is None and self.shared is not None:
+                entry = self._adopt_shared_locked(key)
+            if entry is None:
+                return None
+            self._keys.move_to_end(key)
+            entry['atime'] = time.time()
+            return dict(entry)
+
+    @contextlib.contextmanager
+    def fetching(self, key):
+        """Hold ``key`` while this process downloads it; other sessions asking for it wait here"""
+        with self._lock:
+            slot = self._fetching.setdefault(key, [threading.Lock(), 0])
+            slot[1] += 1
+        try:
+            with slot[0]:
+                yield
+        finally:
+            with self._lock:
+                slot[1] -= 1
+                if not slot[1]:
+                    del self._fetching[key]
+
+    def _object_intact(self, entry):
+        """The object exists and still has its stored size (a stat, not a rehash)"""
+        try:
+            return os.path.getsize(self.object_path(entry['object'])) == entry['size']
+        except OSError:
+            return False
+
+    def materialize(self, entry, dest):
+        """Expose a cached object at ``dest`` (normally a hard link, no copy)"""
+        link_or_copy(self.object_path(entry['object']), dest)
+        return dest
+
+    def put(self, key, path, meta=None, digest=None):
+        """Adopt the finished file at ``path`` into the store under ``key``.
+
+        ``path`` is replaced by a hard link to the stored object, so the
+        bytes live on disk once however many keys or history rows use them.
+        """
+        digest = digest or file_digest(path)
+        obj = self.object_path(digest)
+        size = os.path.getsize(path)
+        with self._lock:
+            if os.path.exists(obj) and os.path.getsize(obj) == size:
+                # Same content already stored: point the new file at it
+                tmp = f"{path}.dedup"
+                link_or_copy(obj, tmp)
+                os.replace(tmp, path)
+            else:
+                # New content, or a stored object that was truncated since: adopt these bytes
+                self._store_object_locked(path, obj)
+            self._add_key_locked(key, digest, size, meta or {})
+            if self.shared is not None:
+                self.shared.publish_file(key, obj, digest, size, meta or {}, self.owner)
+        return digest
+
+    def update_meta(self, key, **meta):
+        """Attach extra metadata (e.g. a thumbnail path) to an existing key"""
+        with self._lock:
+            entry = self._keys.get(key)
+            if entry is not None:
+                entry['meta'].update(meta)
+                self._save_locked()
+                if self.shared is not None:
+                    self.shared.publish_file(key, self.object_path(entry['object']), entry['object'],
+                                             entry['size'], entry['meta'], self.owner)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'keys': len(self._keys),
+                'objects': len(self._refs),
+                'bytes': self._bytes,
+            }
+
+    # ----------------------
+    # internals
+    # ----------------------
+    @property
+    def _index_path(self):
+        return os.path.join(self.root, "index.json")
+
+    def _store_object_locked(self, src, obj):
+        os.makedirs(os.path.dirname(obj), exist_ok=True)
+        tmp = f"{obj}.tmp"
+        link_or_copy(src, tmp)
+        os.replace(tmp, obj)
+
+    def _add_key_locked(self, key, digest, size, meta):
+        if key in self._keys:
+            self._drop_key_locked(key, remove_objects=self._keys[key]['object'] != digest)
+        self._keys[key] = {'object': digest, 'size': size, 'meta': meta, 'atime': time.time()}
+        self._add_ref_locked(digest, size)
+        self._evict_locked()
+        self._save_locked()
+
+    def _adopt_shared_locked(self, key):
+        """Link the object a peer published for ``key`` into this store; None if there is none"""
+        record = self.shared.lookup_file(key)
+        if record is None:
+            return None
+        try:
+            intact = os.path.getsize(record['path']) == record['size']
+        except OSError:
+            intact = False
+        if not intact:
+            # Evicted or damaged on the replica that published it
+            self.shared.discard_file(key, record['path'])
+            return None
+        obj = self.object_path(record['digest'])
+        if obj != record['path'] and not (os.path.exists(obj) and os.path.getsize(obj) == record['size']):
+            self._store_object_locked(record['path'], obj)
+        self._add_key_locked(key, record['digest'], record['size'], record['meta'])
+        return self._keys.get(key)
+
+    def _load(self):
+        try:
+            with open(self._index_path) as f:
+                keys = json.load(f)
+        except (OSError, ValueError):
+            return
+        for key, entry in sorted(keys.items(), key=lambda kv: kv[1]['atime']):
+            if os.path.exists(self.object_path(entry['object'])):
+                self._keys[key] = entry
+                self._add_ref_locked(entry['object'], entry['size'])
+
+    def _save_locked(self):
+        tmp = self._index_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self._keys, f)
+        os.replace(tmp, self._index_path)
+
+    def _add_ref_locked(self, digest, size):
+        if digest not in self._refs:
+            self._refs[digest] = 0
+            self._sizes[digest] = size
+            self._bytes += size
+        self._refs[digest] += 1
+
+    def _drop_key_locked(self, key, remove_objects=True):
+        entry = self._keys.pop(key)
+        digest = entry['object']
+        self._refs[digest] -= 1
+        if self._refs[digest] <= 0:
+            del self._refs[digest]
+            self._bytes -= self._sizes.pop(digest)
+            if remove_objects:
+                try:
+                    os.remove(self.object_path(digest))
+                except FileNotFoundError:
+                    pass
+
+    def _evict_locked(self):
+        while self._bytes > self.max_bytes and len(self._keys) > 1:
+            oldest = next(iter(self._keys))
+            self._drop_key_locked(oldest)
@@ -0,0 +1,591 @@
+"""Streaming HTTP transfer engine.
+
+All downloads share one ``requests.Session`` so keep-alive connections are
+reused across jobs and sessions. Bodies are streamed to disk in fixed-size
+chunks, which keeps memory flat regardless of file size, and interrupted
+transfers resume from the partial file with an HTTP Range request. The
+first response's validator (ETag or Last-Modified) and length are kept next
+to the partial file; a resume sends it as ``If-Range`` and starts over when
+the remote file turns out to have changed, so old and new bytes are never
+spliced together.
+
+Every function takes an optional ``throttle`` (see ``utils.rate_limiter``)
+that is asked before each request and fed every chunk; 429/503 answers
+are retried after the server's Retry-After delay either way.
+
+Bodies are hashed (see ``utils.integrity``) as they are written, and the
+byte count is checked against Content-Length before the partial file is
+renamed into place; results carry ``digest``/``fast_digest``.
+
+``open_stream`` hands the body out as chunks instead, for a consumer that
+reads a stream (ffmpeg's stdin); nothing reaches the disk, so such a
+transfer cannot resume.
+"""
+import email.utils
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils.integrity import IntegrityError, StreamHasher, check_size, hash_file
+
+CHUNK_SIZE = 256 * 1024
+TIMEOUT = (10, 30)  # connect, read
+
+# Segmented mode: one Range request per segment, never smaller than this
+MIN_SEGMENT_SIZE = 8 * 1024 * 1024
+MAX_SEGMENTS = 8
+USER_AGENT = "MediaDownloaderPro/2.0"
+
+# 429/503 handling: retries allowed, and the longest Retry-After we will honour
+THROTTLE_STATUSES = {429, 503}
+THROTTLE_RETRIES = 5
+MAX_RETRY_AFTER = 120
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Process-wide pooled HTTP session"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=16, pool_maxsize=32)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                session.headers["User-Agent"] = USER_AGENT
+                _session = session
+    return _session
+
+
+def partial_path(dest):
+    return dest + ".part"
+
+
+def resume_state_path(partial):
+    """Where the validator and length of a partial download are kept"""
+    return partial + ".resume"
+
+
+class Throttled(Exception):
+    """The server answered 429/503; ``delay`` is how long it asked us to wait"""
+
+    def __init__(self, status, delay):
+        super().__init__(f"Server throttled the request (HTTP {status})")
+        self.status = status
+        self.delay = delay
+
+
+def retry_after_seconds(value, now=None):
+    """Parse a Retry-After header (delta-seconds or HTTP-date); None if absent/invalid"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - (time.time() if now is None else now))
+
+
+def _check_throttled(response):
+    if response.status_code in THROTTLE_STATUSES:
+        raise Throttled(response.status_code, retry_after_seconds(response.headers.get("Retry-After")))
+
+
+def _wait_throttled(error, attempt, throttle):
+    """Back off after a 429/503; raises once the retry budget is spent"""
+    if attempt > THROTTLE_RETRIES:
+        raise Exception(f"{error} and kept throttling after {THROTTLE_RETRIES} retries")
+    delay = error.delay
+    if delay is None:
+        # No Retry-After: exponential backoff with jitter
+        delay = min(MAX_RETRY_AFTER, 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+    elif delay > MAX_RETRY_AFTER:
+        raise Exception(f"{error}: asked to retry after {delay:.0f}s")
+    if throttle is not None:
+        # Pauses the whole platform; the wait happens in the next before_request()
+        throttle.backoff(delay)
+    else:
+        time.sleep(delay)
+
+
+def fetch_to_file(url, dest, progress=None, partial=None, chunk_size=CHUNK_SIZE,
+                  retries=3, session=None, timeout=TIMEOUT, throttle=None, hash_content=True):
+    """Stream ``url`` into ``dest``, resuming from ``partial`` if it exists.
+
+    ``progress(done_bytes, total_bytes)`` is called after every chunk. The
+    body is written to the partial file first and renamed into place once
+    complete, so ``dest`` never holds a truncated download. With
+    ``hash_content`` each chunk is hashed as it is written; a resumed
+    transfer hashes the bytes already on disk once, then streams on.
+    """
+    session = session or get_session()
+    partial = partial or partial_path(dest)
+    os.makedirs(os.path.dirname(partial) or ".", exist_ok=True)
+    hasher = StreamHasher() if hash_content else None
+
+    attempt = throttled = 0
+    while True:
+        offset = os.path.getsize(partial) if os.path.exists(partial) else 0
+        try:
+            result = _fetch_once(session, url, partial, offset, progress, chunk_size, timeout, throttle, hasher)
+            break
+        except Throttled as e:
+            throttled += 1
+            _wait_throttled(e, throttled, throttle)
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError):
+            attempt += 1
+            if attempt > retries:
+                raise
+
+    check_size(partial, result['bytes'])
+    os.replace(partial, dest)
+    _remove_quietly(resume_state_path(partial))
+    result['path'] = dest
+    if hasher is not None:
+        result.update(hasher.result())
+    return result
+
+
+def _hash_prefix(hasher, partial, offset):
+    """Bring ``hasher`` in line with the first ``offset`` bytes already in ``partial``"""
+    if hasher is not None and hasher.size != offset:
+        hasher.reset()
+        if offset:
+            hash_file(partial, hasher, offset)
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _discard_partial(partial):
+    _remove_quietly(partial)
+    _remove_quietly(resume_state_path(partial))
+
+
+def _read_resume_state(partial):
+    try:
+        with open(resume_state_path(partial)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_resume_state(partial, response, total):
+    etag = response.headers.get("ETag")
+    # If-Range only accepts a strong ETag; fall back to the modification date
+    validator = etag if etag and not etag.startswith("W/") else response.headers.get("Last-Modified")
+    with open(resume_state_path(partial), "w") as f:
+        json.dump({'validator': validator, 'total': total}, f)
+
+
+def _content_range(response):
+    """``(start, total)`` from a Content-Range header; None for the parts it lacks"""
+    spec = response.headers.get("Content-Range", "")
+    units, _, rest = spec.partition(" ")
+    span, _, total = rest.partition("/")
+    start = span.partition("-")[0]
+    if units != "bytes":
+        return None, None
+    return (int(start) if start.isdigit() else None), (int(total) if total.isdigit() else None)
+
+
+def _fetch_once(session, url, partial, offset, progress, chunk_size, timeout, throttle, hasher=None):
+    state = _read_resume_state(partial) if offset else None
+    if state is None:
+        # Without the first response's validator the bytes on disk cannot be trusted
+        offset = 0
+    headers = {}
+    if offset:
+        headers["Range"] = f"bytes={offset}-"
+        if state['validator']:
+            # The server sends the whole new body instead of a range if the file changed
+            headers["If-Range"] = state['validator']
+    if throttle is not None:
+        throttle.before_request()
+    with session.get(url, headers=headers, stream=True, timeout=timeout) as response:
+        _check_throttled(response)
+        if response.status_code == 416 and offset:
+            if _content_range(response)[1] == offset and state['total'] in (None, offset):
+                # Partial file already holds the whole body
+                _hash_prefix(hasher, partial, offset)
+                return {'bytes': offset, 'content_type': response.headers.get("Content-Type"), 'resumed': True}
+            # The remote file is now shorter than what we hold: it changed
+            restart = True
+        else:
+            response.raise_for_status()
+            resumed = offset > 0 and response.status_code == 206
+            start, total = _content_range(response)
+            restart = resumed and (start != offset or total is None
+                                   or state['total'] not in (None, total))
+            if not restart:
+                return _stream_body(response, partial, offset if resumed else 0, resumed,
+                                    progress, chunk_size, throttle, hasher)
+    # The range does not continue the bytes on disk; fetch the current file from the start
+    _discard_partial(partial)
+    return _fetch_once(session, url, partial, 0, progress, chunk_size, timeout, throttle, hasher)
+
+
+def _stream_body(response, partial, offset, resumed, progress, chunk_size, throttle, hasher):
+    _hash_prefix(hasher, partial, offset)
+    length = response.headers.get("Content-Length")
+    total = offset + int(length) if length is not None else None
+    if not resumed:
+        _write_resume_state(partial, response, total)
+
+    done = offset
+    if progress is not None:
+        progress(done, total)
+    with open(partial, "ab" if resumed else "wb") as f:
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            if not chunk:
+                continue
+            if throttle is not None:
+                throttle.consume(len(chunk))
+            f.write(chunk)
+            if hasher is not None:
+                hasher.update(chunk)
+            done += len(chunk)
+            if progress is not None:
+                progress(done, total)
+
+    if total is not None and done < total:
+        raise requests.exceptions.ChunkedEncodingError(
+            f"Connection closed after {done} of {total} bytes"
+        )
+    if total is not None and done > total:
+        _discard_partial(partial)
+        raise IntegrityError(f"Server sent {done} bytes, Content-Length promised {total}")
+    return {'bytes': done, 'content_type': response.headers.get("Content-Type"), 'resumed': resumed}
+
+
+class BodyStream:
+    """An open GET response, iterated as chunks; ``peek`` reads ahead without consuming"""
+
+    def __init__(self, response, progress, chunk_size, throttle):
+        self.response = response
+        self.content_type = response.headers.get("Content-Type")
+        length = response.headers.get("Content-Length")
+        self.total = int(length) if length is not None else None
+        self.bytes = 0
+        self._progress = progress
+        self._throttle = throttle
+        self._chunks = response.iter_content(chunk_size=chunk_size)
+        self._head = b""
+
+    def peek(self, size):
+        """Up to the first ``size`` bytes of the body; iteration still starts with them"""
+        while len(self._head) < size:
+            chunk = self._next()
+            if chunk is None:
+                break
+            self._head += chunk
+        return self._head[:size]
+
+    def __iter__(self):
+        if self._head:
+            head, self._head = self._head, b""
+            yield head
+        while True:
+            chunk = self._next()
+            if chunk is None:
+                break
+            yield chunk
+        if self.total is not None and self.bytes < self.total:
+            raise requests.exceptions.ChunkedEncodingError(
+                f"Connection closed after {self.bytes} of {self.total} bytes"
+            )
+        if self.total is not None and self.bytes > self.total:
+            raise IntegrityError(f"Server sent {self.bytes} bytes, Content-Length promised {self.total}")
+
+    def close(self):
+        self.response.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _next(self):
+        for chunk in self._chunks:
+            if not chunk:
+                continue
+            if self._throttle is not None:
+                self._throttle.consume(len(chunk))
+            self.bytes += len(chunk)
+            if self._progress is not None:
+                self._progress(self.bytes, self.total)
+            return chunk
+        return None
+
+
+def open_stream(url, progress=None, chunk_size=CHUNK_SIZE, retries=3, session=None, timeout=TIMEOUT,
+                throttle=None):
+    """GET ``url`` and return its body as a ``BodyStream`` (use it as a context manager).
+
+    Throttling and connection errors are retried until the body starts;
+    after that a failure raises from the iteration, since a consumer that
+    has read part of the stream cannot be rewound.
+    """
+    session = session or get_session()
+    attempt = throttled = 0
+    while True:
+        if throttle is not None:
+            throttle.before_request()
+        try:
+            response = session.get(url, stream=True, timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout):
+            attempt += 1
+            if attempt > retries:
+                raise
+            continue
+        try:
+            _check_throttled(response)
+            response.raise_for_status()
+        except Throttled as e:
+            response.close()
+            throttled += 1
+            _wait_throttled(e, throttled, throttle)
+            continue
+        except Exception:
+            response.close()
+            raise
+        return BodyStream(response, progress, chunk_size, throttle)
+
+
+def fetch_bytes(url, session=None, timeout=TIMEOUT, retries=3, throttle=None, byte_range=None):
+    """GET a small body (a playlist or one stream segment) into memory.
+
+    ``byte_range`` is an inclusive ``(start, end)`` pair. Connection errors
+    and 429/503 answers are retried like the streaming functions do.
+    """
+    session = session or get_session()
+    headers = {"Range": f"bytes={byte_range[0]}-{byte_range[1]}"} if byte_range else {}
+    attempt = throttled = 0
+    while True:
+        if throttle is not None:
+            throttle.before_request()
+        try:
+            response = session.get(url, headers=headers, timeout=timeout)
+            _check_throttled(response)
+            response.raise_for_status()
+            if byte_range and response.status_code != 206:
+                raise Exception("Server ignored the Range request")
+            if throttle is not None:
+                throttle.consume(len(response.content))
+            return response.content
+        except Throttled as e:
+            throttled += 1
+            _wait_throttled(e, throttled, throttle)
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError):
+            attempt += 1
+            if attempt > retries:
+                raise
+
+
+def probe(url, session=None, timeout=TIMEOUT, throttle=None):
+    """Find the body size, Range support and type with a one-byte Range request"""
+    session = session or get_session()
+    throttled = 0
+    while True:
+        if throttle is not None:
+            throttle.before_request()
+        try:
+            return _probe_once(session, url, timeout)
+        except Throttled as e:
+            throttled += 1
+            _wait_throttled(e, throttled, throttle)
+
+
+def _probe_once(session, url, timeout):
+    with session.get(url, headers={"Range": "bytes=0-0"}, stream=True, timeout=timeout) as response:
+        _check_throttled(response)
+        response.raise_for_status()
+        info = {'length': None, 'ranges': response.status_code == 206,
+                'content_type': response.headers.get("Content-Type")}
+        if info['ranges']:
+            total = response.headers.get("Content-Range", "").rpartition("/")[2]
+            info['length'] = int(total) if total.isdigit() else None
+        elif response.headers.get("Content-Length") is not None:
+            info['length'] = int(response.headers["Content-Length"])
+        return info
+
+
+def choose_segment_count(total, max_segments=MAX_SEGMENTS, min_segment_size=MIN_SEGMENT_SIZE):
+    """Pick how many ranges to fetch in parallel for a body of ``total`` bytes"""
+    if not total:
+        return 1
+    return max(1, min(max_segments, total // min_segment_size))
+
+
+def fetch_segmented(url, dest, progress=None, segments=None, chunk_size=CHUNK_SIZE,
+                    retries=3, session=None, timeout=TIMEOUT, throttle=None, hash_content=True):
+    """Download ``url`` with several concurrent Range requests.
+
+    The partial file is preallocated to the full Content-Length and each
+    segment writes its bytes at their final offset with ``os.pwrite``, so
+    nothing is reassembled afterwards. A segment that fails is retried on
+    its own from the last byte it wrote. Servers without Range support (or
+    platforms without ``pwrite``) fall back to ``fetch_to_file``.
+
+    Segments finish out of order, so a hashing thread follows the
+    contiguous prefix written so far and reads it back while it is still in
+    the page cache; only the tail after the last segment lands is hashed
+    once the transfer is over.
+    """
+    session = session or get_session()
+    info = probe(url, session=session, timeout=timeout, throttle=throttle)
+    total, ranged = info['length'], info['ranges']
+    if segments is None:
+        segments = choose_segment_count(total)
+    if not ranged or not total or segments <= 1 or not hasattr(os, "pwrite"):
+        return fetch_to_file(url, dest, progress=progress, chunk_size=chunk_size, retries=retries,
+                             session=session, timeout=timeout, throttle=throttle, hash_content=hash_content)
+
+    partial = partial_path(dest)
+    os.makedirs(os.path.dirname(partial) or ".", exist_ok=True)
+    bounds = _segment_bounds(total, segments)
+
+    done = [0]
+    done_lock = threading.Lock()
+
+    def advance(n):
+        with done_lock:
+            done[0] += n
+            current = done[0]
+        if progress is not None:
+            progress(current, total)
+
+    # Next byte each segment will write; the hashing thread only reads behind these
+    positions = [start for start, _ in bounds]
+    hasher = StreamHasher() if hash_content else None
+    stop = threading.Event()
+
+    fd = os.open(partial, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+    hashing = None
+    try:
+        os.ftruncate(fd, total)
+        if hasher is not None:
+            hashing = threading.Thread(target=_hash_behind, args=(fd, bounds, positions, hasher, stop),
+                                       name="segment-hash", daemon=True)
+            hashing.start()
+        with ThreadPoolExecutor(max_workers=len(bounds), thread_name_prefix="segment") as pool:
+            futures = [
+                pool.submit(_fetch_segment, session, url, fd, index, bounds, positions, advance,
+                            chunk_size, retries, timeout, throttle)
+                for index in range(len(bounds))
+            ]
+            for future in futures:
+                future.result()
+        if hashing is not None:
+            hashing.join()
+    except BaseException:
+        stop.set()
+        if hashing is not None:
+            hashing.join()
+        os.close(fd)
+        os.remove(partial)
+        raise
+    os.close(fd)
+
+    size = os.path.getsize(partial)
+    if done[0] != total or size != total or (hasher is not None and hasher.size != total):
+        os.remove(partial)
+        raise IntegrityError(f"Segmented download incomplete: got {done[0]} of {total} bytes")
+
+    os.replace(partial, dest)
+    result = {'path': dest, 'bytes': total, 'content_type': info['content_type'],
+              'resumed': False, 'segments': len(bounds)}
+    if hasher is not None:
+        result.update(hasher.result())
+    return result
+
+
+def _segment_bounds(total, segments):
+    size = -(-total // segments)
+    return [(start, min(start + size, total) - 1) for start in range(0, total, size)]
+
+
+def _frontier(bounds, positions):
+    """End of the contiguous prefix every segment has written so far"""
+    for (_, end), pos in zip(bounds, positions):
+        if pos <= end:
+            return pos
+    return bounds[-1][1] + 1
+
+
+def _hash_behind(fd, bounds, positions, hasher, stop):
+    total = bounds[-1][1] + 1
+    while hasher.size < total:
+        frontier = _frontier(bounds, positions)
+        if frontier > hasher.size:
+            hasher.update(os.pread(fd, min(CHUNK_SIZE * 4, frontier - hasher.size), hasher.size))
+        elif stop.wait(0.01):
+            return
+
+
+def _fetch_segment(session, url, fd, index, bounds, positions, advance, chunk_size, retries, timeout, throttle):
+    start, end = bounds[index]
+    pos = start
+    attempt = throttled = 0
+    while pos <= end:
+        try:
+            headers = {"Range": f"bytes={pos}-{end}"}
+            if throttle is not None:
+                throttle.before_request()
+            with session.get(url, headers=headers, stream=True, timeout=timeout) as response:
+                _check_throttled(response)
+                response.raise_for_status()
+                if response.status_code != 206:
+                    raise Exception("Server ignored the Range request")
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    if not chunk:
+                        continue
+                    chunk = chunk[:end - pos + 1]
+                    if throttle is not None:
+                        throttle.consume(len(chunk))
+                    os.pwrite(fd, chunk, pos)
+                    pos += len(chunk)
+                    positions[index] = pos
+                    advance(len(chunk))
+            if pos <= end:
+                raise requests.exceptions.ChunkedEncodingError(
+                    f"Segment {start}-{end} closed at byte {pos}"
+                )
+        except Throttled as e:
+            throttled += 1
+            _wait_throttled(e, throttled, throttle)
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError):
+            attempt += 1
+            if attempt > retries:
+                raise
+
+
+DIRECT_MEDIA_EXTENSIONS = {
+    ".mp4", ".m4v", ".mov", ".webm", ".mkv",
+    ".mp3", ".m4a", ".aac", ".ogg", ".wav",
+    ".jpg", ".jpeg", ".png", ".gif", ".webp",
+}
+
+
+def is_direct_media_url(url):
+    """True when the URL path points straight at a media file rather than a page"""
+    path = urlparse(url).path.lower()
+    return os.path.splitext(path)[1] in DIRECT_MEDIA_EXTENSIONS
@@ -0,0 +1,92 @@
+"""Lazy, cached serving of finished files to ``st.download_button``.
+
+Handing an open file to ``st.download_button`` makes Streamlit read the
+whole file on every rerun that draws the button. Instead the buttons get a
+loader callable, which Streamlit only runs when the user clicks. Loaded
+contents are kept in an LRU bounded by a byte budget and keyed by content
+hash, so repeated requests for the same file (or the same bytes under
+another name) are served from one shared object. A loader
+can carry a ``verify`` check (see ``utils.integrity.verifier``) that runs
+once, when the bytes are first read from disk.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+DEFAULT_BYTE_BUDGET = 256 * 1024 * 1024
+
+
+def fingerprint(path):
+    """Cheap identity for a file when its content hash is not known"""
+    stat = os.stat(path)
+    return f"stat:{stat.st_dev}:{stat.st_ino}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def read_file(path):
+    """Whole file as bytes, which is what ``st.download_button`` needs anyway"""
+    with open(path, "rb") as f:
+        return f.read()
+
+
+class FileServer:
+    """LRU cache of file contents with a total byte budget"""
+
+    def __init__(self, byte_budget=DEFAULT_BYTE_BUDGET, on_read=None):
+        self.byte_budget = byte_budget
+        # Called with the path on every read, e.g. to refresh its storage TTL
+        self.on_read = on_read
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def loader(self, path, content_hash=None, verify=None):
+        """Zero-argument callable for ``st.download_button(data=...)``.
+
+        Nothing is read until the callable runs, i.e. until the user clicks.
+        """
+        return lambda: self.read(path, content_hash, verify)
+
+    def read(self, path, content_hash=None, verify=None):
+        if self.on_read is not None:
+            self.on_read(path)
+        key = content_hash or fingerprint(path)
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return data
+            self.misses += 1
+
+        data = read_file(path)
+        if verify is not None and not verify(data):
+            raise Exception(f"{os.path.basename(path)} is damaged (size or checksum mismatch); download it again")
+        if len(data) <= self.byte_budget:
+            with self._lock:
+                if key not in self._entries:
+                    self._entries[key] = data
+                    self._bytes += len(data)
+                    self._evict_locked()
+        return data
+
+    def invalidate(self, content_hash):
+        with self._lock:
+            data = self._entries.pop(content_hash, None)
+            if data is not None:
+                self._bytes -= len(data)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+    def _evict_locked(self):
+        while self._bytes > self.byte_budget and self._entries:
+            _, data = self._entries.popitem(last=False)
+            self._bytes -= len(data)
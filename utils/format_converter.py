@@ -0,0 +1,330 @@
+"""ffmpeg-backed audio extraction and quality transcoding.
+
+Each conversion is one ffmpeg subprocess; a bounded pool caps how many run
+at once so a burst of MP3 requests cannot oversubscribe the CPU. At High
+quality an MP3 is kept as is and MP4/M4V/MOV sources are remuxed into MP4
+with their streams copied; a MOV whose codecs MP4 cannot carry (ProRes,
+say) falls back to a re-encode.
+
+Sources can be piped into ffmpeg's stdin as they download (see
+``plan_pipe``). MP4/MOV files that store their index (the ``moov`` box)
+after the media data cannot be: ffmpeg has to seek to the index, and from
+a pipe it "succeeds" with an empty file. Those, like Pillow's inputs,
+are read from a file.
+"""
+import os
+import shutil
+import struct
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+QUALITY_PRESETS = {
+    "High": {"audio_bitrate": "192k", "height": None, "crf": 20},
+    "Medium": {"audio_bitrate": "128k", "height": 720, "crf": 26},
+    "Low": {"audio_bitrate": "96k", "height": 480, "crf": 30},
+}
+
+VIDEO_EXTENSIONS = {".mp4", ".m4v", ".mov", ".webm", ".mkv"}
+# ISO base media files, whose usual codecs (H.264/HEVC, AAC) MP4 takes as they are
+MP4_FAMILY = {".mp4", ".m4v", ".mov"}
+# Sample entries MP4 can hold as they are; anything else in a MOV is re-encoded
+MP4_COPY_CODECS = {b"avc1", b"avc3", b"hvc1", b"hev1", b"av01", b"vp09", b"mp4a", b"Opus", b"ac-3", b"ec-3"}
+# How far into a piped MP4/MOV to look for its index before reading it from a file instead
+MAX_PIPE_HEAD = 8 * 1024 * 1024
+PEEK_STEP = 64 * 1024
+
+_transcoder = None
+_transcoder_lock = threading.Lock()
+
+
+def ffmpeg_binary():
+    return os.environ.get("FFMPEG_BINARY") or shutil.which("ffmpeg")
+
+
+def needs_transcode(source_ext, format_type, quality):
+    """Whether a downloaded ``source_ext`` file must go through ffmpeg"""
+    source_ext = source_ext.lower()
+    if format_type == "MP3":
+        return source_ext != ".mp3" or quality != "High"
+    if format_type == "MP4":
+        if source_ext not in VIDEO_EXTENSIONS:
+            raise Exception(f"A {source_ext or 'extensionless'} file has no video to save as MP4; choose MP3")
+        return source_ext != ".mp4" or quality != "High"
+    return False
+
+
+def stream_copy(source_ext, format_type, quality):
+    """Whether a conversion can copy the source streams instead of re-encoding them"""
+    source_ext = source_ext.lower()
+    if quality != "High":
+        return False
+    if format_type == "MP3":
+        return source_ext == ".mp3"
+    return source_ext in MP4_FAMILY
+
+
+def plan_pipe(source_ext, format_type, quality, peek):
+    """How to convert a source ffmpeg reads from a pipe.
+
+    ``peek(n)`` returns up to the first ``n`` bytes of the source. Returns
+    None when ffmpeg would have to seek (read the source from a file then),
+    else whether the streams can be copied.
+    """
+    copy = stream_copy(source_ext, format_type, quality)
+    if source_ext.lower() not in MP4_FAMILY:
+        return copy
+    codecs = mp4_head_codecs(peek)
+    if codecs is None:
+        return None
+    return copy and bool(codecs) and codecs <= MP4_COPY_CODECS
+
+
+def mp4_head_codecs(peek, limit=MAX_PIPE_HEAD):
+    """Audio/video sample entries of an MP4/MOV whose ``moov`` box comes first; None otherwise"""
+    head = peek(PEEK_STEP)
+    offset = 0
+    while True:
+        if offset + 16 > len(head) and len(head) < limit:
+            # Leading boxes (ftyp, free, ...) run past what was read so far
+            more = peek(min(limit, offset + PEEK_STEP))
+            if len(more) == len(head):
+                return None
+            head = more
+        box = _box_header(head, offset)
+        if box is None:
+            return None
+        size, kind, header = box
+        if kind == b"mdat" or size < header:
+            return None
+        if kind == b"moov":
+            end = offset + size
+            if end > limit:
+                return None
+            head = peek(end)
+            if len(head) < end:
+                return None
+            return _moov_codecs(head, offset + header, end)
+        offset += size
+
+
+def _box_header(data, offset):
+    """``(size, type, header length)`` of the ISO box at ``offset``; None if it is cut off"""
+    if offset + 8 > len(data):
+        return None
+    size, kind = struct.unpack_from(">I4s", data, offset)
+    if size == 1:
+        if offset + 16 > len(data):
+            return None
+        return struct.unpack_from(">Q", data, offset + 8)[0], kind, 16
+    return size, kind, 8
+
+
+def _moov_codecs(data, start, end):
+    codecs = set()
+    for kind, body, box_end in _children(data, start, end):
+        if kind == b"trak":
+            track = {}
+            _read_track(data, body, box_end, track)
+            if track.get('handler') in (b"vide", b"soun"):
+                codecs.add(track.get('codec'))
+    return codecs
+
+
+def _read_track(data, start, end, track):
+    for kind, body, box_end in _children(data, start, end):
+        if kind in (b"mdia", b"minf", b"stbl"):
+            _read_track(data, body, box_end, track)
+        elif kind == b"hdlr":
+            # version/flags, pre_defined, then the handler type. MOVs repeat hdlr
+            # in minf for the data reference; the one in mdia comes first
+            track.setdefault('handler', data[body + 8:body + 12])
+        elif kind == b"stsd":
+            # version/flags, entry count, then the first entry's size and format
+            track['codec'] = data[body + 12:body + 16]
+
+
+def _children(data, start, end):
+    offset = start
+    while offset < end:
+        box = _box_header(data, offset)
+        if box is None:
+            return
+        size, kind, header = box
+        size = size or end - offset
+        if size < header or offset + size > end:
+            return
+        yield kind, offset + header, offset + size
+        offset += size
+
+
+def build_command(source, dest, format_type, quality, source_ext=None, threads=2, copy=None):
+    """ffmpeg argv for one conversion (``source`` may be ``"pipe:0"``)"""
+    preset = QUALITY_PRESETS.get(quality, QUALITY_PRESETS["High"])
+    source_ext = (source_ext or os.path.splitext(source)[1]).lower()
+    if copy is None:
+        copy = stream_copy(source_ext, format_type, quality)
+    cmd = [ffmpeg_binary(), "-hide_banner", "-loglevel", "error", "-y"]
+    if source != "pipe:0":
+        cmd.append("-nostdin")
+    cmd += ["-threads", str(threads), "-i", source]
+
+    if format_type == "MP3":
+        if copy:
+            cmd += ["-vn", "-c:a", "copy"]
+        else:
+            cmd += ["-vn", "-c:a", "libmp3lame", "-b:a", preset["audio_bitrate"]]
+        cmd += ["-f", "mp3"]
+    else:
+        if copy:
+            cmd += ["-c", "copy"]
+        else:
+            if preset["height"]:
+                # Never upscale; keep width even for libx264
+                cmd += ["-vf", f"scale=-2:'min({preset['height']},ih)'"]
+            cmd += ["-c:v", "libx264", "-preset", "veryfast", "-crf", str(preset["crf"]),
+                    "-c:a", "aac", "-b:a", preset["audio_bitrate"]]
+        cmd += ["-movflags", "+faststart", "-f", "mp4"]
+    return cmd + [dest]
+
+
+def build_remux_command(inputs, dest):
+    """ffmpeg argv that copies the streams of ``inputs`` (video first) into one MP4"""
+    cmd = [ffmpeg_binary(), "-hide_banner", "-loglevel", "error", "-y", "-nostdin"]
+    for path in inputs:
+        cmd += ["-i", path]
+    if len(inputs) == 1:
+        cmd += ["-map", "0:v?", "-map", "0:a?"]
+    else:
+        cmd += ["-map", "0:v?", "-map", "1:a?"]
+    return cmd + ["-c", "copy", "-movflags", "+faststart", "-f", "mp4", dest]
+
+
+class Transcoder:
+    """Bounded pool of ffmpeg subprocesses"""
+
+    def __init__(self, max_processes=None, threads_per_process=2):
+        self.max_processes = max_processes or max(1, (os.cpu_count() or 2) // threads_per_process)
+        self.threads_per_process = threads_per_process
+        self._pool = ThreadPoolExecutor(max_workers=self.max_processes, thread_name_prefix="ffmpeg")
+
+    @property
+    def available(self):
+        return ffmpeg_binary() is not None
+
+    def submit(self, source, dest, format_type, quality, source_ext=None):
+        """Queue a conversion; ``source`` is a path or an iterable of byte chunks"""
+        return self._pool.submit(self._convert, source, dest, format_type, quality, source_ext, None)
+
+    def convert(self, source, dest, format_type, quality, source_ext=None):
+        return self.submit(source, dest, format_type, quality, source_ext).result()
+
+    def convert_stream(self, open_source, dest, format_type, quality, source_ext):
+        """Convert a download piped in as it arrives; None if it has to be read from a file.
+
+        ``open_source()`` returns the download as a ``BodyStream`` and is
+        only called once an ffmpeg slot is free, so a queued conversion
+        does not hold an idle connection open.
+        """
+        return self._pool.submit(self._convert_stream, open_source, dest, format_type, quality, source_ext).result()
+
+    def remux(self, inputs, dest):
+        """Copy the streams of ``inputs`` into an MP4 at ``dest`` (no re-encode)"""
+        return self._pool.submit(self._remux, inputs, dest).result()
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
+
+    def _convert(self, source, dest, format_type, quality, source_ext, copy):
+        if not self.available:
+            raise Exception("ffmpeg is not installed; MP3 extraction and quality conversion are unavailable")
+
+        piped = not isinstance(source, str)
+        partial = dest + ".part"
+        source_ext = source_ext or os.path.splitext(source)[1]
+        if copy is None:
+            copy = stream_copy(source_ext, format_type, quality)
+        cmd = build_command("pipe:0" if piped else source, partial, format_type, quality,
+                            source_ext=source_ext, threads=self.threads_per_process, copy=copy)
+        try:
+            return self._execute(cmd, partial, dest, source if piped else None)
+        except Exception:
+            if not copy or piped:
+                raise
+        # The container allows a copy but the codecs do not (ProRes or PCM in a MOV): encode
+        cmd = build_command(source, partial, format_type, quality, source_ext=source_ext,
+                            threads=self.threads_per_process, copy=False)
+        return self._execute(cmd, partial, dest)
+
+    def _convert_stream(self, open_source, dest, format_type, quality, source_ext):
+        if not self.available:
+            raise Exception("ffmpeg is not installed; MP3 extraction and quality conversion are unavailable")
+        with open_source() as body:
+            copy = plan_pipe(source_ext, format_type, quality, body.peek)
+            if copy is None:
+                return None
+            self._convert(body, dest, format_type, quality, source_ext, copy)
+            return {'bytes': body.bytes, 'content_type': body.content_type}
+
+    def _remux(self, inputs, dest):
+        if not self.available:
+            raise Exception("ffmpeg is not installed; streaming (HLS/DASH) downloads are unavailable")
+        partial = dest + ".part"
+        return self._execute(build_remux_command(inputs, partial), partial, dest)
+
+    def _execute(self, cmd, partial, dest, source=None):
+        piped = source is not None
+        proc = subprocess.Popen(cmd, stdin=subprocess.PIPE if piped else subprocess.DEVNULL,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        stderr = b""
+        # A source that fails mid-stream just closes stdin, and ffmpeg then
+        # exits cleanly with a truncated file, so the feeder's error decides
+        feed_errors = []
+        try:
+            if piped:
+                feeder = threading.Thread(target=self._feed, args=(proc, source, feed_errors), daemon=True)
+                feeder.start()
+            stderr = proc.stderr.read()
+            proc.wait()
+            if piped:
+                feeder.join()
+        finally:
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+
+        if proc.returncode != 0 or feed_errors:
+            if os.path.exists(partial):
+                os.remove(partial)
+            if feed_errors:
+                raise feed_errors[0]
+            message = stderr.decode(errors="replace").strip().splitlines()
+            raise Exception(f"ffmpeg failed: {message[-1] if message else proc.returncode}")
+        os.replace(partial, dest)
+        return dest
+
+    @staticmethod
+    def _feed(proc, chunks, errors):
+        try:
+            for chunk in chunks:
+                proc.stdin.write(chunk)
+        except BrokenPipeError:
+            # ffmpeg stopped reading; its exit status says why
+            pass
+        except Exception as e:
+            errors.append(e)
+        finally:
+            try:
+                proc.stdin.close()
+            except BrokenPipeError:
+                pass
+
+
+def get_transcoder():
+    """Process-wide transcoder shared by every download job"""
+    global _transcoder
+    if _transcoder is None:
+        with _transcoder_lock:
+            if _transcoder is None:
+                _transcoder = Transcoder()
+    return _transcoder
@@ -0,0 +1,379 @@
+"""SQLite-backed storage for download history, playlists and reviews.
+
+The database runs in WAL mode so readers never block the writer (replicas
+sharing it over a volume pass ``journal_mode="DELETE"``, as WAL's
+shared-memory index does not work across hosts), and every
+query is a constant parameterized statement that sqlite3 keeps prepared in
+its per-connection statement cache. History inserts are buffered and
+written in one transaction (flushed when the buffer fills, before the
+next read, at exit, and by the app after each poll of its jobs), which
+keeps bulk batches from paying a commit per row. A crash loses only what
+was added since the last flush: the rows of the poll in progress. IDs
+are handed out before the insert, from blocks reserved in the database,
+so several processes (replicas) can share one database file.
+Playlists store history IDs, never copies of history records. Rows come
+back as ``HistoryRecord`` objects, whose slots take a fraction of the
+memory of a per-row dict. Each row keeps the digest and exact size of its
+file so a later download of it can be checked without rehashing.
+"""
+import atexit
+import datetime
+import os
+import sqlite3
+import threading
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+WRITE_BATCH = 64
+# Stay well under SQLite's bound-parameter limit
+IN_BATCH = 500
+# History IDs reserved per round trip; unused ones are skipped after a restart
+ID_BLOCK = WRITE_BATCH
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    title TEXT NOT NULL,
+    platform TEXT NOT NULL,
+    url TEXT NOT NULL,
+    time TEXT NOT NULL,
+    ts REAL NOT NULL,
+    file TEXT NOT NULL,
+    format TEXT NOT NULL,
+    type TEXT NOT NULL,
+    file_size REAL NOT NULL,
+    thumbnail TEXT,
+    digest TEXT,
+    fast_digest TEXT,
+    size_bytes INTEGER
+);
+CREATE INDEX IF NOT EXISTS history_session_ts ON history (session_id, ts);
+CREATE INDEX IF NOT EXISTS history_session_platform ON history (session_id, platform, ts);
+CREATE INDEX IF NOT EXISTS history_session_format ON history (session_id, format, ts);
+CREATE INDEX IF NOT EXISTS history_file ON history (file);
+
+CREATE TABLE IF NOT EXISTS id_blocks (
+    name TEXT PRIMARY KEY,
+    next_id INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS playlists (
+    id INTEGER PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    UNIQUE (session_id, name)
+);
+
+CREATE TABLE IF NOT EXISTS playlist_items (
+    id INTEGER PRIMARY KEY,
+    playlist_id INTEGER NOT NULL REFERENCES playlists (id) ON DELETE CASCADE,
+    history_id INTEGER NOT NULL REFERENCES history (id) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS playlist_items_playlist ON playlist_items (playlist_id, id);
+CREATE INDEX IF NOT EXISTS playlist_items_history ON playlist_items (history_id);
+
+CREATE TABLE IF NOT EXISTS reviews (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    rating INTEGER NOT NULL,
+    review TEXT NOT NULL,
+    date TEXT NOT NULL
+);
+"""
+
+HISTORY_COLUMNS = ("id", "session_id", "title", "platform", "url", "time", "ts",
+                   "file", "format", "type", "file_size", "thumbnail",
+                   "digest", "fast_digest", "size_bytes")
+
+# Columns added after the first release, created on databases that predate them
+ADDED_HISTORY_COLUMNS = {
+    "thumbnail": "TEXT",
+    # SHA-256 / XXH3-64 hex and exact length of the file, recorded while it was written
+    "digest": "TEXT",
+    "fast_digest": "TEXT",
+    "size_bytes": "INTEGER",
+}
+
+INSERT_HISTORY = (
+    f"INSERT INTO history ({', '.join(HISTORY_COLUMNS)}) "
+    f"VALUES ({', '.join('?' for _ in HISTORY_COLUMNS)})"
+)
+
+
+def _to_ts(value):
+    return datetime.datetime.strptime(value, TIME_FORMAT).timestamp()
+
+
+class HistoryRecord:
+    """One history row (``item_id`` is set on playlist rows)"""
+
+    __slots__ = HISTORY_COLUMNS + ("item_id",)
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields.get(name))
+
+    @classmethod
+    def from_row(cls, cursor, row):
+        """sqlite3 row factory"""
+        record = cls.__new__(cls)
+        record.item_id = None
+        for column, value in zip(cursor.description, row):
+            setattr(record, column[0], value)
+        return record
+
+    def __repr__(self):
+        return f"HistoryRecord(id={self.id}, title={self.title!r}, file={self.file!r})"
+
+
+class HistoryStore:
+    """Persistent history/playlist/review collections shared by all sessions"""
+
+    def __init__(self, path="data/media_downloader.db", journal_mode="WAL"):
+        self.path = path
+        self.journal_mode = journal_mode
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._pending = []
+        with self._write_lock:
+            conn = self._conn()
+            conn.executescript(SCHEMA)
+            self._migrate(conn)
+            self._next_id = self._id_limit = 0
+        atexit.register(self.flush)
+
+    # ----------------------
+    # history
+    # ----------------------
+    def add_history(self, session_id, item):
+        """Buffer a history record and return the ID it will be stored under.
+
+        ``item`` is a HistoryRecord or a dict of its fields; a record passed
+        in gets its ``id``, ``session_id`` and ``ts`` filled in.
+        """
+        if isinstance(item, dict):
+            item = HistoryRecord(**item)
+        with self._write_lock:
+            if self._next_id >= self._id_limit:
+                self._reserve_ids_locked()
+            history_id = self._next_id
+            self._next_id += 1
+            item.id, item.session_id, item.ts = history_id, session_id, _to_ts(item.time)
+            self._pending.append(tuple(getattr(item, name) for name in HISTORY_COLUMNS))
+            if len(self._pending) >= WRITE_BATCH:
+                self._flush_locked()
+        return history_id
+
+    def flush(self):
+        with self._write_lock:
+            self._flush_locked()
+
+    def delete_history(self, session_id, history_id):
+        self.flush()
+        with self._write_lock, self._conn() as conn:
+            cur = conn.execute("DELETE FROM history WHERE id = ? AND session_id = ?",
+                               (history_id, session_id))
+            return cur.rowcount > 0
+
+    def get_history(self, session_id, history_id):
+        self.flush()
+        return self._records(
+            "SELECT * FROM history WHERE id = ? AND session_id = ?", (history_id, session_id)
+        ).fetchone()
+
+    def count_history(self, session_id, **filters):
+        self.flush()
+        where, params = self._history_filter(session_id, **filters)
+        return self._conn().execute(f"SELECT COUNT(*) FROM history WHERE {where}", params).fetchone()[0]
+
+    def list_history(self, session_id, limit=None, offset=0, before=None, **filters):
+        """Newest-first history rows for a session, filtered on the indexed columns.
+
+        ``before`` is a ``(ts, id)`` cursor taken from the last row of the
+        previous page; seeking from it costs the same on page 1 and page
+        5000, unlike ``offset``.
+        """
+        self.flush()
+        where, params = self._history_filter(session_id, **filters)
+        if before is not None:
+            where += " AND ts <= ? AND (ts < ? OR id < ?)"
+            params += [before[0], before[0], before[1]]
+        sql = f"SELECT * FROM history WHERE {where} ORDER BY ts DESC, id DESC"
+        if limit is not None:
+            sql += " LIMIT ? OFFSET ?"
+            params += [limit, offset]
+        return self._records(sql, params).fetchall()
+
+    def search_history(self, session_id, text="", limit=20):
+        """Most recent rows whose title or platform contains ``text``"""
+        self.flush()
+        escaped = text.strip().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        pattern = f"%{escaped}%"
+        return self._records(
+            "SELECT * FROM history WHERE session_id = ? "
+            "AND (title LIKE ? ESCAPE '\\' OR platform LIKE ? ESCAPE '\\') "
+            "ORDER BY ts DESC, id DESC LIMIT ?",
+            (session_id, pattern, pattern, limit),
+        ).fetchall()
+
+    def history_platforms(self, session_id):
+        """Distinct platforms in a session's history (served from the platform index)"""
+        self.flush()
+        rows = self._conn().execute(
+            "SELECT DISTINCT platform FROM history WHERE session_id = ? ORDER BY platform", (session_id,)
+        )
+        return [row[0] for row in rows]
+
+    def referenced_files(self, paths):
+        """The subset of ``paths`` that some history record (any session) points at, as file or thumbnail"""
+        self.flush()
+        paths = list(paths)
+        found = set()
+        conn = self._conn()
+        for start in range(0, len(paths), IN_BATCH):
+            batch = paths[start:start + IN_BATCH]
+            marks = ', '.join('?' for _ in batch)
+            rows = conn.execute(
+                f"SELECT file FROM history WHERE file IN ({marks}) "
+                f"UNION SELECT thumbnail FROM history WHERE thumbnail IN ({marks})", batch + batch
+            )
+            found.update(row[0] for row in rows)
+        return found
+
+    def _history_filter(self, session_id, platform=None, format=None, since=None, until=None):
+        clauses = ["session_id = ?"]
+        params = [session_id]
+        if platform:
+            clauses.append("platform = ?")
+            params.append(platform)
+        if format:
+            clauses.append("format = ?")
+            params.append(format)
+        if since is not None:
+            clauses.append("ts >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("ts < ?")
+            params.append(until)
+        return " AND ".join(clauses), params
+
+    # ----------------------
+    # playlists
+    # ----------------------
+    def playlist_names(self, session_id):
+        rows = self._conn().execute(
+            "SELECT name FROM playlists WHERE session_id = ? ORDER BY id", (session_id,)
+        )
+        return [row[0] for row in rows]
+
+    def create_playlist(self, session_id, name):
+        """Create a playlist; returns False if the name is already taken"""
+        with self._write_lock, self._conn() as conn:
+            cur = conn.execute(
+                "INSERT OR IGNORE INTO playlists (session_id, name) VALUES (?, ?)", (session_id, name)
+            )
+            return cur.rowcount > 0
+
+    def add_to_playlist(self, session_id, name, history_id):
+        self.flush()
+        with self._write_lock, self._conn() as conn:
+            conn.execute(
+                "INSERT INTO playlist_items (playlist_id, history_id) "
+                "SELECT p.id, h.id FROM playlists p, history h "
+                "WHERE p.session_id = ? AND p.name = ? AND h.id = ? AND h.session_id = p.session_id",
+                (session_id, name, history_id),
+            )
+
+    def remove_from_playlist(self, session_id, item_id):
+        with self._write_lock, self._conn() as conn:
+            conn.execute(
+                "DELETE FROM playlist_items WHERE id = ? AND playlist_id IN "
+                "(SELECT id FROM playlists WHERE session_id = ?)",
+                (item_id, session_id),
+            )
+
+    def playlist_items(self, session_id, name, limit=-1, offset=0):
+        """History rows in a playlist, in the order they were added (``item_id`` identifies the entry)"""
+        self.flush()
+        return self._records(
+            "SELECT i.id AS item_id, h.* FROM playlist_items i "
+            "JOIN playlists p ON p.id = i.playlist_id "
+            "JOIN history h ON h.id = i.history_id "
+            "WHERE p.session_id = ? AND p.name = ? ORDER BY i.id LIMIT ? OFFSET ?",
+            (session_id, name, limit, offset),
+        ).fetchall()
+
+    def count_playlist_items(self, session_id, name):
+        return self._conn().execute(
+            "SELECT COUNT(*) FROM playlist_items i JOIN playlists p ON p.id = i.playlist_id "
+            "WHERE p.session_id = ? AND p.name = ?",
+            (session_id, name),
+        ).fetchone()[0]
+
+    # ----------------------
+    # reviews
+    # ----------------------
+    def add_review(self, review):
+        with self._write_lock, self._conn() as conn:
+            conn.execute(
+                "INSERT INTO reviews (name, rating, review, date) VALUES (?, ?, ?, ?)",
+                (review['name'], review['rating'], review['review'], review['date']),
+            )
+
+    def list_reviews(self, limit=50):
+        rows = self._conn().execute("SELECT * FROM reviews ORDER BY id DESC LIMIT ?", (limit,))
+        return [dict(row) for row in rows]
+
+    def count_reviews(self):
+        return self._conn().execute("SELECT COUNT(*) FROM reviews").fetchone()[0]
+
+    # ----------------------
+    # internals
+    # ----------------------
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, cached_statements=256)
+            conn.row_factory = sqlite3.Row
+            conn.execute(f"PRAGMA journal_mode={self.journal_mode}")
+            # NORMAL is only crash-safe with WAL; a rollback journal needs FULL
+            conn.execute("PRAGMA synchronous=NORMAL" if self.journal_mode == "WAL" else "PRAGMA synchronous=FULL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    def _records(self, sql, params):
+        cursor = self._conn().cursor()
+        cursor.row_factory = HistoryRecord.from_row
+        return cursor.execute(sql, params)
+
+    def _migrate(self, conn):
+        existing = {row[1] for row in conn.execute("PRAGMA table_info(history)")}
+        for column, kind in ADDED_HISTORY_COLUMNS.items():
+            if column not in existing:
+                conn.execute(f"ALTER TABLE history ADD COLUMN {column} {kind}")
+        # Here rather than in SCHEMA: older databases only get the column above
+        conn.execute("CREATE INDEX IF NOT EXISTS history_thumbnail ON history (thumbnail)")
+        # Databases from before ID blocks continue after their highest ID
+        conn.execute(
+            "INSERT OR IGNORE INTO id_blocks (name, next_id) "
+            "SELECT 'history', COALESCE(MAX(id), 0) + 1 FROM history"
+        )
+        conn.commit()
+
+    def _reserve_ids_locked(self):
+        """Take the next ID_BLOCK history IDs; one statement, so processes never get the same block"""
+        with self._conn() as conn:
+            limit = conn.execute(
+                "UPDATE id_blocks SET next_id = next_id + ? WHERE name = 'history' RETURNING next_id",
+                (ID_BLOCK,)
+            ).fetchall()[0][0]
+        self._next_id, self._id_limit = limit - ID_BLOCK, limit
+
+    def _flush_locked(self):
+        if not self._pending:
+            return
+        with self._conn() as conn:
+            conn.executemany(INSERT_HISTORY, self._pending)
+        self._pending = []
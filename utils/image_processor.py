@@ -0,0 +1,149 @@
+"""Pillow-based image conversion and thumbnail cache.
+
+Large JPEGs are opened with ``Image.draft`` so libjpeg decodes straight to
+a reduced scale (1/2, 1/4 or 1/8) when the target is smaller, instead of
+decoding the full-size bitmap and shrinking it afterwards. Conversions run
+on a bounded worker pool like the ffmpeg transcoder, and thumbnails are
+stored on disk keyed by the content hash of the source file. The thumbnail
+cache never deletes anything itself: the app registers each thumbnail with
+the storage manager, which expires and evicts it with the rest of
+``downloads/``; a thumbnail that is gone is simply made again.
+"""
+import math
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps
+
+IMAGE_QUALITY_PRESETS = {
+    "High": {"max_side": None, "jpeg_quality": 92, "png_compress": 6},
+    "Medium": {"max_side": 2560, "jpeg_quality": 85, "png_compress": 6},
+    "Low": {"max_side": 1280, "jpeg_quality": 70, "png_compress": 9},
+}
+
+THUMBNAIL_SIZE = (320, 180)
+JPEG_EXTENSIONS = {".jpg", ".jpeg"}
+
+_processor = None
+_thumbnails = None
+_singleton_lock = threading.Lock()
+
+
+def needs_image_conversion(source_ext, format_type, quality):
+    """Whether a downloaded ``source_ext`` image must be re-encoded"""
+    source_ext = source_ext.lower()
+    if quality != "High":
+        return True
+    if format_type == "JPG":
+        return source_ext not in JPEG_EXTENSIONS
+    return source_ext != ".png"
+
+
+def open_reduced(path, max_side=None):
+    """Open an image, letting JPEG decode at a reduced scale when it can"""
+    img = Image.open(path)
+    if max_side and img.format == "JPEG":
+        # draft() keeps both sides at or above the requested size, so ask for the
+        # aspect-correct size; a square box would hold the short side at max_side
+        scale = max_side / max(img.size)
+        if scale < 1:
+            img.draft("RGB", (math.ceil(img.width * scale), math.ceil(img.height * scale)))
+    return img
+
+
+def _flatten(img):
+    """RGB copy of ``img`` with any transparency composited onto white"""
+    if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+        img = img.convert("RGBA")
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        background.paste(img, mask=img.getchannel("A"))
+        return background
+    return img.convert("RGB")
+
+
+def convert_image(source, dest, format_type, quality):
+    """Convert ``source`` to JPG/PNG at ``dest`` using the quality preset"""
+    preset = IMAGE_QUALITY_PRESETS.get(quality, IMAGE_QUALITY_PRESETS["High"])
+    partial = dest + ".part"
+    with open_reduced(source, preset["max_side"]) as img:
+        img = ImageOps.exif_transpose(img)
+        if preset["max_side"]:
+            img.thumbnail((preset["max_side"], preset["max_side"]), Image.Resampling.LANCZOS)
+        if format_type == "JPG":
+            _flatten(img).save(partial, "JPEG", quality=preset["jpeg_quality"], optimize=True, progressive=True)
+        else:
+            if img.mode not in ("RGB", "RGBA", "L", "LA", "P"):
+                img = img.convert("RGBA")
+            img.save(partial, "PNG", compress_level=preset["png_compress"])
+    os.replace(partial, dest)
+    return dest
+
+
+class ImageProcessor:
+    """Bounded pool for image conversions (Pillow releases the GIL while coding)"""
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or max(1, os.cpu_count() or 1)
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="image")
+
+    def submit(self, source, dest, format_type, quality):
+        return self._pool.submit(convert_image, source, dest, format_type, quality)
+
+    def convert(self, source, dest, format_type, quality):
+        return self.submit(source, dest, format_type, quality).result()
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
+
+
+class ThumbnailCache:
+    """Small JPEG previews stored as ``<root>/ab/<content hash>_<w>x<h>.jpg``"""
+
+    def __init__(self, root="downloads/.thumbs", size=THUMBNAIL_SIZE):
+        self.root = root
+        self.size = size
+
+    def path_for(self, content_hash):
+        width, height = self.size
+        return os.path.join(self.root, content_hash[:2], f"{content_hash}_{width}x{height}.jpg")
+
+    def get(self, content_hash):
+        path = self.path_for(content_hash)
+        return path if os.path.exists(path) else None
+
+    def get_or_create(self, source, content_hash):
+        """Thumbnail path for ``source``; None if it is not a decodable image"""
+        path = self.path_for(content_hash)
+        if os.path.exists(path):
+            return path
+        try:
+            with open_reduced(source, max(self.size)) as img:
+                img = ImageOps.exif_transpose(img)
+                img.thumbnail(self.size, Image.Resampling.BILINEAR)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                partial = f"{path}.{threading.get_ident()}.part"
+                _flatten(img).save(partial, "JPEG", quality=80)
+            os.replace(partial, path)
+        except (OSError, Image.DecompressionBombError):
+            return None
+        return path
+
+
+def get_image_processor():
+    """Process-wide image conversion pool shared by every download job"""
+    global _processor
+    if _processor is None:
+        with _singleton_lock:
+            if _processor is None:
+                _processor = ImageProcessor()
+    return _processor
+
+
+def get_thumbnail_cache():
+    global _thumbnails
+    if _thumbnails is None:
+        with _singleton_lock:
+            if _thumbnails is None:
+                _thumbnails = ThumbnailCache()
+    return _thumbnails
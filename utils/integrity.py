@@ -0,0 +1,119 @@
+"""Content integrity for files written to ``downloads/``.
+
+Digests are computed while the bytes stream through the app, so a finished
+file is never read back just to hash it. SHA-256 is always computed. When
+the optional ``xxhash`` package is installed, an XXH3-64 digest is computed
+too; it is an order of magnitude faster to check, which is what later
+"Download Again" verification uses. Files are written to a temporary name
+and renamed into place only after the byte count checks out, so ``dest``
+never holds a truncated file.
+"""
+import contextlib
+import hashlib
+import os
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+HASH_BLOCK = 1024 * 1024
+
+
+class IntegrityError(Exception):
+    """A file's size or digest does not match what was expected"""
+
+
+class StreamHasher:
+    """Incremental SHA-256 (+ XXH3-64 when available) of a byte stream"""
+
+    def __init__(self, fast=True):
+        self._sha = hashlib.sha256()
+        self._fast = xxhash.xxh3_64() if fast and xxhash is not None else None
+        self.size = 0
+
+    def update(self, chunk):
+        self._sha.update(chunk)
+        if self._fast is not None:
+            self._fast.update(chunk)
+        self.size += len(chunk)
+
+    def reset(self):
+        self.__init__(fast=self._fast is not None)
+
+    def result(self):
+        """``{'digest', 'fast_digest', 'size_bytes'}`` for the bytes seen so far"""
+        return {
+            'digest': self._sha.hexdigest(),
+            'fast_digest': self._fast.hexdigest() if self._fast is not None else None,
+            'size_bytes': self.size,
+        }
+
+
+def hash_file(path, hasher=None, length=None):
+    """Feed ``path`` (or its first ``length`` bytes) into ``hasher``; returns the hasher"""
+    hasher = hasher or StreamHasher()
+    remaining = os.path.getsize(path) if length is None else length
+    with open(path, "rb") as f:
+        while remaining > 0:
+            block = f.read(min(HASH_BLOCK, remaining))
+            if not block:
+                break
+            hasher.update(block)
+            remaining -= len(block)
+    return hasher
+
+
+def hash_bytes(data):
+    hasher = StreamHasher()
+    hasher.update(data)
+    return hasher.result()
+
+
+@contextlib.contextmanager
+def atomic_write(dest, mode="wb"):
+    """Open a temporary file next to ``dest``; it replaces ``dest`` only if the block succeeds"""
+    tmp = f"{dest}.tmp"
+    os.makedirs(os.path.dirname(dest) or ".", exist_ok=True)
+    try:
+        with open(tmp, mode) as f:
+            yield f
+        os.replace(tmp, dest)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def check_size(path, expected):
+    """Raise IntegrityError unless ``path`` holds exactly ``expected`` bytes"""
+    actual = os.path.getsize(path)
+    if actual != expected:
+        raise IntegrityError(f"{os.path.basename(path)} has {actual} bytes, expected {expected}")
+
+
+def verify_bytes(data, size_bytes=None, digest=None, fast_digest=None):
+    """True when ``data`` matches the recorded size and digest (the fast one when possible)"""
+    if size_bytes is not None and len(data) != size_bytes:
+        return False
+    if fast_digest and xxhash is not None:
+        return xxhash.xxh3_64(data).hexdigest() == fast_digest
+    if digest:
+        return hashlib.sha256(data).hexdigest() == digest
+    return True
+
+
+def verifier(size_bytes=None, digest=None, fast_digest=None):
+    """One-argument check for ``FileServer.loader``; None when nothing was recorded"""
+    if size_bytes is None and not digest:
+        return None
+    return lambda data: verify_bytes(data, size_bytes, digest, fast_digest)
+
+
+def size_matches(path, size_bytes):
+    """Cheap render-time check: the file exists and has the recorded size"""
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return False
+    return size_bytes is None or size == size_bytes
@@ -0,0 +1,419 @@
+"""Process-wide background job queue for downloads.
+
+Streamlit re-runs the script thread for every interaction, so long running
+work must not happen inline. Jobs are handed to a bounded worker pool and
+the UI polls ``Job.snapshot()`` on each rerun to draw progress. With
+several replicas, ``SharedJobQueue`` keeps the jobs in a shared backend
+(see ``utils.shared_state``) and each replica runs the ones it claims on
+its own ``JobQueue``.
+"""
+import itertools
+import json
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.shared_state import new_owner
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class Job:
+    """A single unit of work plus the progress it has reported so far"""
+
+    def __init__(self, job_id, session_id, host, func, args, kwargs, label=""):
+        self.id = job_id
+        self.session_id = session_id
+        self.host = host
+        self.label = label
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.status = QUEUED
+        self.done_units = 0
+        self.total_units = None
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self._lock = threading.Lock()
+
+    def report(self, done, total=None):
+        """Progress callback handed to the job function (units are usually bytes)"""
+        with self._lock:
+            self.done_units = done
+            if total is not None:
+                self.total_units = total
+
+    @property
+    def progress(self):
+        """Fraction complete in the range 0.0 - 1.0"""
+        with self._lock:
+            if self.status == DONE:
+                return 1.0
+            if not self.total_units:
+                return 0.0
+            return min(self.done_units / self.total_units, 1.0)
+
+    @property
+    def finished_ok(self):
+        return self.status == DONE
+
+    @property
+    def active(self):
+        return self.status in (QUEUED, RUNNING)
+
+    def snapshot(self):
+        """Plain dict view of the job, safe to read from the script thread"""
+        with self._lock:
+            return {
+                'id': self.id,
+                'label': self.label,
+                'host': self.host,
+                'status': self.status,
+                'done': self.done_units,
+                'total': self.total_units,
+                'error': self.error,
+            }
+
+
+class TrackedJob:
+    """A session's handle on a queued job, as kept in ``st.session_state``.
+
+    Slots keep the per-entry footprint small for sessions with large bulk
+    batches. ``record`` is the HistoryRecord written once the job finished.
+    """
+
+    __slots__ = ("job_id", "url", "format", "platform", "type", "skipped", "record", "content_type", "cached")
+
+    def __init__(self, job_id, url, platform, format=None, type=None, skipped=None):
+        self.job_id = job_id
+        self.url = url
+        self.platform = platform
+        self.format = format
+        self.type = type
+        self.skipped = skipped
+        self.record = None
+        self.content_type = None
+        self.cached = False
+
+    @property
+    def recorded(self):
+        return self.record is not None
+
+
+class JobQueue:
+    """Bounded worker pool with a per-host concurrency cap.
+
+    Jobs that would exceed the cap for their host stay pending and are
+    dispatched as soon as a job for that host finishes, so a single slow
+    platform cannot occupy every worker. Free workers go to the session
+    with the fewest running jobs (oldest job first among equals), so one
+    session's bulk batch cannot starve everyone else's downloads.
+    """
+
+    def __init__(self, max_workers=4, per_host_limit=2, keep_finished=500):
+        self.max_workers = max_workers
+        self.per_host_limit = per_host_limit
+        self.keep_finished = keep_finished
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="download")
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._jobs = {}
+        self._pending = deque()
+        self._finished = deque()
+        self._running = 0
+        self._host_running = {}
+        self._session_running = {}
+
+    def submit(self, session_id, host, func, *args, label="", **kwargs):
+        """Queue ``func(*args, progress=job.report, **kwargs)`` and return its Job"""
+        with self._lock:
+            job = Job(next(self._ids), session_id, host, func, args, kwargs, label=label)
+            self._jobs[job.id] = job
+            self._pending.append(job)
+            self._dispatch_locked()
+        return job
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def jobs_for(self, session_id):
+        """All jobs still tracked for a session, oldest first"""
+        return [job for job in list(self._jobs.values()) if job.session_id == session_id]
+
+    def forget(self, job_id):
+        """Drop a finished job once the UI has consumed its result"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and not job.active:
+                del self._jobs[job_id]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'running': self._running,
+                'pending': len(self._pending),
+                'tracked': len(self._jobs),
+            }
+
+    def wait(self, jobs, timeout=None):
+        """Block until every job in ``jobs`` has finished (used by benchmarks)"""
+        deadline = None if timeout is None else time.time() + timeout
+        for job in jobs:
+            while job.active:
+                if deadline is not None and time.time() > deadline:
+                    return False
+                time.sleep(0.001)
+        return True
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    # ----------------------
+    # internals
+    # ----------------------
+    def _dispatch_locked(self):
+        while self._pending and self._running < self.max_workers:
+            job = self._next_fair_locked()
+            if job is None:
+                return
+            self._pending.remove(job)
+            self._running += 1
+            self._host_running[job.host] = self._host_running.get(job.host, 0) + 1
+            self._session_running[job.session_id] = self._session_running.get(job.session_id, 0) + 1
+            job.status = RUNNING
+            self._executor.submit(self._run, job)
+
+    def _next_fair_locked(self):
+        """Oldest runnable job of the session with the fewest jobs running"""
+        best = None
+        best_running = None
+        for job in self._pending:
+            if self._host_running.get(job.host, 0) >= self.per_host_limit:
+                continue
+            running = self._session_running.get(job.session_id, 0)
+            if best is None or running < best_running:
+                best, best_running = job, running
+                if running == 0:
+                    break
+        return best
+
+    def _run(self, job):
+        job.started = time.time()
+        try:
+            job.result = job.func(*job.args, progress=job.report, **job.kwargs)
+            job.status = DONE
+        except Exception as e:
+            job.error = str(e)
+            job.status = FAILED
+        finally:
+            job.finished = time.time()
+            job.func = job.args = job.kwargs = None
+            with self._lock:
+                self._running -= 1
+                self._host_running[job.host] -= 1
+                if not self._host_running[job.host]:
+                    del self._host_running[job.host]
+                self._session_running[job.session_id] -= 1
+                if not self._session_running[job.session_id]:
+                    del self._session_running[job.session_id]
+                self._finished.append(job.id)
+                self._trim_finished_locked()
+                self._dispatch_locked()
+
+    def _trim_finished_locked(self):
+        # Sessions that never come back would otherwise pin their results forever
+        while len(self._finished) > self.keep_finished:
+            self._jobs.pop(self._finished.popleft(), None)
+
+
+class SharedJob:
+    """A job row from the shared backend, read like a ``Job``"""
+
+    __slots__ = ("id", "session_id", "host", "label", "status", "done_units", "total_units", "result", "error")
+
+    def __init__(self, row, local=None):
+        self.id = row['id']
+        self.session_id = row['session_id']
+        self.host = row['host']
+        self.label = row['label']
+        self.status = row['status']
+        self.done_units = row['done']
+        self.total_units = row['total']
+        self.result = json.loads(row['result']) if row['result'] else None
+        self.error = row['error']
+        if local is not None and self.status == RUNNING:
+            # Running here: the live numbers, not the last heartbeat's
+            self.done_units, self.total_units = local.done_units, local.total_units
+
+    @property
+    def progress(self):
+        if self.status == DONE:
+            return 1.0
+        if not self.total_units:
+            return 0.0
+        return min(self.done_units / self.total_units, 1.0)
+
+    @property
+    def finished_ok(self):
+        return self.status == DONE
+
+    @property
+    def active(self):
+        return self.status in (QUEUED, RUNNING)
+
+    def snapshot(self):
+        return {
+            'id': self.id,
+            'label': self.label,
+            'host': self.host,
+            'status': self.status,
+            'done': self.done_units,
+            'total': self.total_units,
+            'error': self.error,
+        }
+
+
+class SharedJobQueue:
+    """Jobs kept in a shared backend and run by whichever replica claims them.
+
+    ``submit`` stores the job under its function's name; only functions
+    listed in ``handlers`` can be queued, and their arguments and results
+    must be JSON-serializable. ``context`` holds this replica's own keyword
+    arguments (caches, schedulers) added to every job it runs. A claimer thread leases queued jobs while the
+    local ``JobQueue`` has idle workers (skipping hosts already at their
+    per-host limit here), runs them there, and every ``heartbeat`` seconds
+    renews the leases and publishes progress in one transaction. Jobs of a
+    replica that stops renewing are claimed again once their lease expires.
+    """
+
+    def __init__(self, backend, handlers, local=None, owner=None, context=None, lease_ttl=30, heartbeat=2.0,
+                 poll_interval=0.25, max_attempts=3, keep_finished=24 * 3600):
+        self.backend = backend
+        self.handlers = {func.__name__: func for func in handlers}
+        self.context = context or {}
+        self.local = local or JobQueue()
+        self.owner = owner or new_owner()
+        self.lease_ttl = lease_ttl
+        self.heartbeat = heartbeat
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.keep_finished = keep_finished
+        self._lock = threading.Lock()
+        self._running = {}   # shared job ID -> local Job
+        self._hosts = {}     # host -> jobs claimed here and not finished
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="job-claimer", daemon=True)
+        self._thread.start()
+
+    def submit(self, session_id, host, func, *args, label="", **kwargs):
+        if func.__name__ not in self.handlers:
+            raise Exception(f"{func.__name__} is not registered with the shared job queue")
+        payload = json.dumps({'args': args, 'kwargs': kwargs})
+        job_id = self.backend.enqueue_job(session_id, host, label, func.__name__, payload)
+        # Claim it right away if this replica has a free worker
+        self._wake.set()
+        return self.get(job_id)
+
+    def get(self, job_id):
+        row = self.backend.get_job(job_id)
+        return SharedJob(row, self._running.get(job_id)) if row is not None else None
+
+    def jobs_for(self, session_id):
+        return [SharedJob(row, self._running.get(row['id'])) for row in self.backend.jobs_for(session_id)]
+
+    def forget(self, job_id):
+        self.backend.delete_job(job_id)
+
+    def stats(self):
+        counts = self.backend.job_counts()
+        with self._lock:
+            here = len(self._running)
+        return {
+            'running': counts.get(RUNNING, 0),
+            'pending': counts.get(QUEUED, 0),
+            'tracked': sum(counts.values()),
+            'running_here': here,
+        }
+
+    def wait(self, jobs, timeout=None):
+        deadline = None if timeout is None else time.time() + timeout
+        for job in jobs:
+            while job is not None and job.active:
+                if deadline is not None and time.time() > deadline:
+                    return False
+                time.sleep(0.05)
+                job = self.get(job.id)
+        return True
+
+    def shutdown(self, wait=True):
+        self._stop.set()
+        self._wake.set()
+        self._thread.join()
+        self.local.shutdown(wait=wait)
+
+    # ----------------------
+    # internals
+    # ----------------------
+    def _loop(self):
+        last_beat = last_trim = 0.0
+        while not self._stop.is_set():
+            try:
+                self._claim_available()
+                now = time.monotonic()
+                if now - last_beat >= self.heartbeat:
+                    self._renew()
+                    last_beat = now
+                if now - last_trim >= 3600:
+                    self.backend.trim_jobs(time.time() - self.keep_finished)
+                    last_trim = now
+            except Exception:
+                # The backend was busy or unreachable; the next round retries
+                pass
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def _claim_available(self):
+        while not self._stop.is_set():
+            with self._lock:
+                if len(self._running) >= self.local.max_workers:
+                    return
+                full = [host for host, count in self._hosts.items() if count >= self.local.per_host_limit]
+            row = self.backend.claim_job(self.owner, self.lease_ttl, skip_hosts=full,
+                                         max_attempts=self.max_attempts)
+            if row is None:
+                return
+            with self._lock:
+                self._hosts[row['host']] = self._hosts.get(row['host'], 0) + 1
+                job = self.local.submit(row['session_id'], row['host'], self._execute, row,
+                                        label=row['label'])
+                self._running[row['id']] = job
+
+    def _execute(self, row, progress=None):
+        try:
+            payload = json.loads(row['payload'])
+            result = self.handlers[row['handler']](*payload['args'], progress=progress,
+                                                   **payload['kwargs'], **self.context)
+            self.backend.finish_job(row['id'], self.owner, DONE, result=json.dumps(result))
+        except Exception as e:
+            self.backend.finish_job(row['id'], self.owner, FAILED, error=str(e))
+        finally:
+            with self._lock:
+                self._running.pop(row['id'], None)
+                self._hosts[row['host']] -= 1
+                if not self._hosts[row['host']]:
+                    del self._hosts[row['host']]
+            self._wake.set()
+
+    def _renew(self):
+        with self._lock:
+            progress = {job_id: (job.done_units, job.total_units) for job_id, job in self._running.items()}
+        if progress:
+            self.backend.renew_jobs(self.owner, progress, self.lease_ttl)
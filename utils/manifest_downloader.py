@@ -0,0 +1,386 @@
+"""HLS (m3u8) and DASH (MPD) downloads.
+
+A manifest is parsed into tracks, each a list of segment URLs (plus an
+optional init segment). For a master playlist or MPD, one variant is chosen
+to fit the ``quality`` preset's height cap. Segments are fetched by a
+bounded window of concurrent requests and appended to the track file
+strictly in order, so memory holds at most ``window`` segments whatever
+the stream length. The track files (video, and audio when the manifest
+carries it separately) are then remuxed by ffmpeg into one MP4 without
+re-encoding.
+"""
+import math
+import os
+import re
+import xml.etree.ElementTree as ET
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin, urlparse
+
+from utils.downloader import fetch_bytes, get_session
+from utils.format_converter import QUALITY_PRESETS, get_transcoder
+
+MANIFEST_EXTENSIONS = {".m3u8", ".mpd"}
+DEFAULT_WINDOW = 6
+ATTRIBUTE_RE = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+ISO_DURATION_RE = re.compile(r"^P(?:(\d+(?:\.\d+)?)D)?(?:T(?:(\d+(?:\.\d+)?)H)?(?:(\d+(?:\.\d+)?)M)?(?:(\d+(?:\.\d+)?)S)?)?$")
+TEMPLATE_RE = re.compile(r"\$(RepresentationID|Number|Bandwidth|Time)(%0(\d+)d)?\$")
+
+
+def is_manifest_url(url):
+    """True when the URL path points at an HLS or DASH manifest"""
+    path = urlparse(url).path.lower()
+    return os.path.splitext(path)[1] in MANIFEST_EXTENSIONS
+
+
+def _segment(uri, byte_range=None):
+    return {'uri': uri, 'range': byte_range}
+
+
+# ----------------------
+# HLS
+# ----------------------
+def parse_attributes(text):
+    """``KEY=value,KEY="quoted, value"`` attribute list of an HLS tag"""
+    return {key: value.strip('"') for key, value in ATTRIBUTE_RE.findall(text)}
+
+
+def parse_m3u8(text, base_url):
+    """Parse a master or media playlist.
+
+    A master playlist gives ``{'variants': [...], 'audio': {group: uri}}``;
+    a media playlist gives ``{'init': segment or None, 'segments': [...]}``.
+    """
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    if not lines or lines[0] != "#EXTM3U":
+        raise Exception("Not an HLS playlist")
+
+    if any(line.startswith("#EXT-X-STREAM-INF") for line in lines):
+        variants, audio = [], {}
+        pending = None
+        for line in lines:
+            if line.startswith("#EXT-X-STREAM-INF:"):
+                pending = parse_attributes(line.split(":", 1)[1])
+            elif line.startswith("#EXT-X-MEDIA:"):
+                attrs = parse_attributes(line.split(":", 1)[1])
+                if attrs.get("TYPE") == "AUDIO" and attrs.get("URI"):
+                    group = attrs.get("GROUP-ID")
+                    # The DEFAULT rendition wins; otherwise the first one listed
+                    if group not in audio or attrs.get("DEFAULT") == "YES":
+                        audio[group] = urljoin(base_url, attrs["URI"])
+            elif pending is not None and not line.startswith("#"):
+                resolution = pending.get("RESOLUTION", "")
+                variants.append({
+                    'uri': urljoin(base_url, line),
+                    'bandwidth': int(pending.get("BANDWIDTH", 0) or 0),
+                    'height': int(resolution.split("x")[1]) if "x" in resolution else None,
+                    'audio': pending.get("AUDIO"),
+                })
+                pending = None
+        return {'variants': variants, 'audio': audio}
+
+    init = None
+    segments = []
+    byte_range = None
+    offsets = {}
+    for line in lines:
+        if line.startswith("#EXT-X-KEY:"):
+            if parse_attributes(line.split(":", 1)[1]).get("METHOD", "NONE") != "NONE":
+                raise Exception("Encrypted HLS streams are not supported")
+        elif line.startswith("#EXT-X-MAP:"):
+            attrs = parse_attributes(line.split(":", 1)[1])
+            init_range = None
+            if "BYTERANGE" in attrs:
+                length, _, start = attrs["BYTERANGE"].partition("@")
+                init_range = (int(start or 0), int(start or 0) + int(length) - 1)
+            init = _segment(urljoin(base_url, attrs["URI"]), init_range)
+        elif line.startswith("#EXT-X-BYTERANGE:"):
+            length, _, start = line.split(":", 1)[1].partition("@")
+            byte_range = (int(length), int(start) if start else None)
+        elif line.startswith("#EXT-X-PLAYLIST-TYPE:EVENT"):
+            raise Exception("Live streams are not supported")
+        elif not line.startswith("#"):
+            uri = urljoin(base_url, line)
+            bounds = None
+            if byte_range is not None:
+                length, start = byte_range
+                # Without an offset the range continues where the previous one on this URI ended
+                start = offsets.get(uri, 0) if start is None else start
+                bounds = (start, start + length - 1)
+                offsets[uri] = start + length
+                byte_range = None
+            segments.append(_segment(uri, bounds))
+    if "#EXT-X-ENDLIST" not in lines:
+        raise Exception("Live streams are not supported")
+    return {'init': init, 'segments': segments}
+
+
+# ----------------------
+# DASH
+# ----------------------
+def _local(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+def _children(element, name):
+    return [child for child in element if _local(child.tag) == name]
+
+
+def _child(element, name):
+    found = _children(element, name)
+    return found[0] if found else None
+
+
+def _base(element, base_url):
+    node = _child(element, "BaseURL")
+    return urljoin(base_url, node.text.strip()) if node is not None and node.text else base_url
+
+
+def parse_iso_duration(value):
+    """Seconds in an ISO 8601 duration such as ``PT1H2M3.5S``"""
+    match = ISO_DURATION_RE.match(value or "")
+    if not match:
+        raise Exception(f"Unsupported MPD duration: {value}")
+    days, hours, minutes, seconds = (float(part or 0) for part in match.groups())
+    return days * 86400 + hours * 3600 + minutes * 60 + seconds
+
+
+def expand_template(template, representation_id, bandwidth, number=None, time=None):
+    def replace(match):
+        value = {'RepresentationID': representation_id, 'Bandwidth': bandwidth,
+                 'Number': number, 'Time': time}[match.group(1)]
+        if match.group(3):
+            return str(value).zfill(int(match.group(3)))
+        return str(value)
+    return TEMPLATE_RE.sub(replace, template).replace("$$", "$")
+
+
+def _merged_template(*elements):
+    """SegmentTemplate attributes, Representation level overriding AdaptationSet level"""
+    merged, timeline = {}, None
+    for element in elements:
+        node = _child(element, "SegmentTemplate")
+        if node is not None:
+            merged.update(node.attrib)
+            node_timeline = _child(node, "SegmentTimeline")
+            if node_timeline is not None:
+                timeline = node_timeline
+    return (merged, timeline) if merged else (None, None)
+
+
+def _template_segments(template, timeline, rep_id, bandwidth, base_url, total_seconds):
+    init = None
+    if "initialization" in template:
+        init = _segment(urljoin(base_url, expand_template(template["initialization"], rep_id, bandwidth)))
+    media = template.get("media")
+    if media is None:
+        raise Exception("SegmentTemplate without a media attribute")
+    number = int(template.get("startNumber", 1))
+    segments = []
+    if timeline is not None:
+        time = 0
+        for entry in _children(timeline, "S"):
+            time = int(entry.get("t", time))
+            duration = int(entry.get("d"))
+            for _ in range(int(entry.get("r", 0)) + 1):
+                segments.append(_segment(urljoin(base_url, expand_template(media, rep_id, bandwidth, number, time))))
+                time += duration
+                number += 1
+    else:
+        if "duration" not in template or total_seconds is None:
+            raise Exception("SegmentTemplate needs a SegmentTimeline or a duration")
+        timescale = int(template.get("timescale", 1))
+        count = math.ceil(total_seconds * timescale / int(template["duration"]))
+        for n in range(number, number + count):
+            segments.append(_segment(urljoin(base_url, expand_template(media, rep_id, bandwidth, n))))
+    return init, segments
+
+
+def _list_segments(segment_list, base_url):
+    init = None
+    node = _child(segment_list, "Initialization")
+    if node is not None and node.get("sourceURL"):
+        init = _segment(urljoin(base_url, node.get("sourceURL")))
+    segments = []
+    for entry in _children(segment_list, "SegmentURL"):
+        bounds = None
+        if entry.get("mediaRange"):
+            start, end = entry.get("mediaRange").split("-")
+            bounds = (int(start), int(end))
+        segments.append(_segment(urljoin(base_url, entry.get("media", "")), bounds))
+    return init, segments
+
+
+def parse_mpd(text, base_url):
+    """Parse a static MPD into ``{'video': [representations], 'audio': [...]}``"""
+    root = ET.fromstring(text)
+    if root.get("type") == "dynamic":
+        raise Exception("Live streams are not supported")
+    total = root.get("mediaPresentationDuration")
+    total_seconds = parse_iso_duration(total) if total else None
+    base_url = _base(root, base_url)
+    period = _child(root, "Period")
+    if period is None:
+        raise Exception("MPD has no Period")
+    base_url = _base(period, base_url)
+    if period.get("duration"):
+        total_seconds = parse_iso_duration(period.get("duration"))
+
+    tracks = {'video': [], 'audio': []}
+    for adaptation in _children(period, "AdaptationSet"):
+        kind = (adaptation.get("contentType") or adaptation.get("mimeType") or "").split("/")[0]
+        adaptation_base = _base(adaptation, base_url)
+        if _child(adaptation, "ContentProtection") is not None:
+            raise Exception("DRM protected DASH streams are not supported")
+        for rep in _children(adaptation, "Representation"):
+            rep_kind = kind or (rep.get("mimeType") or "").split("/")[0]
+            if rep_kind not in tracks:
+                continue
+            rep_id = rep.get("id", "")
+            bandwidth = rep.get("bandwidth", "0")
+            rep_base = _base(rep, adaptation_base)
+            template, timeline = _merged_template(adaptation, rep)
+            segment_list = _child(rep, "SegmentList")
+            if segment_list is None:
+                segment_list = _child(adaptation, "SegmentList")
+            if template is not None:
+                init, segments = _template_segments(template, timeline, rep_id, bandwidth, rep_base, total_seconds)
+            elif segment_list is not None:
+                init, segments = _list_segments(segment_list, rep_base)
+            else:
+                # SegmentBase or bare BaseURL: the whole representation is one file
+                init, segments = None, [_segment(rep_base)]
+            height = rep.get("height") or adaptation.get("height")
+            tracks[rep_kind].append({
+                'bandwidth': int(bandwidth),
+                'height': int(height) if height else None,
+                'init': init,
+                'segments': segments,
+            })
+    return tracks
+
+
+# ----------------------
+# variant choice and fetching
+# ----------------------
+def choose_variant(variants, quality):
+    """Best variant within the preset's height cap; the smallest one when none fits"""
+    if not variants:
+        raise Exception("Manifest lists no playable variants")
+    max_height = QUALITY_PRESETS.get(quality, QUALITY_PRESETS["High"])["height"]
+    rank = lambda v: (v['height'] or 0, v['bandwidth'])
+    fitting = [v for v in variants if max_height is None or v['height'] is None or v['height'] <= max_height]
+    return max(fitting, key=rank) if fitting else min(variants, key=rank)
+
+
+def fetch_segments(segments, dest, window=DEFAULT_WINDOW, session=None, throttle=None, advance=None):
+    """Fetch ``segments`` with up to ``window`` requests in flight, appending them to ``dest`` in order"""
+    session = session or get_session()
+    written = 0
+    pool = ThreadPoolExecutor(max_workers=window, thread_name_prefix="hls")
+    pending = deque()
+    todo = iter(segments)
+
+    def submit():
+        segment = next(todo, None)
+        if segment is not None:
+            pending.append(pool.submit(fetch_bytes, segment['uri'], session=session,
+                                       throttle=throttle, byte_range=segment['range']))
+
+    try:
+        for _ in range(window):
+            submit()
+        with open(dest, "wb") as f:
+            while pending:
+                data = pending.popleft().result()
+                submit()
+                f.write(data)
+                written += len(data)
+                if advance is not None:
+                    advance(len(data))
+    except BaseException:
+        pool.shutdown(wait=False, cancel_futures=True)
+        if os.path.exists(dest):
+            os.remove(dest)
+        raise
+    pool.shutdown()
+    return written
+
+
+def resolve_tracks(url, quality="High", session=None, throttle=None):
+    """Tracks to fetch for a manifest URL: ``[{'kind', 'init', 'segments'}, ...]`` plus the chosen variant"""
+    session = session or get_session()
+    text = fetch_bytes(url, session=session, throttle=throttle).decode("utf-8", errors="replace")
+    if urlparse(url).path.lower().endswith(".mpd"):
+        parsed = parse_mpd(text, url)
+        video = choose_variant(parsed['video'], quality)
+        tracks = [dict(video, kind="video")]
+        if parsed['audio']:
+            audio = max(parsed['audio'], key=lambda rep: rep['bandwidth'])
+            tracks.append(dict(audio, kind="audio"))
+        return tracks, video
+
+    parsed = parse_m3u8(text, url)
+    if 'variants' not in parsed:
+        return [dict(parsed, kind="video")], None
+    variant = choose_variant(parsed['variants'], quality)
+    text = fetch_bytes(variant['uri'], session=session, throttle=throttle).decode("utf-8", errors="replace")
+    tracks = [dict(parse_m3u8(text, variant['uri']), kind="video")]
+    audio_uri = parsed['audio'].get(variant['audio'])
+    if audio_uri is not None:
+        text = fetch_bytes(audio_uri, session=session, throttle=throttle).decode("utf-8", errors="replace")
+        tracks.append(dict(parse_m3u8(text, audio_uri), kind="audio"))
+    return tracks, variant
+
+
+def fetch_manifest(url, dest, quality="High", progress=None, window=DEFAULT_WINDOW, session=None,
+                   throttle=None, work_dir=None, remux=True):
+    """Download the stream behind ``url`` and remux it into an MP4 at ``dest``.
+
+    ``progress(done, total)`` reports bytes; the total is estimated from the
+    average segment size so far. With ``remux=False`` the single track file
+    is moved to ``dest`` as is (only meaningful for one-track streams).
+    """
+    # Fail before any segment is fetched rather than after the whole stream is on disk
+    if remux and not get_transcoder().available:
+        raise Exception("ffmpeg is not installed; streaming (HLS/DASH) downloads are unavailable")
+    session = session or get_session()
+    tracks, variant = resolve_tracks(url, quality, session=session, throttle=throttle)
+    work_dir = work_dir or os.path.dirname(dest) or "."
+    os.makedirs(work_dir, exist_ok=True)
+    stem = os.path.join(work_dir, os.path.splitext(os.path.basename(dest))[0])
+
+    count = sum(len(track['segments']) + (track['init'] is not None) for track in tracks)
+    state = {'bytes': 0, 'segments': 0}
+
+    def advance(n):
+        state['bytes'] += n
+        state['segments'] += 1
+        if progress is not None:
+            estimate = state['bytes'] * count // state['segments']
+            progress(state['bytes'], max(estimate, state['bytes']))
+
+    paths = []
+    try:
+        for track in tracks:
+            path = f"{stem}.{track['kind']}"
+            segments = ([track['init']] if track['init'] is not None else []) + track['segments']
+            fetch_segments(segments, path, window=window, session=session, throttle=throttle, advance=advance)
+            paths.append(path)
+        if remux:
+            get_transcoder().remux(paths, dest)
+        else:
+            os.replace(paths[0], dest)
+    finally:
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+    if progress is not None:
+        progress(state['bytes'], state['bytes'])
+    return {
+        'bytes': state['bytes'],
+        'segments': count,
+        'tracks': len(tracks),
+        'height': variant['height'] if variant else None,
+        'content_type': "video/mp4",
+    }
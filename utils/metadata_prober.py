@@ -0,0 +1,289 @@
+"""Cached, coalesced metadata probing for media URLs.
+
+A probe asks the platform's oEmbed endpoint, reads OpenGraph tags from the
+page head, or sends a HEAD request when the URL is a media file. Probes run
+as coroutines on one event loop in a background thread. The blocking HTTP
+calls go through the pooled ``requests`` session (see ``utils.downloader``)
+on a bounded executor, so every session shares one client. Concurrent probes
+of the same URL await a single in-flight task. Results, failures
+included, are cached with a TTL in an LRU shared by all sessions.
+"""
+import asyncio
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
+from urllib.parse import quote, urljoin, urlparse
+
+from utils.download_cache import normalize_url
+from utils.downloader import get_session, is_direct_media_url
+from utils.platform_detector import detect_platform
+
+PROBE_TIMEOUT = (3, 5)  # connect, read
+# The <head> of every platform page we know fits in this
+MAX_HTML_BYTES = 256 * 1024
+DEFAULT_TTL = 15 * 60
+NEGATIVE_TTL = 60
+DEFAULT_MAX_ENTRIES = 4096
+
+OEMBED_ENDPOINTS = {
+    "Vimeo": "https://vimeo.com/api/oembed.json?url={url}",
+    "Dailymotion": "https://www.dailymotion.com/services/oembed?url={url}",
+    "TikTok": "https://www.tiktok.com/oembed?url={url}",
+    "Twitter": "https://publish.twitter.com/oembed?url={url}",
+    "Flickr": "https://www.flickr.com/services/oembed/?format=json&url={url}",
+    "YouTube": "https://www.youtube.com/oembed?format=json&url={url}",
+}
+
+DURATION_RE = re.compile(r"^\d+(\.\d+)?$")
+
+_prober = None
+_prober_lock = threading.Lock()
+
+
+def empty_metadata():
+    return {
+        'title': None,
+        'duration': None,
+        'thumbnail': None,
+        'content_type': None,
+        'content_length': None,
+        'source': None,
+    }
+
+
+class OpenGraphParser(HTMLParser):
+    """Collects ``og:*``/``video:*``/``twitter:*`` meta tags and the <title>"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.tags = {}
+        self.title = None
+        self._in_title = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "meta":
+            attrs = dict(attrs)
+            key = attrs.get("property") or attrs.get("name") or ""
+            if key.startswith(("og:", "video:", "twitter:")) and attrs.get("content"):
+                self.tags.setdefault(key, attrs["content"])
+        elif tag == "title":
+            self._in_title = True
+
+    def handle_data(self, data):
+        if self._in_title and self.title is None:
+            self.title = data.strip() or None
+
+    def handle_endtag(self, tag):
+        if tag == "title":
+            self._in_title = False
+
+
+def image_url(value, base=None):
+    """Absolute http(s) URL for a thumbnail a remote page names; None for anything else"""
+    if not isinstance(value, str) or not value.strip():
+        return None
+    # Resolved against the page: st.image would read a bare path as a file on this server
+    url = urljoin(base, value.strip()) if base else value.strip()
+    parsed = urlparse(url)
+    return url if parsed.scheme in ("http", "https") and parsed.netloc else None
+
+
+def parse_opengraph(html, base=None):
+    """Metadata dict from the OpenGraph tags of an HTML document served at ``base``"""
+    parser = OpenGraphParser()
+    parser.feed(html)
+    tags = parser.tags
+    meta = empty_metadata()
+    meta['title'] = tags.get("og:title") or tags.get("twitter:title") or parser.title
+    meta['thumbnail'] = image_url(tags.get("og:image") or tags.get("twitter:image"), base)
+    duration = tags.get("og:video:duration") or tags.get("video:duration")
+    if duration and DURATION_RE.match(duration):
+        meta['duration'] = int(float(duration))
+    meta['source'] = "opengraph"
+    return meta
+
+
+def parse_oembed(payload):
+    data = json.loads(payload)
+    meta = empty_metadata()
+    meta['title'] = data.get("title")
+    meta['thumbnail'] = image_url(data.get("thumbnail_url"))
+    if isinstance(data.get("duration"), (int, float)):
+        meta['duration'] = int(data["duration"])
+    meta['source'] = "oembed"
+    return meta
+
+
+class MetadataProber:
+    """Async prober with request coalescing and a TTL + LRU result cache"""
+
+    def __init__(self, ttl=DEFAULT_TTL, negative_ttl=NEGATIVE_TTL, max_entries=DEFAULT_MAX_ENTRIES,
+                 max_concurrency=16, session=None, timeout=PROBE_TIMEOUT):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.session = session or get_session()
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.fetches = 0
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()   # key -> (expires, metadata)
+        self._inflight = {}           # key -> asyncio.Task, only touched on the loop thread
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="probe")
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True, name="probe-loop")
+        self._thread.start()
+
+    # ----------------------
+    # public API
+    # ----------------------
+    def probe(self, url, timeout=None):
+        """Metadata for ``url``; served from the cache when it is fresh"""
+        key = normalize_url(url)
+        cached = self._cached(key)
+        if cached is not None:
+            return cached
+        future = asyncio.run_coroutine_threadsafe(self._probe(key, url), self._loop)
+        return dict(future.result(timeout))
+
+    def probe_many(self, urls, timeout=None):
+        """Probe several URLs concurrently; results come back in input order"""
+        async def gather(todo):
+            return await asyncio.gather(*(self._probe(normalize_url(url), url) for url in todo))
+
+        results = [self._cached(normalize_url(url)) for url in urls]
+        todo = [url for url, cached in zip(urls, results) if cached is None]
+        if todo:
+            fetched = iter(asyncio.run_coroutine_threadsafe(gather(todo), self._loop).result(timeout))
+            results = [dict(next(fetched)) if cached is None else cached for cached in results]
+        return results
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'fetches': self.fetches,
+                'entries': len(self._cache),
+            }
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def shutdown(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._executor.shutdown(wait=False)
+
+    # ----------------------
+    # internals
+    # ----------------------
+    def _cached(self, key):
+        with self._lock:
+            item = self._cache.get(key)
+            if item is not None and item[0] > time.monotonic():
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return dict(item[1])
+            self.misses += 1
+            return None
+
+    async def _probe(self, key, url):
+        task = self._inflight.get(key)
+        if task is not None:
+            with self._lock:
+                self.coalesced += 1
+            return await asyncio.shield(task)
+        # Another caller may have filled the cache while this one was queued
+        with self._lock:
+            item = self._cache.get(key)
+            if item is not None and item[0] > time.monotonic():
+                return item[1]
+        task = asyncio.ensure_future(self._fetch(key, url))
+        self._inflight[key] = task
+        try:
+            meta = await asyncio.shield(task)
+        finally:
+            self._inflight.pop(key, None)
+        return meta
+
+    async def _fetch(self, key, url):
+        with self._lock:
+            self.fetches += 1
+        meta = empty_metadata()
+        try:
+            if is_direct_media_url(url):
+                meta = await self._run(self._head, url)
+            else:
+                platform = detect_platform(url)["name"]
+                endpoint = OEMBED_ENDPOINTS.get(platform)
+                if endpoint is not None:
+                    # oEmbed is cheap and authoritative; the page is only read when it has no answer
+                    meta = await self._run(self._oembed, endpoint.format(url=quote(url, safe="")))
+                if meta['title'] is None:
+                    meta = await self._run(self._opengraph, url)
+        except Exception:
+            meta = empty_metadata()
+        ttl = self.ttl if meta['source'] is not None else self.negative_ttl
+        with self._lock:
+            self._cache[key] = (time.monotonic() + ttl, meta)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return meta
+
+    async def _run(self, func, *args):
+        return await self._loop.run_in_executor(self._executor, func, *args)
+
+    def _head(self, url):
+        meta = empty_metadata()
+        response = self.session.head(url, allow_redirects=True, timeout=self.timeout)
+        response.raise_for_status()
+        length = response.headers.get("Content-Length")
+        meta['content_length'] = int(length) if length and length.isdigit() else None
+        meta['content_type'] = response.headers.get("Content-Type")
+        meta['source'] = "head"
+        return meta
+
+    def _oembed(self, endpoint):
+        response = self.session.get(endpoint, timeout=self.timeout)
+        if response.status_code != 200:
+            return empty_metadata()
+        return parse_oembed(response.content)
+
+    def _opengraph(self, url):
+        with self.session.get(url, stream=True, timeout=self.timeout) as response:
+            response.raise_for_status()
+            content_type = response.headers.get("Content-Type", "")
+            if "html" not in content_type:
+                meta = empty_metadata()
+                meta['content_type'] = content_type or None
+                length = response.headers.get("Content-Length")
+                meta['content_length'] = int(length) if length and length.isdigit() else None
+                meta['source'] = "head"
+                return meta
+            body = b""
+            for chunk in response.iter_content(chunk_size=16 * 1024):
+                body += chunk
+                if len(body) >= MAX_HTML_BYTES or b"</head>" in body[-16 * 1024 - 7:]:
+                    break
+        html = body.decode(response.encoding or "utf-8", errors="replace")
+        return parse_opengraph(html, response.url)
+
+
+def get_prober():
+    """Process-wide metadata prober shared by every session"""
+    global _prober
+    if _prober is None:
+        with _prober_lock:
+            if _prober is None:
+                _prober = MetadataProber()
+    return _prober
@@ -0,0 +1,217 @@
+"""Lightweight hot-path instrumentation.
+
+Counters and latency histograms keyed by name + labels, with Prometheus
+text and JSON export. Everything is gated on ``Metrics.enabled``: when it
+is off, ``timer()`` hands back one shared no-op context manager and
+``inc``/``observe`` return after a single attribute check, so leaving the
+calls in the hot path costs next to nothing.
+
+Enable with ``MEDIA_DOWNLOADER_METRICS=1``; set
+``MEDIA_DOWNLOADER_METRICS_PORT`` to also serve ``/metrics`` (Prometheus)
+and ``/metrics.json`` from a small background HTTP server.
+"""
+import bisect
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds in seconds: 0.1 ms doubling up to ~107 s
+LATENCY_BUCKETS = tuple(0.0001 * 2 ** i for i in range(21))
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    __slots__ = ("metrics", "name", "labels", "start")
+
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class Histogram:
+    """Fixed-bucket histogram; percentiles are interpolated within a bucket"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += 1
+        self.sum += value
+
+    def percentile(self, q):
+        if not self.total:
+            return 0.0
+        rank = q * self.total
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1] * 2
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items())) if labels else ()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key, extra=None):
+    pairs = list(key) + (list(extra.items()) if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class Metrics:
+    """Process-wide counters and histograms"""
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self.started = time.time()
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        if not self.enabled:
+            return
+        key = (name, _label_key(labels))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = Histogram()
+            hist.observe(value)
+
+    def timer(self, name, **labels):
+        """Context manager recording the block's wall time into ``<name>_seconds``"""
+        if not self.enabled:
+            return NULL_TIMER
+        return _Timer(self, f"{name}_seconds", labels)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    # ----------------------
+    # export
+    # ----------------------
+    def snapshot(self):
+        """JSON-friendly view: counters plus count/mean/p50/p95/p99 per histogram"""
+        with self._lock:
+            counters = [
+                {'name': name, 'labels': dict(key), 'value': value}
+                for (name, key), value in sorted(self._counters.items())
+            ]
+            histograms = [
+                {
+                    'name': name,
+                    'labels': dict(key),
+                    'count': hist.total,
+                    'mean_ms': hist.sum / hist.total * 1000 if hist.total else 0.0,
+                    'p50_ms': hist.percentile(0.50) * 1000,
+                    'p95_ms': hist.percentile(0.95) * 1000,
+                    'p99_ms': hist.percentile(0.99) * 1000,
+                }
+                for (name, key), hist in sorted(self._histograms.items())
+            ]
+        return {'uptime_s': time.time() - self.started, 'counters': counters, 'histograms': histograms}
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self, prefix="media_downloader_"):
+        lines = []
+        with self._lock:
+            for (name, key), value in sorted(self._counters.items()):
+                lines.append(f"{prefix}{name}{_format_labels(key)} {value}")
+            for (name, key), hist in sorted(self._histograms.items()):
+                full = prefix + name
+                cumulative = 0
+                for bound, count in zip(hist.buckets, hist.counts):
+                    cumulative += count
+                    lines.append(f"{full}_bucket{_format_labels(key, {'le': f'{bound:g}'})} {cumulative}")
+                lines.append(f"{full}_bucket{_format_labels(key, {'le': '+Inf'})} {hist.total}")
+                lines.append(f"{full}_sum{_format_labels(key)} {hist.sum}")
+                lines.append(f"{full}_count{_format_labels(key)} {hist.total}")
+        return "\n".join(lines) + "\n"
+
+
+def serve_metrics(metrics, port, host="0.0.0.0"):
+    """Expose ``/metrics`` and ``/metrics.json`` on a daemon thread"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path == "/metrics":
+                body, kind = metrics.to_prometheus().encode(), "text/plain; version=0.0.4"
+            elif self.path == "/metrics.json":
+                body, kind = metrics.to_json().encode(), "application/json"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", kind)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics-http").start()
+    return server
+
+
+def get_metrics():
+    """Process-wide registry, enabled by ``MEDIA_DOWNLOADER_METRICS=1``"""
+    global _metrics
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                _metrics = Metrics(enabled=os.environ.get("MEDIA_DOWNLOADER_METRICS") == "1")
+                port = os.environ.get("MEDIA_DOWNLOADER_METRICS_PORT")
+                if _metrics.enabled and port:
+                    serve_metrics(_metrics, int(port))
+    return _metrics
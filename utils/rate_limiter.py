@@ -0,0 +1,184 @@
+"""Per-platform request limits and fair bandwidth sharing between sessions.
+
+Every platform (by ``detect_platform`` name) gets a token bucket that caps
+how fast requests are started against it, shared by all sessions of the
+process. A 429/503 answer pauses the whole platform for its Retry-After
+delay, so one throttled job holds back its siblings instead of every job
+hammering the server in turn. Optionally the process-wide download
+bandwidth is capped and split between active sessions by weight, however
+many transfers each session has running.
+"""
+import threading
+import time
+
+# requests per second, burst size
+PLATFORM_REQUEST_LIMITS = {
+    "Vimeo": (2.0, 4),
+    "Facebook": (2.0, 4),
+    "Instagram": (1.0, 2),
+    "TikTok": (1.0, 2),
+    "Twitter": (1.0, 3),
+}
+DEFAULT_REQUEST_LIMIT = (4.0, 8)
+
+# Credit an idle session may bank, in seconds of its share
+BANDWIDTH_BURST = 0.25
+
+
+class TokenBucket:
+    """Blocking token bucket that can also be paused until a point in time"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._stamp = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take one token, sleeping until it is available; returns the wait"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._stamp) * self.rate)
+            self._stamp = now
+            # Reserve the token now (possibly going into debt) so waiters keep FIFO order
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        waited = 0.0
+        while True:
+            # A pause can arrive while we sleep on a reserved token; honour it too
+            wait = max(wait, self._paused_until - time.monotonic())
+            if wait <= 0:
+                return waited
+            time.sleep(wait)
+            waited += wait
+            wait = 0.0
+
+    def pause(self, delay):
+        """Hold every caller back for ``delay`` seconds (a server asked us to)"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+            self._tokens = min(self._tokens, 0.0)
+
+    @property
+    def paused_for(self):
+        return max(0.0, self._paused_until - time.monotonic())
+
+
+class FairShare:
+    """Split ``rate`` bytes/sec between active sessions in proportion to weight.
+
+    Each session keeps a virtual clock of when its next byte may be sent;
+    ``consume`` advances it by ``nbytes / share`` and sleeps off any lead.
+    Shares are recomputed on every call, so when a session goes idle the
+    others speed up on their next chunk.
+    """
+
+    def __init__(self, rate):
+        self.rate = rate
+        self._lock = threading.Lock()
+        self._sessions = {}
+
+    def join(self, session_id, weight=1.0):
+        with self._lock:
+            state = self._sessions.setdefault(session_id, {'weights': [], 'ready_at': 0.0})
+            state['weights'].append(weight)
+
+    def leave(self, session_id, weight=1.0):
+        with self._lock:
+            state = self._sessions.get(session_id)
+            if state is None:
+                return
+            state['weights'].remove(weight)
+            if not state['weights']:
+                del self._sessions[session_id]
+
+    def consume(self, session_id, nbytes):
+        with self._lock:
+            state = self._sessions[session_id]
+            total_weight = sum(max(s['weights']) for s in self._sessions.values())
+            share = self.rate * max(state['weights']) / total_weight
+            now = time.monotonic()
+            start = max(state['ready_at'], now - BANDWIDTH_BURST)
+            state['ready_at'] = start + nbytes / share
+            wait = start - now
+        if wait > 0:
+            time.sleep(wait)
+
+    def active(self):
+        with self._lock:
+            return {sid: max(s['weights']) for sid, s in self._sessions.items()}
+
+
+class Throttle:
+    """Gate for one transfer, handed to the downloader functions"""
+
+    def __init__(self, scheduler, platform, session_id, weight):
+        self.scheduler = scheduler
+        self.platform = platform
+        self.session_id = session_id
+        self.weight = weight
+        self.bucket = scheduler.bucket(platform)
+        self.throttled = 0
+        self.waited = 0.0
+
+    def before_request(self):
+        self.waited += self.bucket.acquire()
+
+    def backoff(self, delay):
+        """Called on 429/503: pause the platform, then wait like everyone else"""
+        self.throttled += 1
+        self.scheduler.record_throttled(self.platform)
+        self.bucket.pause(delay)
+
+    def consume(self, nbytes):
+        if self.scheduler.bandwidth is not None:
+            self.scheduler.bandwidth.consume(self.session_id, nbytes)
+
+    def __enter__(self):
+        if self.scheduler.bandwidth is not None:
+            self.scheduler.bandwidth.join(self.session_id, self.weight)
+        return self
+
+    def __exit__(self, *exc):
+        if self.scheduler.bandwidth is not None:
+            self.scheduler.bandwidth.leave(self.session_id, self.weight)
+        return False
+
+
+class DownloadScheduler:
+    """Shared request limits per platform plus optional weighted bandwidth sharing"""
+
+    def __init__(self, limits=None, default_limit=DEFAULT_REQUEST_LIMIT, bandwidth=None):
+        self.limits = dict(PLATFORM_REQUEST_LIMITS if limits is None else limits)
+        self.default_limit = default_limit
+        self.bandwidth = FairShare(bandwidth) if bandwidth else None
+        self._buckets = {}
+        self._throttled = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, platform):
+        with self._lock:
+            bucket = self._buckets.get(platform)
+            if bucket is None:
+                rate, burst = self.limits.get(platform, self.default_limit)
+                bucket = self._buckets[platform] = TokenBucket(rate, burst)
+            return bucket
+
+    def throttle(self, platform, session_id, weight=1.0):
+        """Context manager for one transfer; pass it to ``fetch_to_file``/``fetch_segmented``"""
+        return Throttle(self, platform, session_id, weight)
+
+    def record_throttled(self, platform):
+        with self._lock:
+            self._throttled[platform] = self._throttled.get(platform, 0) + 1
+
+    def stats(self):
+        with self._lock:
+            buckets = dict(self._buckets)
+            throttled = dict(self._throttled)
+        return {
+            platform: {'throttled': throttled.get(platform, 0), 'paused_for': bucket.paused_for}
+            for platform, bucket in buckets.items()
+        }
@@ -0,0 +1,352 @@
+"""State shared by several app replicas behind one load balancer.
+
+A replica is one Streamlit process. Replicas of one deployment point
+``MEDIA_DOWNLOADER_SHARED`` at the same backend and mount the same
+``downloads/`` volume and history database. The backend holds three
+things:
+
+- leases: named locks with an expiry that their holder keeps renewing, so
+  a replica that dies releases everything it held once its leases run out;
+- jobs: download jobs any replica can claim under a lease (see
+  ``utils.job_queue.SharedJobQueue``);
+- the file index: which finished download (object path, digest, size)
+  answers a cache key, so a replica can reuse a file a peer fetched.
+
+Backends are chosen by URL scheme. ``sqlite:///path/shared.db`` is a
+SQLite file on the shared volume; SQLite's file locks serialize writers,
+and every claim or lease change is a single statement, so two replicas
+can never both win one. It uses a rollback journal rather than WAL, whose
+shared-memory index only works for processes on one host. Even so it
+relies on the volume honouring POSIX locks: fine for replicas on one host
+or a local Docker volume, but NFS/SMB mounts often get locking wrong, so
+replicas on several hosts want a server-backed store. Another store (a Redis-protocol server, say)
+plugs in by implementing the same methods and registering its scheme in
+``BACKENDS``.
+"""
+import contextlib
+import json
+import os
+import re
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from urllib.parse import urlparse
+
+LEASE_TTL = 30
+# How long a replica waits for a peer that is fetching the same request. The
+# waiting job keeps its worker (and its job lease) for that time, so a burst
+# of identical requests can tie up a replica's pool until the fetch is done
+DEDUP_WAIT = 600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    host TEXT NOT NULL,
+    label TEXT NOT NULL,
+    handler TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    owner TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    done INTEGER NOT NULL DEFAULT 0,
+    total INTEGER,
+    result TEXT,
+    error TEXT,
+    created REAL NOT NULL,
+    finished REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id);
+CREATE INDEX IF NOT EXISTS jobs_session ON jobs (session_id, id);
+
+CREATE TABLE IF NOT EXISTS files (
+    key TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    meta TEXT NOT NULL,
+    owner TEXT NOT NULL,
+    ts REAL NOT NULL
+);
+"""
+
+JOB_COLUMNS = ("id", "session_id", "host", "label", "handler", "payload", "status", "owner",
+               "attempts", "done", "total", "result", "error", "created", "finished")
+
+
+def replica_id():
+    """Stable name of this replica: MEDIA_DOWNLOADER_REPLICA, else the host name"""
+    name = os.environ.get("MEDIA_DOWNLOADER_REPLICA") or socket.gethostname()
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", name)
+
+
+def new_owner(replica=None):
+    """Lease owner token, unique per process even when two share a replica name"""
+    return f"{replica or replica_id()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class SQLiteBackend:
+    """Leases, jobs and the file index in one SQLite file every replica can open"""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript(SCHEMA)
+        conn.commit()
+
+    # ----------------------
+    # leases
+    # ----------------------
+    def acquire_lease(self, name, owner, ttl=LEASE_TTL):
+        """Take ``name`` if it is free, expired or already ours; True on success"""
+        now = time.time()
+        with self._conn() as conn:
+            cur = conn.execute(
+                "INSERT INTO leases (name, owner, expires) VALUES (?, ?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, expires = excluded.expires "
+                "WHERE leases.expires < ? OR leases.owner = excluded.owner",
+                (name, owner, now + ttl, now),
+            )
+            return cur.rowcount > 0
+
+    def renew_leases(self, owner, names, ttl=LEASE_TTL):
+        expires = time.time() + ttl
+        with self._conn() as conn:
+            conn.executemany("UPDATE leases SET expires = ? WHERE name = ? AND owner = ?",
+                             [(expires, name, owner) for name in names])
+
+    def release_lease(self, name, owner):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, owner))
+
+    def lease_owner(self, name):
+        row = self._conn().execute(
+            "SELECT owner FROM leases WHERE name = ? AND expires >= ?", (name, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    # ----------------------
+    # jobs
+    # ----------------------
+    def enqueue_job(self, session_id, host, label, handler, payload):
+        with self._conn() as conn:
+            cur = conn.execute(
+                "INSERT INTO jobs (session_id, host, label, handler, payload, status, created) "
+                "VALUES (?, ?, ?, ?, ?, 'queued', ?)",
+                (session_id, host, label, handler, payload, time.time()),
+            )
+            return cur.lastrowid
+
+    def claim_job(self, owner, ttl, skip_hosts=(), max_attempts=3):
+        """Lease the oldest queued (or abandoned) job to ``owner``; None when there is none.
+
+        A job whose lease ran out ``max_attempts`` times is failed instead
+        of being handed out again.
+        """
+        now = time.time()
+        skip = tuple(skip_hosts)
+        host_filter = f"AND host NOT IN ({', '.join('?' for _ in skip)})" if skip else ""
+        with self._conn() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = 'Abandoned by the replicas that ran it', "
+                "finished = ? WHERE status = 'running' AND lease_until < ? AND attempts >= ?",
+                (now, now, max_attempts),
+            )
+            rows = conn.execute(
+                "UPDATE jobs SET status = 'running', owner = ?, lease_until = ?, attempts = attempts + 1 "
+                "WHERE id = (SELECT id FROM jobs WHERE (status = 'queued' OR "
+                f"(status = 'running' AND lease_until < ?)) {host_filter} ORDER BY id LIMIT 1) "
+                f"RETURNING {', '.join(JOB_COLUMNS)}",
+                (owner, now + ttl, now) + skip,
+            ).fetchall()
+        return dict(rows[0]) if rows else None
+
+    def renew_jobs(self, owner, progress, ttl):
+        """Extend ``owner``'s leases and store progress; ``progress`` maps job ID -> (done, total)"""
+        lease_until = time.time() + ttl
+        with self._conn() as conn:
+            conn.executemany(
+                "UPDATE jobs SET lease_until = ?, done = ?, total = ? "
+                "WHERE id = ? AND owner = ? AND status = 'running'",
+                [(lease_until, done, total, job_id, owner) for job_id, (done, total) in progress.items()],
+            )
+
+    def finish_job(self, job_id, owner, status, result=None, error=None):
+        """Store the outcome; False when the lease was lost to another replica meanwhile"""
+        with self._conn() as conn:
+            cur = conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished = ?, lease_until = NULL "
+                "WHERE id = ? AND owner = ? AND status = 'running'",
+                (status, result, error, time.time(), job_id, owner),
+            )
+            return cur.rowcount > 0
+
+    def get_job(self, job_id):
+        row = self._conn().execute(f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def jobs_for(self, session_id):
+        rows = self._conn().execute(
+            f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE session_id = ? ORDER BY id", (session_id,)
+        )
+        return [dict(row) for row in rows]
+
+    def delete_job(self, job_id):
+        """Drop a finished job; running and queued jobs are kept"""
+        with self._conn() as conn:
+            conn.execute("DELETE FROM jobs WHERE id = ? AND status IN ('done', 'failed')", (job_id,))
+
+    def trim_jobs(self, before):
+        """Drop finished jobs nobody collected since ``before``"""
+        with self._conn() as conn:
+            conn.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished < ?", (before,))
+
+    def job_counts(self):
+        rows = self._conn().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status")
+        return {status: count for status, count in rows}
+
+    # ----------------------
+    # file index
+    # ----------------------
+    def publish_file(self, key, path, digest, size, meta, owner):
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO files (key, path, digest, size, meta, owner, ts) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, path, digest, size, json.dumps(meta), owner, time.time()),
+            )
+
+    def lookup_file(self, key):
+        row = self._conn().execute(
+            "SELECT path, digest, size, meta, owner FROM files WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {'path': row[0], 'digest': row[1], 'size': row[2], 'meta': json.loads(row[3]), 'owner': row[4]}
+
+    def discard_file(self, key, path):
+        """Forget ``key`` if it still points at ``path`` (a newer publish is kept)"""
+        with self._conn() as conn:
+            conn.execute("DELETE FROM files WHERE key = ? AND path = ?", (key, path))
+
+    # ----------------------
+    # internals
+    # ----------------------
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            # WAL needs shared memory, which processes on different hosts do not have
+            conn.execute("PRAGMA journal_mode=DELETE")
+            self._local.conn = conn
+        return conn
+
+
+def _sqlite_backend(url):
+    # sqlite:///relative/path.db or sqlite:////absolute/path.db, as SQLAlchemy spells them
+    return SQLiteBackend(url.path[1:] or url.netloc)
+
+
+BACKENDS = {
+    "sqlite": _sqlite_backend,
+}
+
+
+def open_backend(url):
+    """Backend for a ``scheme://...`` URL; None (a single replica) for an empty one"""
+    if not url:
+        return None
+    parsed = urlparse(url)
+    if parsed.scheme not in BACKENDS:
+        raise Exception(f"Unknown shared backend '{parsed.scheme}', expected one of {', '.join(BACKENDS)}")
+    return BACKENDS[parsed.scheme](parsed)
+
+
+class LeaseKeeper:
+    """Leases this replica holds, renewed on a background thread until released"""
+
+    def __init__(self, backend, owner=None, ttl=LEASE_TTL):
+        self.backend = backend
+        self.owner = owner or new_owner()
+        self.ttl = ttl
+        self._held = set()
+        # Names a thread of this process is asking the backend for right now
+        self._claiming = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def acquire(self, name, wait=0, poll=0.2):
+        """Take ``name``, waiting up to ``wait`` seconds for its holder; True on success.
+
+        A name another thread of this process holds counts as taken too,
+        so the lease also serializes sessions within one replica.
+        """
+        deadline = time.monotonic() + wait
+        while True:
+            with self._lock:
+                claim = name not in self._held and name not in self._claiming
+                if claim:
+                    self._claiming.add(name)
+            if claim:
+                # The backend is asked outside the lock: one call stuck on a busy
+                # database must not hold up every other thread's leases and renewals
+                acquired = False
+                try:
+                    acquired = self.backend.acquire_lease(name, self.owner, self.ttl)
+                finally:
+                    with self._lock:
+                        self._claiming.discard(name)
+                        if acquired:
+                            self._held.add(name)
+                            if self._thread is None:
+                                self._thread = threading.Thread(target=self._renew, name="lease-renew",
+                                                                daemon=True)
+                                self._thread.start()
+                if acquired:
+                    return True
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(poll)
+
+    def release(self, name):
+        # Deleted before the name is dropped locally: until then no other thread
+        # here can take it again, so this DELETE cannot remove a newer lease
+        try:
+            self.backend.release_lease(name, self.owner)
+        finally:
+            with self._lock:
+                self._held.discard(name)
+
+    @contextlib.contextmanager
+    def hold(self, name, wait=0):
+        """``with keeper.hold(name) as acquired:``; released on exit when acquired"""
+        acquired = self.acquire(name, wait)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                self.release(name)
+
+    def _renew(self):
+        while True:
+            time.sleep(self.ttl / 3)
+            with self._lock:
+                names = list(self._held)
+            if names:
+                try:
+                    self.backend.renew_leases(self.owner, names, self.ttl)
+                except Exception:
+                    # A failed round must not kill the thread; the next one renews with time to spare
+                    pass
@@ -0,0 +1,337 @@
+"""Lifecycle management for files in ``downloads/``.
+
+Every file the app writes is registered here when it is created, so the
+manager knows the directory's contents without listing it. The index is
+held in memory in LRU order, with a heap of expiry times and a queue of
+files waiting for their orphan check, so a sweep only touches the files
+it removes or checks. Changes are appended to a journal on disk (compacted
+when it grows well past the live entries) rather than rewriting the whole
+index. Each sweep removes expired files, evicts least recently used files
+until the total is back under the byte quota, and deletes orphans: files
+past a grace period that no history record references. Only the first
+start without an index walks the directory, to adopt existing files.
+
+Replicas sharing one downloads volume each keep their own index (pass
+``index_name``) and manage only the files they wrote themselves, so the
+quota applies per replica. A file another replica deleted (say, from its
+history page) stays in this index until a sweep finds ``os.stat`` failing:
+each sweep checks a rotating batch of entries, and all of them before it
+evicts anything for the quota, so vanished files never push real ones out.
+"""
+import heapq
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+DEFAULT_MAX_BYTES = 5 * 1024 * 1024 * 1024
+DEFAULT_TTL = 7 * 24 * 3600
+SWEEP_INTERVAL = 60
+# Files younger than this are never evicted or treated as orphans: their
+# job may still be running or waiting for the UI to record it
+GRACE_PERIOD = 3600
+# Directories inside the root that manage their own contents (the download
+# cache evicts by LRU within its byte budget)
+SKIP_DIRS = {".cache"}
+INDEX_NAME = ".storage_index.jsonl"
+# Entries each sweep checks for files that were deleted behind the index's back
+VERIFY_BATCH = 512
+
+
+class StorageManager:
+    """Byte quota, per-file TTL and orphan GC for the downloads directory"""
+
+    def __init__(self, root="downloads", max_bytes=DEFAULT_MAX_BYTES, default_ttl=DEFAULT_TTL,
+                 grace_period=GRACE_PERIOD, referenced=None, index_name=INDEX_NAME, adopt_existing=True):
+        self.root = root
+        self.index_name = index_name
+        # Walk the directory when there is no index yet; off when peers write there too
+        self.adopt_existing = adopt_existing
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.grace_period = grace_period
+        # referenced(paths) -> the subset still used by a history record
+        self.referenced = referenced
+        self._lock = threading.Lock()
+        self._files = OrderedDict()   # path -> {'size', 'created', 'atime', 'expires', 'checked'}
+        self._expiry = []             # heap of (expires, path); stale items are skipped
+        self._unchecked = deque()     # (created, path) awaiting the orphan check
+        self._verify = deque()        # paths left in the current round of existence checks
+        self._bytes = 0
+        self._journal = []
+        self._journal_lines = 0
+        self._evicted = {'expired': 0, 'quota': 0, 'orphan': 0}
+        self._stop = threading.Event()
+        self._thread = None
+        os.makedirs(root, exist_ok=True)
+        self._load()
+
+    # ----------------------
+    # index updates
+    # ----------------------
+    def track(self, path, ttl=None, history=True):
+        """Register a file the app just wrote (or re-register a replaced one).
+
+        Pass ``history=False`` for files no history record will point at
+        (ZIP exports, partial downloads); they only go by TTL and quota.
+        """
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return
+        now = time.time()
+        entry = {
+            'size': size,
+            'created': now,
+            'atime': now,
+            'expires': now + (self.default_ttl if ttl is None else ttl),
+            'checked': not history,
+        }
+        with self._lock:
+            self._apply_locked("add", path, entry)
+            self._journal.append({'op': "add", 'path': path, **entry})
+
+    def touch(self, path):
+        """Mark a file as used: it moves to the back of the LRU and its TTL restarts"""
+        now = time.time()
+        with self._lock:
+            entry = self._files.get(path)
+            if entry is None:
+                return
+            update = {'atime': now, 'expires': now + (entry['expires'] - entry['atime'])}
+            self._apply_locked("touch", path, update)
+            self._journal.append({'op': "touch", 'path': path, **update})
+
+    def forget(self, path):
+        """Drop a file the app deleted itself"""
+        with self._lock:
+            if path in self._files:
+                self._apply_locked("del", path)
+                self._journal.append({'op': "del", 'path': path})
+
+    # ----------------------
+    # sweeping
+    # ----------------------
+    def sweep(self, now=None):
+        """Expire, evict to quota and collect orphans; returns the removed paths"""
+        now = time.time() if now is None else now
+        removed = []
+        with self._lock:
+            batch = self._verify_batch_locked()
+        self._drop_missing(batch)
+        if self._bytes > self.max_bytes:
+            # Only evict for bytes that are really on disk
+            with self._lock:
+                batch = list(self._files.items())
+            self._drop_missing(batch)
+        with self._lock:
+            while self._expiry and self._expiry[0][0] <= now:
+                expires, path = heapq.heappop(self._expiry)
+                entry = self._files.get(path)
+                if entry is not None and entry['expires'] == expires:
+                    removed.append(self._remove_locked(path, 'expired'))
+            # Least recently used first, skipping files still in their grace period
+            if self._bytes > self.max_bytes:
+                for path, entry in list(self._files.items()):
+                    if self._bytes <= self.max_bytes:
+                        break
+                    if now - entry['created'] >= self.grace_period:
+                        removed.append(self._remove_locked(path, 'quota'))
+            candidates = []
+            while (self.referenced is not None and self._unchecked
+                   and now - self._unchecked[0][0] >= self.grace_period):
+                created, path = self._unchecked.popleft()
+                entry = self._files.get(path)
+                if entry is not None and entry['created'] == created and not entry['checked']:
+                    candidates.append(path)
+
+        if self.referenced is not None and candidates:
+            # Each file is checked once; deleting a history row from the UI deletes its file too
+            used = self.referenced(candidates)
+            with self._lock:
+                for path in candidates:
+                    if path not in self._files:
+                        continue
+                    if path in used:
+                        self._apply_locked("check", path)
+                        self._journal.append({'op': "check", 'path': path})
+                    else:
+                        removed.append(self._remove_locked(path, 'orphan'))
+
+        self._save()
+        return removed
+
+    def start(self, interval=SWEEP_INTERVAL):
+        """Run ``sweep`` every ``interval`` seconds on a daemon thread"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, args=(interval,), daemon=True,
+                                        name="storage-sweeper")
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'files': len(self._files),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'evicted': dict(self._evicted),
+            }
+
+    # ----------------------
+    # internals
+    # ----------------------
+    @property
+    def _index_path(self):
+        return os.path.join(self.root, self.index_name)
+
+    def _loop(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.sweep()
+            except Exception:
+                # A failed sweep must not kill the thread; the next one retries
+                pass
+
+    def _apply_locked(self, op, path, data=None):
+        if op == "add":
+            old = self._files.pop(path, None)
+            if old is not None:
+                self._bytes -= old['size']
+            entry = dict(data)
+            self._files[path] = entry
+            self._bytes += entry['size']
+            heapq.heappush(self._expiry, (entry['expires'], path))
+            if not entry['checked']:
+                self._unchecked.append((entry['created'], path))
+        elif op == "touch":
+            entry = self._files.get(path)
+            if entry is not None:
+                entry['atime'] = data['atime']
+                entry['expires'] = data['expires']
+                self._files.move_to_end(path)
+                heapq.heappush(self._expiry, (entry['expires'], path))
+                if len(self._expiry) > 2 * len(self._files) + 1024:
+                    # Drop the stale items touches leave behind
+                    self._expiry = [(e['expires'], p) for p, e in self._files.items()]
+                    heapq.heapify(self._expiry)
+        elif op == "check":
+            entry = self._files.get(path)
+            if entry is not None:
+                entry['checked'] = True
+        elif op == "del":
+            entry = self._files.pop(path, None)
+            if entry is not None:
+                self._bytes -= entry['size']
+
+    def _verify_batch_locked(self):
+        if not self._verify:
+            self._verify.extend(self._files)
+        batch = []
+        while self._verify and len(batch) < VERIFY_BATCH:
+            path = self._verify.popleft()
+            entry = self._files.get(path)
+            if entry is not None:
+                batch.append((path, entry))
+        return batch
+
+    def _drop_missing(self, batch):
+        """Forget entries whose file is gone, e.g. deleted by another replica"""
+        missing = []
+        for path, entry in batch:
+            try:
+                os.stat(path)
+            except FileNotFoundError:
+                missing.append((path, entry))
+            except OSError:
+                continue
+        if not missing:
+            return
+        with self._lock:
+            for path, entry in missing:
+                # Skip paths re-tracked while we were checking
+                if self._files.get(path) is entry:
+                    self._apply_locked("del", path)
+                    self._journal.append({'op': "del", 'path': path})
+
+    def _remove_locked(self, path, reason):
+        self._apply_locked("del", path)
+        self._journal.append({'op': "del", 'path': path})
+        self._evicted[reason] += 1
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        return path
+
+    def _load(self):
+        try:
+            with open(self._index_path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Torn last line after a crash
+                        continue
+                    op, path = record.pop('op'), record.pop('path')
+                    self._apply_locked(op, path, record)
+                    self._journal_lines += 1
+        except FileNotFoundError:
+            if self.adopt_existing:
+                self._adopt_existing()
+
+    def _adopt_existing(self):
+        """One-time walk of a directory that has no index yet"""
+        now = time.time()
+        found = []
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            if dirpath == self.root:
+                dirnames[:] = [d for d in dirnames if d not in SKIP_DIRS]
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                if name.startswith(INDEX_NAME):
+                    continue
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                found.append((path, {
+                    'size': stat.st_size,
+                    'created': stat.st_mtime,
+                    'atime': stat.st_mtime,
+                    'expires': max(stat.st_mtime + self.default_ttl, now + self.grace_period),
+                    'checked': False,
+                }))
+        for path, entry in sorted(found, key=lambda item: item[1]['atime']):
+            self._apply_locked("add", path, entry)
+            self._journal.append({'op': "add", 'path': path, **entry})
+
+    def _save(self):
+        with self._lock:
+            if self._journal_lines + len(self._journal) > 2 * len(self._files) + 1024:
+                # Journal mostly describes files that are gone: rewrite it from the live index
+                lines = [{'op': "add", 'path': path, **entry} for path, entry in self._files.items()]
+                self._journal = []
+                compact = True
+            else:
+                lines, self._journal = self._journal, []
+                compact = False
+            if not lines and not compact:
+                return
+            payload = "".join(json.dumps(line) + "\n" for line in lines)
+            self._journal_lines = len(lines) if compact else self._journal_lines + len(lines)
+            if compact:
+                tmp = self._index_path + ".tmp"
+                with open(tmp, "w") as f:
+                    f.write(payload)
+                os.replace(tmp, self._index_path)
+            else:
+                with open(self._index_path, "a") as f:
+                    f.write(payload)